@@ -17,7 +17,7 @@ from .loghandler import _logger
 from .process import Process, shortname
 from .resolver import ga4gh_tool_registries
 from .software_requirements import SOFTWARE_REQUIREMENTS_ENABLED
-from .utils import DEFAULT_TMP_PREFIX
+from .utils import DEFAULT_TMP_PREFIX, parse_size
 
 
 class _env_var_table(Table):
@@ -71,6 +71,11 @@ def arg_parser() -> argparse.ArgumentParser:
         f"[link=https://cwl-utils.readthedocs.io/en/latest/#cwl-docker-extract]"
         f"cwl-docker-extract[/] from cwl-utils",
     )
+    env_table.add_env(
+        "CWL_SINGULARITY_CACHE_MAX_SIZE",
+        f"maximum total size of the images in [{bt}]CWL_SINGULARITY_CACHE[/] "
+        f"(e.g. [{bt}]20G[/]); least recently used images are evicted beyond it",
+    )
     env_table.add_env(
         "ORCID",
         f"user [link=https://orcid.org/]ORCID identifier[/] to record as part of [{owh}]--provenance[/]",
@@ -134,6 +139,22 @@ def arg_parser() -> argparse.ArgumentParser:
         help="Maximum number of jobs to run in parallel. "
         "Specify '0' to match the number of CPU cores available.",
     )
+    parser.add_argument(
+        "--enable-streaming",
+        action="store_true",
+        default=False,
+        help="Connect a step to the one step consuming its standard output "
+        "through a named pipe, when both ends are marked `streamable`.",
+        dest="streaming_allowed",
+    )
+    parser.add_argument(
+        "--compact-path-mapper",
+        action="store_true",
+        default=False,
+        help="Store the paths of staged files compactly, for inputs with "
+        "very large directory listings.",
+        dest="compact_path_mapper",
+    )
     parser.add_argument(
         "--skip-schemas",
         action="store_true",
@@ -360,6 +381,80 @@ def arg_parser() -> argparse.ArgumentParser:
         "recomputing steps. Can be very helpful in the development and "
         "troubleshooting of CWL documents.",
     )
+    files_group.add_argument(
+        "--cache-max-size",
+        type=parse_size,
+        default=None,
+        help="Remove the least recently used jobs from the --cachedir when it "
+        "grows beyond this size, in bytes or with a K, M, G or T suffix.",
+    )
+    files_group.add_argument(
+        "--cache-deduplicate",
+        action="store_true",
+        default=False,
+        help="Store the identical output files of the jobs in the --cachedir once, "
+        "hardlinked into the directory of each job.",
+    )
+    files_group.add_argument(
+        "--cache-check",
+        choices=("none", "size", "checksum"),
+        default="none",
+        help="Check the outputs of the jobs found in the --cachedir against the sizes, "
+        "or also the checksums, recorded when they were cached; damaged jobs are run "
+        "again. Default: none.",
+    )
+    files_group.add_argument(
+        "--cache-url",
+        type=str,
+        default=None,
+        help="Share the jobs of the --cachedir with other nodes through an object "
+        "store: a file:// directory, or an http(s):// prefix answering GET, PUT "
+        "and DELETE requests.",
+    )
+    files_group.add_argument(
+        "--cache-subworkflows",
+        action="store_true",
+        default=False,
+        help="Also cache the outputs of ExpressionTools and of whole subworkflow "
+        "invocations in the --cachedir, so that a cached subworkflow is not expanded "
+        "into its steps.",
+    )
+    files_group.add_argument(
+        "--cache-plan",
+        action="store_true",
+        default=False,
+        help="Report which jobs would be found in the --cachedir, and how many would "
+        "run, without running any; then exit.",
+        dest="print_cache_plan",
+    )
+    files_group.add_argument(
+        "--cache-stats",
+        action="store_true",
+        default=False,
+        help="Print statistics on the jobs in the --cachedir and exit.",
+    )
+    files_group.add_argument(
+        "--cache-gc",
+        action="store_true",
+        default=False,
+        help="Remove the incomplete jobs from the --cachedir, then the least recently "
+        "used ones if it is larger than --cache-max-size, and exit.",
+    )
+    files_group.add_argument(
+        "--cache-verify",
+        action="store_true",
+        default=False,
+        help="Check all the jobs of the --cachedir against the checksums recorded "
+        "when they were cached, or only the sizes with --cache-check size; remove the "
+        "damaged ones and exit.",
+    )
+    files_group.add_argument(
+        "--prefetch-downloads",
+        action="store_true",
+        default=False,
+        help="Start downloading all the http(s) input files in parallel at startup, "
+        "instead of one by one as each step is reached.",
+    )
 
     tmpgroup = files_group.add_mutually_exclusive_group()
     tmpgroup.add_argument(
@@ -404,6 +499,13 @@ def arg_parser() -> argparse.ArgumentParser:
         "delete intermediate output directories.",
         dest="move_outputs",
     )
+    files_group.add_argument(
+        "--relocate-early",
+        action="store_true",
+        default=False,
+        help="Copy the outputs of the workflow into the output directory as soon as "
+        "their step completes, when relocating them would copy them anyway.",
+    )
 
     provgroup = parser.add_argument_group("provenance recording")
     provgroup.add_argument(
@@ -569,6 +671,15 @@ def arg_parser() -> argparse.ArgumentParser:
         help="Pull latest software container image even if it is locally present",
         dest="force_docker_pull",
     )
+    container_group.add_argument(
+        "--prefetch-images",
+        action="store_true",
+        default=False,
+        help="Retrieve all the distinct software container images named in "
+        "the workflow in parallel at startup, instead of one by one as each "
+        "step is reached.",
+        dest="prefetch_images",
+    )
     container_group.add_argument(
         "--no-read-only",
         action="store_true",
@@ -745,6 +856,24 @@ def arg_parser() -> argparse.ArgumentParser:
         help="Do not compute checksum of contents while collecting outputs",
         dest="compute_checksum",
     )
+    parser.add_argument(
+        "--checksum-cache",
+        action="store_true",
+        default=False,
+        help="Remember the checksums of large files across runs, in the --cachedir "
+        "if given, or else in the user cache directory. A checksum is used again "
+        "while the file keeps the same inode, size and timestamps.",
+        dest="checksum_cache",
+    )
+    parser.add_argument(
+        "--lazy-checksum",
+        action="store_true",
+        default=False,
+        help="Only compute the checksums of final outputs, cache keys, and of the "
+        "inputs of processes whose expressions mention checksum, instead of the "
+        "outputs of every step. Ignored with --provenance.",
+        dest="lazy_checksum",
+    )
 
     jsgroup = parser.add_argument_group(title="javascript options")
     jsgroup.add_argument(
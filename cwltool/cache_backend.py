@@ -0,0 +1,436 @@
+"""Where the outputs of the jobs run with --cachedir are kept, to be reused."""
+
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import urllib.parse
+from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, Any
+
+import requests
+from cwl_utils.types import CWLFileType, CWLObjectType
+from schema_salad.ref_resolver import uri_file_path
+
+from .errors import WorkflowException
+from .job_cache import JobCache
+from .loghandler import _logger
+from .utils import shared_file_lock, try_shared_file_lock, upgrade_lock, visit_files
+
+_CHUNK_SIZE = 1024 * 1024
+
+#: Jobs uploaded to an object store concurrently, in the background of the run.
+MAX_UPLOAD_WORKERS = 2
+
+# the jobs of --cachedir directories being computed under a lease of this process
+_leased: set[str] = set()
+_leased_lock = threading.Lock()
+
+
+class CacheEntry:
+    """A job found by :py:meth:`CacheBackend.lookup`."""
+
+    def __init__(self, key: str, handle: Any = None, tool: str = "") -> None:
+        """Describe the job cached under ``key``; ``handle`` is private to the backend."""
+        self.key = key
+        self.handle = handle
+        self.tool = tool
+
+
+class CacheLease:
+    """The claim to compute a job, from :py:meth:`CacheBackend.lease`."""
+
+    def __init__(self, key: str, outdir: str, handle: Any = None) -> None:
+        """Claim the job of ``key``, to be run in ``outdir``."""
+        self.key = key
+        self.outdir = outdir
+        self.handle = handle
+
+
+class CacheBackend(metaclass=ABCMeta):
+    """
+    Keep the outputs of jobs by cache key.
+
+    A job is either found with :py:meth:`lookup`, and its outputs used from
+    :py:meth:`fetch` until :py:meth:`release`; or claimed with
+    :py:meth:`lease`, run in the directory of the lease, and its outputs
+    handed back with :py:meth:`publish`.
+    """
+
+    @abstractmethod
+    def lookup(self, key: str, wait: bool = True) -> CacheEntry | None:
+        """
+        Find the outputs of a successful job cached under ``key``.
+
+        :param wait: Whether to wait for a job being computed, rather than not find it.
+        """
+
+    @abstractmethod
+    def fetch(self, entry: CacheEntry) -> str:
+        """Return a local directory with the cached outputs of a job."""
+
+    @abstractmethod
+    def release(self, entry: CacheEntry) -> None:
+        """Stop using the cached outputs of a job."""
+
+    @abstractmethod
+    def lease(self, key: str) -> CacheLease:
+        """Claim the computation of the job of ``key``, waiting for other claims."""
+
+    @abstractmethod
+    def publish(
+        self, lease: CacheLease, tool: str, status: str, outputs: CWLObjectType | None = None
+    ) -> None:
+        """End a lease, caching the ``outputs`` of the job if its ``status`` is ``success``."""
+
+    def leased(self, key: str) -> bool:
+        """
+        Whether the job of ``key`` is being computed under a lease of this process.
+
+        Its outputs are only published once the job is run, so it must not be
+        waited for while jobs are generated.
+        """
+        return False
+
+    def verify(self, entry: CacheEntry, checksums: bool = False) -> bool:
+        """
+        Check that the cached outputs of a job were not changed since they were cached.
+
+        :param checksums: Also compare the contents of the files with their checksums.
+        :returns: Whether the outputs are intact, as assumed by default.
+        """
+        return True
+
+    @abstractmethod
+    def evict(self, key: str) -> bool:
+        """
+        Remove the job cached under ``key``, unless it is in use.
+
+        :returns: Whether the job was removed.
+        """
+
+    def flush(self) -> None:
+        """Write out what was deferred until the end of the run."""
+
+
+class DirectoryCacheBackend(CacheBackend):
+    """
+    Keep the outputs of each job in a ``<key>`` directory of a local cache directory.
+
+    The status of the job is written to ``<key>.status``, which is locked
+    shared while the outputs are used, and exclusive while they are written.
+    Jobs are indexed by a :py:class:`cwltool.job_cache.JobCache`.
+    """
+
+    def __init__(
+        self, cachedir: str, max_size: int | None = None, deduplicate: bool = False
+    ) -> None:
+        """Cache jobs in ``cachedir``, evicting them beyond ``max_size`` bytes."""
+        self.cachedir = cachedir
+        self.index = JobCache(cachedir, max_size, deduplicate)
+
+    def lookup(self, key: str, wait: bool = True) -> CacheEntry | None:
+        jobcache = os.path.join(self.cachedir, key)
+        if not os.path.isdir(jobcache):
+            return None
+        # Opens the file for read/write, or creates an empty file.
+        jobcachelock = open(f"{jobcache}.status", "a+")
+        # get the shared lock to ensure no other process is trying
+        # to write to this cache
+        if wait:
+            shared_file_lock(jobcachelock)
+        elif not try_shared_file_lock(jobcachelock):
+            jobcachelock.close()
+            return None
+        jobcachelock.seek(0)
+        if os.path.isdir(jobcache) and jobcachelock.read() == "success":
+            self.index.hit(key)
+            return CacheEntry(key, jobcachelock)
+        jobcachelock.close()
+        return None
+
+    def fetch(self, entry: CacheEntry) -> str:
+        return os.path.join(self.cachedir, entry.key)
+
+    def release(self, entry: CacheEntry) -> None:
+        entry.handle.close()
+
+    def lease(self, key: str) -> CacheLease:
+        jobcache = os.path.join(self.cachedir, key)
+        jobcachelock = open(f"{jobcache}.status", "a+")
+        # take the exclusive lock since we'll be writing the cache directory
+        upgrade_lock(jobcachelock)
+        with _leased_lock:
+            _leased.add(os.path.abspath(jobcache))
+        shutil.rmtree(jobcache, True)
+        os.makedirs(jobcache)
+        return CacheLease(key, jobcache, jobcachelock)
+
+    def publish(
+        self, lease: CacheLease, tool: str, status: str, outputs: CWLObjectType | None = None
+    ) -> None:
+        jobcachelock: IO[str] = lease.handle
+        if status == "success":
+            checksums: dict[str, str] = {}
+
+            def _checksum(fileobj: CWLFileType) -> None:
+                if "checksum" in fileobj and fileobj["location"].startswith("file://"):
+                    checksums[uri_file_path(fileobj["location"])] = fileobj["checksum"]
+
+            visit_files(outputs, _checksum)
+            # still under the exclusive lock, as deduplication replaces files
+            self.index.add(lease.key, tool, checksums)
+        # save status to the lockfile then release the lock
+        jobcachelock.seek(0)
+        jobcachelock.truncate()
+        jobcachelock.write(status)
+        jobcachelock.close()
+        with _leased_lock:
+            _leased.discard(os.path.abspath(lease.outdir))
+
+    def leased(self, key: str) -> bool:
+        with _leased_lock:
+            return os.path.abspath(os.path.join(self.cachedir, key)) in _leased
+
+    def verify(self, entry: CacheEntry, checksums: bool = False) -> bool:
+        return self.index.verify(entry.key, checksums)
+
+    def evict(self, key: str) -> bool:
+        return self.index.remove(key)
+
+    def flush(self) -> None:
+        self.index.flush()
+
+
+class ObjectStore(metaclass=ABCMeta):
+    """A flat store of named objects, such as a bucket."""
+
+    @abstractmethod
+    def get(self, name: str, stream: IO[bytes]) -> bool:
+        """
+        Write the contents of an object to ``stream``.
+
+        :returns: Whether the object exists.
+        """
+
+    @abstractmethod
+    def put(self, name: str, stream: IO[bytes]) -> None:
+        """Store the contents of ``stream`` as an object, replacing any other."""
+
+    @abstractmethod
+    def delete(self, name: str) -> None:
+        """Remove an object, if it exists."""
+
+
+class LocalObjectStore(ObjectStore):
+    """An object store in a directory, as on a filesystem mounted by all nodes."""
+
+    def __init__(self, root: str) -> None:
+        """Store the objects as files in ``root``."""
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def get(self, name: str, stream: IO[bytes]) -> bool:
+        try:
+            with open(os.path.join(self.root, name), "rb") as f:
+                shutil.copyfileobj(f, stream, _CHUNK_SIZE)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def put(self, name: str, stream: IO[bytes]) -> None:
+        with tempfile.NamedTemporaryFile(dir=self.root, prefix=f".{name}.", delete=False) as f:
+            try:
+                shutil.copyfileobj(stream, f, _CHUNK_SIZE)
+            except BaseException:
+                os.unlink(f.name)
+                raise
+        os.replace(f.name, os.path.join(self.root, name))
+
+    def delete(self, name: str) -> None:
+        try:
+            os.unlink(os.path.join(self.root, name))
+        except FileNotFoundError:
+            pass
+
+
+class HTTPObjectStore(ObjectStore):
+    """An object store answering GET, PUT and DELETE requests under a base URL."""
+
+    def __init__(self, base_url: str, session: requests.Session | None = None) -> None:
+        """Store the objects under ``base_url``."""
+        self.base_url = base_url.rstrip("/") + "/"
+        self.session = session or requests.Session()
+
+    def _url(self, name: str) -> str:
+        return urllib.parse.urljoin(self.base_url, urllib.parse.quote(name))
+
+    def get(self, name: str, stream: IO[bytes]) -> bool:
+        with self.session.get(self._url(name), stream=True) as response:
+            if response.status_code == 404:
+                return False
+            response.raise_for_status()
+            for chunk in response.iter_content(_CHUNK_SIZE):
+                stream.write(chunk)
+        return True
+
+    def put(self, name: str, stream: IO[bytes]) -> None:
+        self.session.put(self._url(name), data=stream).raise_for_status()
+
+    def delete(self, name: str) -> None:
+        response = self.session.delete(self._url(name))
+        if response.status_code != 404:
+            response.raise_for_status()
+
+
+def object_store(url: str) -> ObjectStore:
+    """Return the object store at a ``file://``, ``http://`` or ``https://`` URL."""
+    scheme = urllib.parse.urlsplit(url).scheme
+    if scheme == "file":
+        return LocalObjectStore(uri_file_path(url))
+    if scheme in ("http", "https"):
+        return HTTPObjectStore(url)
+    raise ValueError(f"Unsupported cache URL {url!r}, must be file, http or https")
+
+
+class ObjectStoreCacheBackend(CacheBackend):
+    """
+    Share the outputs of jobs between nodes through an object store.
+
+    The outputs of each job are kept as a ``<key>.tar`` archive, published
+    before its ``<key>.json`` marker. Jobs are run and used from a local
+    :py:class:`DirectoryCacheBackend`, into which cached jobs are fetched.
+    Leases are local: different nodes may compute the same job, and the
+    last one to publish it wins.
+
+    Jobs are uploaded in the background, from their local copy held with a
+    shared lock, so that the workflow does not wait for them;
+    :py:meth:`flush` waits for the uploads.
+    """
+
+    def __init__(
+        self,
+        store: ObjectStore,
+        cachedir: str,
+        max_size: int | None = None,
+        deduplicate: bool = False,
+    ) -> None:
+        """Share the jobs through ``store``, with local copies in ``cachedir``."""
+        self.store = store
+        self.local = DirectoryCacheBackend(cachedir, max_size, deduplicate)
+        self._uploads: ThreadPoolExecutor | None = None
+        self._uploads_lock = threading.Lock()
+
+    def lookup(self, key: str, wait: bool = True) -> CacheEntry | None:
+        local = self.local.lookup(key, wait)
+        if local is not None:
+            return CacheEntry(key, local)
+        if not wait and self.local.leased(key):
+            # would be fetched under the lease
+            return None
+        marker = io.BytesIO()
+        try:
+            found = self.store.get(f"{key}.json", marker)
+        except (OSError, requests.RequestException) as err:
+            _logger.warning("Could not look up cached job %s: %s", key, err)
+            return None
+        if not found:
+            return None
+        published = json.loads(marker.getvalue())
+        if published.get("status") != "success":
+            return None
+        return CacheEntry(key, None, published.get("tool", ""))
+
+    def fetch(self, entry: CacheEntry) -> str:
+        if entry.handle is None:
+            lease = self.local.lease(entry.key)
+            status = "permanentFail"
+            try:
+                with tempfile.TemporaryFile() as archive:
+                    if not self.store.get(f"{entry.key}.tar", archive):
+                        raise WorkflowException(f"Cached job {entry.key} has no outputs")
+                    archive.seek(0)
+                    with tarfile.open(fileobj=archive) as tar:
+                        if hasattr(tarfile, "tar_filter"):
+                            tar.extractall(lease.outdir, filter="tar")  # nosec
+                        else:
+                            tar.extractall(lease.outdir)  # nosec
+                status = "success"
+            except (OSError, tarfile.TarError, requests.RequestException) as err:
+                raise WorkflowException(f"Could not fetch cached job {entry.key}: {err}") from err
+            finally:
+                self.local.publish(lease, entry.tool, status)
+            entry.handle = self.local.lookup(entry.key)
+            if entry.handle is None:
+                raise WorkflowException(f"Cached job {entry.key} was evicted while fetched")
+        return self.local.fetch(entry.handle)
+
+    def release(self, entry: CacheEntry) -> None:
+        if entry.handle is not None:
+            self.local.release(entry.handle)
+
+    def lease(self, key: str) -> CacheLease:
+        return self.local.lease(key)
+
+    def publish(
+        self, lease: CacheLease, tool: str, status: str, outputs: CWLObjectType | None = None
+    ) -> None:
+        self.local.publish(lease, tool, status, outputs)
+        if status == "success":
+            with self._uploads_lock:
+                if self._uploads is None:
+                    self._uploads = ThreadPoolExecutor(
+                        max_workers=MAX_UPLOAD_WORKERS, thread_name_prefix="cwltool-upload"
+                    )
+                self._uploads.submit(self._upload, lease.key, tool)
+
+    def _upload(self, key: str, tool: str) -> None:
+        jobcache = os.path.join(self.local.cachedir, key)
+        try:
+            with open(f"{jobcache}.status", "a+") as jobcachelock:
+                # not a use of the job, so not a lookup
+                shared_file_lock(jobcachelock)
+                jobcachelock.seek(0)
+                if jobcachelock.read() != "success" or not os.path.isdir(jobcache):
+                    # evicted, or replaced by a failed job
+                    return
+                with tempfile.TemporaryFile() as archive:
+                    with tarfile.open(fileobj=archive, mode="w") as tar:
+                        tar.add(jobcache, arcname=".")
+                    archive.seek(0)
+                    self.store.put(f"{key}.tar", archive)
+                self.store.put(
+                    f"{key}.json",
+                    io.BytesIO(json.dumps({"status": "success", "tool": tool}).encode("utf-8")),
+                )
+        except (OSError, tarfile.TarError, requests.RequestException) as err:
+            _logger.warning("Could not share cached job %s: %s", key, err)
+
+    def leased(self, key: str) -> bool:
+        return self.local.leased(key)
+
+    def verify(self, entry: CacheEntry, checksums: bool = False) -> bool:
+        # the outputs are checked once fetched
+        self.fetch(entry)
+        return self.local.verify(entry.handle, checksums)
+
+    def evict(self, key: str) -> bool:
+        if not self.local.evict(key):
+            return False
+        try:
+            self.store.delete(f"{key}.json")
+            self.store.delete(f"{key}.tar")
+        except (OSError, requests.RequestException) as err:
+            _logger.warning("Could not evict shared cached job %s: %s", key, err)
+        return True
+
+    def flush(self) -> None:
+        with self._uploads_lock:
+            uploads, self._uploads = self._uploads, None
+        if uploads is not None:
+            uploads.shutdown(wait=True)
+        self.local.flush()
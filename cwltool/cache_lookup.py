@@ -0,0 +1,101 @@
+"""Look up the jobs of a scatter in the --cachedir ahead of their generation, many at a time."""
+
+import functools
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, Any, NamedTuple, Optional, cast
+
+from cwl_utils.types import CWLDirectoryType, CWLFileType, CWLObjectType
+
+from .cache_backend import CacheEntry
+from .context import RuntimeContext
+from .utils import SharedThreadPool
+
+if TYPE_CHECKING:
+    from .builder import Builder
+    from .workflow import WorkflowStep
+
+#: Upper bound on the number of threads looking up jobs; a lookup mostly waits
+#: on the filesystem or the object store, so this does not follow the CPUs.
+MAX_LOOKUP_WORKERS = 8
+
+#: Number of jobs of a scatter looked up ahead of the one being generated.
+LOOKAHEAD = 64
+
+#: The fields of Files and Directories set when they are staged.
+STAGED_FIELDS = ("path", "basename", "dirname", "nameroot", "nameext")
+
+_pool = SharedThreadPool(MAX_LOOKUP_WORKERS, "cwltool-lookup")
+
+
+class CacheLookup(NamedTuple):
+    """The cache key of a job, and what the cache holds for it."""
+
+    builder: "Builder"
+    """The Builder the key was computed with, its inputs staged under ``/stage``."""
+    key: str
+    entry: CacheEntry | None
+    """The cached job, or None on a miss."""
+    unstaged: list[tuple[CWLFileType | CWLDirectoryType, dict[str, Any]]]
+    """The :py:data:`STAGED_FIELDS` of the inputs before they were staged."""
+
+    def unstage(self) -> None:
+        """Undo the staging of the inputs under ``/stage``, for the Builder to run the job."""
+        # objects visited twice were first seen unstaged
+        for file_o, fields in reversed(self.unstaged):
+            staged = cast(dict[str, Any], file_o)
+            for field in STAGED_FIELDS:
+                staged.pop(field, None)
+            staged.update(fields)
+
+
+class ScatterLookups:
+    """
+    The cache lookups of the jobs of a scattered CommandLineTool step.
+
+    Each job looks up the :py:data:`LOOKAHEAD` following ones as it is
+    generated, so that their keys are computed and found in the cache while
+    the earlier jobs run.
+    """
+
+    def __init__(self, step: "WorkflowStep", runtimeContext: RuntimeContext) -> None:
+        """Look up the jobs of ``step``."""
+        self.step = step
+        self.runtimeContext = runtimeContext
+        self.job_orders: list[CWLObjectType] = []
+        self.lookups: list[Optional["Future[CacheLookup | None]"]] = []
+
+    def add(self, job_order: CWLObjectType) -> RuntimeContext:
+        """Return the context of the job of ``job_order``, looked up with the others."""
+        runtimeContext = self.runtimeContext.copy()
+        runtimeContext.cache_lookup = functools.partial(self.result, len(self.job_orders))
+        self.job_orders.append(job_order)
+        return runtimeContext
+
+    def result(self, index: int) -> CacheLookup | None:
+        """Return the lookup of a job, and start those of the following ones."""
+        pool = _pool.get()
+        ahead = min(len(self.job_orders), index + 1 + LOOKAHEAD)
+        while len(self.lookups) < ahead:
+            self.lookups.append(
+                pool.submit(
+                    self.step.cache_lookup,
+                    self.job_orders[len(self.lookups)],
+                    self.runtimeContext,
+                )
+            )
+        lookup = self.lookups[index]
+        self.lookups[index] = None
+        if lookup is None:
+            raise ValueError(f"The lookup of job {index} was already used.")
+        return lookup.result()
+
+    def close(self) -> None:
+        """Release the cached jobs looked up ahead but not used, as when the scatter stops early."""
+        cache_backend = self.runtimeContext.get_cache_backend()
+        for index, lookup in enumerate(self.lookups):
+            self.lookups[index] = None
+            if lookup is None or lookup.cancel() or lookup.exception() is not None:
+                continue
+            result = lookup.result()
+            if result is not None and result.entry is not None:
+                cache_backend.release(result.entry)
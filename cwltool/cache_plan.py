@@ -0,0 +1,84 @@
+"""Plan which jobs of a run would be found in the --cachedir, without running any."""
+
+import threading
+from collections.abc import Mapping, MutableSequence
+from typing import Any, NamedTuple
+
+from cwl_utils.types import CWLObjectType
+
+PENDING = "cwltool:pending"
+"""Marks the outputs of a job that would run, unknown until it does."""
+
+
+def pending() -> CWLObjectType:
+    """Return a value standing for an output not computed yet."""
+    return {PENDING: True}
+
+
+def is_pending(value: Any) -> bool:
+    """Whether a value depends on an output not computed yet."""
+    if isinstance(value, Mapping):
+        return PENDING in value or any(is_pending(v) for v in value.values())
+    if isinstance(value, MutableSequence):
+        return any(is_pending(v) for v in value)
+    return False
+
+
+class PlannedJob(NamedTuple):
+    """A job of the plan, and whether it would be found in the cache."""
+
+    name: str
+    tool: str
+    status: str
+    """``hit``, ``miss``, ``repeat`` for a miss computed by an earlier job of
+    the plan, ``uncached`` when its tool disables reuse, or ``pending`` when
+    its inputs are the outputs of jobs that would run."""
+    key: str | None = None
+    cores: float = 0
+    ram: float = 0
+
+
+class CachePlan:
+    """The jobs planned by :py:class:`cwltool.executors.CachePlanExecutor`."""
+
+    def __init__(self) -> None:
+        """Start an empty plan."""
+        self.jobs: list[PlannedJob] = []
+        self._misses: set[str | None] = set()
+        self._lock = threading.Lock()
+
+    def add(
+        self,
+        name: str,
+        tool: str,
+        status: str,
+        key: str | None = None,
+        resources: Mapping[str, Any] | None = None,
+    ) -> None:
+        """Plan a job, or a step whose jobs cannot be known yet."""
+        resources = resources or {}
+        with self._lock:
+            if status == "miss" and key in self._misses:
+                status = "repeat"
+            elif status == "miss":
+                self._misses.add(key)
+            self.jobs.append(
+                PlannedJob(
+                    name, tool, status, key, resources.get("cores", 0), resources.get("ram", 0)
+                )
+            )
+
+    def report(self) -> CWLObjectType:
+        """Return the number of jobs of each status, the resources of those to run, and the jobs."""
+        report: CWLObjectType = {
+            status: sum(job.status == status for job in self.jobs)
+            for status in ("hit", "miss", "repeat", "uncached", "pending")
+        }
+        run = [job for job in self.jobs if job.status in ("miss", "uncached")]
+        report["cores"] = sum(job.cores for job in run)
+        report["ram"] = sum(job.ram for job in run)
+        report["jobs"] = [
+            {field: value for field, value in job._asdict().items() if value is not None}
+            for job in self.jobs
+        ]
+        return report
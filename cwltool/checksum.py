@@ -0,0 +1,228 @@
+"""Compute the checksums of files, many of them at a time."""
+
+import hashlib
+import mmap
+import os
+import sqlite3
+import time
+from collections.abc import Iterable, Mapping, MutableSequence
+from typing import IO, Any
+
+from cwl_utils.types import CWLFileType
+from schema_salad.ref_resolver import uri_file_path
+
+from .loghandler import _logger
+from .stdfsaccess import StdFsAccess
+from .utils import SharedThreadPool, ThreadLocalConnection
+
+#: Upper bound on the number of threads hashing or statting files; reading
+#: more files at once than there are CPUs rarely makes hashing faster.
+MAX_CHECKSUM_WORKERS = min(8, os.cpu_count() or 1)
+
+#: Size of the reads used to hash files.
+BUFFER_SIZE = 4 * 1024 * 1024
+
+#: Files at least this large are hashed through a memory map.
+MMAP_THRESHOLD = 64 * 1024 * 1024
+
+#: Number of files statted by each worker of :py:func:`stat_files`.
+STAT_BATCH_SIZE = 256
+
+_pool = SharedThreadPool(MAX_CHECKSUM_WORKERS, "cwltool-checksum")
+
+
+class ChecksumDatabase:
+    """
+    A persistent record of the checksums of files, shared between cwltool processes.
+
+    A checksum is keyed by the device and inode of its file, and only used
+    while the file keeps the same size, modification time and change time.
+    It is only recorded if the file did not change while it was hashed, and
+    was last changed long enough ago that a later change can not go
+    unnoticed within the resolution of the file timestamps. Files smaller
+    than ``min_size`` are cheaper to hash again, and are not recorded.
+
+    The database uses a rollback journal rather than a write-ahead log, whose
+    shared memory index does not work across the hosts of a network
+    filesystem, so it can live in a cache directory on shared scratch. A
+    database that is locked or unavailable is skipped: files are hashed again.
+    """
+
+    #: Files changed more recently than this are not recorded.
+    RACY_INTERVAL_NS = 2_000_000_000
+
+    def __init__(self, path: str, min_size: int = 1024 * 1024) -> None:
+        """Use, or create, the database at ``path``."""
+        self.path = path
+        self.min_size = min_size
+        self.hits = 0
+        self._connection = ThreadLocalConnection(path)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        try:
+            with self._connect() as connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS checksums (device INTEGER, inode INTEGER, "
+                    "size INTEGER, mtime_ns INTEGER, ctime_ns INTEGER, checksum TEXT, "
+                    "PRIMARY KEY (device, inode))"
+                )
+        except sqlite3.Error as err:
+            _logger.debug("Checksum database %s unavailable: %s", self.path, err)
+
+    def _connect(self) -> sqlite3.Connection:
+        return self._connection.get()
+
+    def lookup(self, st: os.stat_result) -> str | None:
+        """Return the checksum recorded for a file in the given state, if any."""
+        if st.st_size < self.min_size:
+            return None
+        try:
+            row = (
+                self._connect()
+                .execute(
+                    "SELECT checksum FROM checksums WHERE device = ? AND inode = ? "
+                    "AND size = ? AND mtime_ns = ? AND ctime_ns = ?",
+                    (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns),
+                )
+                .fetchone()
+            )
+        except sqlite3.Error as err:
+            _logger.debug("Checksum database %s unavailable: %s", self.path, err)
+            return None
+        if row is None:
+            return None
+        self.hits += 1
+        return str(row[0])
+
+    def record(self, before: os.stat_result, after: os.stat_result, checksum: str) -> None:
+        """Record the checksum of a file, given its state before and after hashing it."""
+        state = (before.st_size, before.st_mtime_ns, before.st_ctime_ns)
+        if (
+            before.st_size < self.min_size
+            or (before.st_dev, before.st_ino) != (after.st_dev, after.st_ino)
+            or state != (after.st_size, after.st_mtime_ns, after.st_ctime_ns)
+            or time.time_ns() - max(state[1:]) < self.RACY_INTERVAL_NS
+        ):
+            return
+        try:
+            with self._connect() as connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO checksums VALUES (?, ?, ?, ?, ?, ?)",
+                    (before.st_dev, before.st_ino, *state, checksum),
+                )
+        except sqlite3.Error as err:
+            _logger.debug("Checksum database %s unavailable: %s", self.path, err)
+
+
+_database: ChecksumDatabase | None = None
+
+
+def use_database(path: str | None) -> None:
+    """Keep the checksums of files in the database at ``path``, or stop if None."""
+    global _database
+    _database = ChecksumDatabase(path) if path else None
+
+
+def checksum_stream(stream: IO[bytes]) -> str:
+    """Return the SHA-1 checksum of the rest of a binary stream, as ``sha1$<hex>``."""
+    checksum = hashlib.sha1()  # nosec
+    try:
+        fileno = stream.fileno()
+        size = os.fstat(fileno).st_size
+    except (AttributeError, OSError, ValueError):
+        size = 0
+    if size >= MMAP_THRESHOLD and stream.tell() == 0:
+        with mmap.mmap(fileno, 0, access=mmap.ACCESS_READ) as mapped:
+            checksum.update(mapped)
+    elif hasattr(stream, "readinto"):
+        view = memoryview(bytearray(BUFFER_SIZE))
+        while read := stream.readinto(view):
+            checksum.update(view[:read])
+    else:
+        while contents := stream.read(BUFFER_SIZE):
+            checksum.update(contents)
+    return "sha1$%s" % checksum.hexdigest()
+
+
+def checksum_file(fs_access: StdFsAccess, fileobj: CWLFileType) -> None:
+    """Compute a SHA1 checksum for the given file and store it as an attribute."""
+    if "checksum" in fileobj:
+        return
+    if "contents" in fileobj:
+        contents = fileobj["contents"].encode("utf-8")
+        fileobj["size"] = len(contents)
+        fileobj["checksum"] = "sha1$%s" % hashlib.sha1(contents).hexdigest()  # nosec
+        return
+    location = fileobj["location"]
+    database = _database
+    if database is not None and location.startswith("file://"):
+        path = uri_file_path(location)
+        before = os.stat(path)
+        checksum = database.lookup(before)
+        if checksum is None:
+            with open(path, "rb") as f:
+                checksum = checksum_stream(f)
+            database.record(before, os.stat(path), checksum)
+        fileobj["size"] = before.st_size
+        fileobj["checksum"] = checksum
+        return
+    with fs_access.open(location, "rb") as f:
+        checksum = checksum_stream(f)
+    fileobj["size"] = fs_access.size(location)
+    fileobj["checksum"] = checksum
+
+
+def mentions_checksum(doc: Any) -> bool:
+    """Tell if a string of the document, such as an expression, mentions ``checksum``."""
+    if isinstance(doc, str):
+        return "checksum" in doc
+    if isinstance(doc, Mapping):
+        return any(mentions_checksum(value) for value in doc.values())
+    if isinstance(doc, MutableSequence):
+        return any(mentions_checksum(value) for value in doc)
+    return False
+
+
+def stat_files(paths: Iterable[str]) -> dict[str, os.stat_result]:
+    """Return the status of the given files, statting large batches concurrently."""
+    unique = list(dict.fromkeys(paths))
+    if len(unique) < STAT_BATCH_SIZE or MAX_CHECKSUM_WORKERS == 1:
+        return {path: os.stat(path) for path in unique}
+    batches = [unique[i : i + STAT_BATCH_SIZE] for i in range(0, len(unique), STAT_BATCH_SIZE)]
+    stats: dict[str, os.stat_result] = {}
+    for batch, batch_stats in zip(batches, _pool.get().map(_stat_batch, batches)):
+        stats.update(zip(batch, batch_stats))
+    return stats
+
+
+def _stat_batch(paths: list[str]) -> list[os.stat_result]:
+    return [os.stat(path) for path in paths]
+
+
+def checksum_files(fs_access: StdFsAccess, fileobjs: Iterable[CWLFileType]) -> None:
+    """
+    Compute the checksums of the given files that do not have one, concurrently.
+
+    Files sharing a location are read once.
+    """
+    by_location: dict[str, list[CWLFileType]] = {}
+    for fileobj in fileobjs:
+        if "checksum" in fileobj:
+            continue
+        if "contents" in fileobj:
+            checksum_file(fs_access, fileobj)
+        else:
+            by_location.setdefault(fileobj["location"], []).append(fileobj)
+    groups = list(by_location.values())
+
+    def _checksum(same: list[CWLFileType]) -> None:
+        checksum_file(fs_access, same[0])
+        for other in same[1:]:
+            other["size"] = same[0]["size"]
+            other["checksum"] = same[0]["checksum"]
+
+    if len(groups) <= 1 or MAX_CHECKSUM_WORKERS == 1:
+        for same in groups:
+            _checksum(same)
+    else:
+        for _done in _pool.get().map(_checksum, groups):
+            pass
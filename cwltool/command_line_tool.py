@@ -16,7 +16,7 @@ from collections.abc import Generator, Mapping, MutableMapping, MutableSequence
 from enum import Enum
 from functools import cmp_to_key, partial
 from re import Pattern
-from typing import TYPE_CHECKING, Any, Optional, TextIO, Union, cast
+from typing import TYPE_CHECKING, Any, Optional, Union, cast
 
 from cwl_utils.types import (
     CWLDirectoryType,
@@ -42,22 +42,21 @@ from .builder import (
     content_limit_respected_read_bytes,
     substitute,
 )
+from .cache_backend import CacheLease
+from .cache_lookup import STAGED_FIELDS, CacheLookup
+from .cache_plan import pending
+from .checksum import checksum_files, stat_files
 from .context import LoadingContext, RuntimeContext, getdefault
 from .docker import DockerCommandLineJob, PodmanCommandLineJob
 from .errors import UnsupportedRequirement, WorkflowException
 from .flatten import flatten
 from .job import CommandLineJob, JobBase
 from .loghandler import _logger
+from .memo import lookup_outputs, memo_key, memoizing_callback
 from .mpi import MPIRequirementName
 from .mutation import MutationManager
 from .pathmapper import PathMapper
-from .process import (
-    Process,
-    _logger_validation_warnings,
-    compute_checksums,
-    shortname,
-    uniquename,
-)
+from .process import Process, _logger_validation_warnings, shortname, uniquename
 from .singularity import SingularityCommandLineJob
 from .stdfsaccess import StdFsAccess
 from .udocker import UDockerCommandLineJob
@@ -73,9 +72,7 @@ from .utils import (
     get_listing,
     normalizeFilesDirs,
     random_outdir,
-    shared_file_lock,
     trim_listing,
-    upgrade_lock,
     visit_files,
     visit_files_directories,
 )
@@ -194,6 +191,33 @@ class ExpressionJob:
                 self.output_callback({}, "permanentFail")
 
 
+class CachedOutputsJob:
+    """
+    Job handing back outputs known without running a process.
+
+    They are memoised, see :py:mod:`cwltool.memo`, or pending in a
+    :py:class:`cwltool.cache_plan.CachePlan`.
+    """
+
+    def __init__(
+        self, name: str, outputs: CWLObjectType, output_callback: OutputCallbackType | None
+    ) -> None:
+        """Initialize this CachedOutputsJob."""
+        self.name = name
+        self.outputs = outputs
+        self.output_callback = output_callback
+        self.outdir: str | None = None
+        self.prov_obj: ProvenanceProfile | None = None
+
+    def run(
+        self,
+        runtimeContext: RuntimeContext,
+        tmpdir_lock: Union[threading.Lock, None] = None,
+    ) -> None:
+        if self.output_callback:
+            self.output_callback(self.outputs, "success")
+
+
 @mypyc_attr(allow_interpreted_subclasses=True)
 class ExpressionTool(Process):
     def job(
@@ -201,9 +225,28 @@ class ExpressionTool(Process):
         job_order: CWLObjectType,
         output_callbacks: OutputCallbackType | None,
         runtimeContext: RuntimeContext,
-    ) -> Generator[ExpressionJob, None, None]:
+    ) -> Generator[ExpressionJob | CachedOutputsJob, None, None]:
         builder = self._init_job(job_order, runtimeContext)
 
+        workReuse, _ = self.get_requirement("WorkReuse")
+        enableReuse = workReuse.get("enableReuse", True) if workReuse else True
+        if runtimeContext.cachedir and runtimeContext.cache_subworkflows and enableReuse:
+            cachekey = memo_key(self, builder.job, {"runtime": builder.resources})
+            if cachekey is not None:
+                jobname = runtimeContext.name or shortname(self.tool.get("id", "expression"))
+                cache_backend = runtimeContext.get_cache_backend()
+                outputs = lookup_outputs(
+                    cache_backend, cachekey, runtimeContext.cache_check == "checksum"
+                )
+                if outputs is not None:
+                    _logger.info("[job %s] Using cached output of %s", jobname, cachekey)
+                    yield CachedOutputsJob(jobname, outputs, output_callbacks)
+                    return
+                if runtimeContext.cache_plan is None:
+                    output_callbacks = memoizing_callback(
+                        cache_backend, cachekey, self.tool.get("id", ""), output_callbacks
+                    )
+
         job = ExpressionJob(
             builder,
             self.tool["expression"],
@@ -306,6 +349,49 @@ def revmap_file(
 
 
 @mypyc_attr(serializable=True)
+def cache_key_files(
+    files: MutableSequence[CWLFileType | CWLDirectoryType],
+    pathmapper: PathMapper,
+    basedir: str,
+    fs_access: StdFsAccess | None = None,
+) -> dict[str, MutableSequence[str | int] | CWLObjectType]:
+    """
+    Describe the input Files of a job for its cache key.
+
+    Each File mapped by ``pathmapper`` is keyed by its path, relative to
+    ``basedir`` when inside it, and described by its size and either the
+    checksum recorded in ``files`` or its modification time.
+
+    :param fs_access: Compute the checksums of the Files with none recorded
+        through it, rather than use their modification time.
+    """
+    checksums: dict[str, str] = {}
+    for e in files:
+        if "location" in e and is_file(e) and "checksum" in e and e["checksum"] != "sha1$hash":
+            checksums.setdefault(e["location"], e["checksum"])
+    mapped = [(location, fobj) for location, fobj in pathmapper.items() if fobj.type == "File"]
+    if fs_access is not None:
+        unknown: dict[str, CWLFileType] = {
+            location: {"class": "File", "location": file_uri(fobj.resolved)}
+            for location, fobj in mapped
+            if location not in checksums
+        }
+        checksum_files(fs_access, unknown.values())
+        for location, fileobj in unknown.items():
+            checksums[location] = fileobj["checksum"]
+    stats = stat_files(fobj.resolved for _location, fobj in mapped)
+    keys: dict[str, MutableSequence[str | int] | CWLObjectType] = {}
+    for location, fobj in mapped:
+        fobj_stat = stats[fobj.resolved]
+        path = fobj.resolved.removeprefix(basedir + "/")
+        checksum = checksums.get(location)
+        if checksum is not None:
+            keys[path] = [fobj_stat.st_size, checksum]
+        else:
+            keys[path] = [fobj_stat.st_size, int(fobj_stat.st_mtime * 1000)]
+    return keys
+
+
 class CallbackJob:
     """Callback Job class, used by :py:func:`CommandLineTool.job`."""
 
@@ -334,7 +420,7 @@ class CallbackJob:
                     self.job.tool["outputs"],
                     self.cachebuilder,
                     self.outdir,
-                    getdefault(runtimeContext.compute_checksum, True),
+                    self.job.output_checksums(runtimeContext),
                 ),
                 "success",
             )
@@ -371,6 +457,38 @@ def check_adjust(
     return file_o
 
 
+def copy_cached_writable(
+    cachedir: str, tmpdir: str, file_o: CWLFileType | CWLDirectoryType
+) -> None:
+    """
+    Point a writable input updated in place at a copy of it, if it is a cached output.
+
+    Cached outputs may be shared with other cached jobs (see
+    :py:class:`cwltool.job_cache.JobCache`), so they are never updated in place.
+    """
+    location = file_o["location"]
+    if not location.startswith("file://"):
+        return
+    path = os.path.realpath(uri_file_path(location))
+    cachedir = os.path.realpath(cachedir)
+    if os.path.commonpath([path, cachedir]) != cachedir:
+        return
+    copy = os.path.join(tmpdir, os.path.basename(path))
+    _logger.debug("Updating a copy of the cached %s in place", path)
+    if os.path.isdir(path):
+        shutil.copytree(path, copy)
+
+        def _relocate(entry: CWLFileType | CWLDirectoryType) -> None:
+            entry_path = os.path.realpath(uri_file_path(entry["location"]))
+            if entry_path.startswith(path + os.sep):
+                entry["location"] = file_uri(copy + entry_path[len(path) :])
+
+        visit_files_directories(file_o.get("listing", []), _relocate)
+    else:
+        shutil.copy2(path, copy)
+    file_o["location"] = file_uri(copy)
+
+
 def check_valid_locations(fs_access: StdFsAccess, ob: CWLObjectType) -> None:
     location = cast(str, ob["location"])
     if location.startswith("_:"):
@@ -840,170 +958,228 @@ class CommandLineTool(Process):
                 partial(check_adjust, self.path_check_mode.value, builder),
             )
 
-    def job(
-        self,
-        job_order: CWLObjectType,
-        output_callbacks: OutputCallbackType,
-        runtimeContext: RuntimeContext,
-    ) -> Generator[JobBase | CallbackJob, None, None]:
+    def pending_job(self, jobname: str, output_callbacks: OutputCallbackType) -> CachedOutputsJob:
+        """Return a job handing back pending outputs, as planned by --cache-plan."""
+        outputs: CWLObjectType = {shortname(port["id"]): pending() for port in self.tool["outputs"]}
+        return CachedOutputsJob(jobname, outputs, output_callbacks)
+
+    def cache_lookup(
+        self, job_order: CWLObjectType, runtimeContext: RuntimeContext
+    ) -> CacheLookup | None:
+        """
+        Compute the cache key of a job, and look it up in the --cachedir.
+
+        :returns: The lookup, or None if the outputs of the tool are not cached.
+        """
         workReuse, _ = self.get_requirement("WorkReuse")
         enableReuse = workReuse.get("enableReuse", True) if workReuse else True
+        if not runtimeContext.cachedir or not enableReuse:
+            return None
+        cacheKey: CWLObjectType = (
+            self.get_requirement("http://commonwl.org/cwltool#CacheKey")[0] or {}
+        )
+        excludeArguments = set(cast(list[str], cacheKey.get("excludeArguments") or []))
+        excludeEnvVars = set(cast(list[str], cacheKey.get("excludeEnvVars") or []))
+
+        cachecontext = runtimeContext.copy()
+        cachecontext.outdir = "/out"
+        cachecontext.tmpdir = "/tmp"  # nosec
+        cachecontext.stagedir = "/stage"
+        cachebuilder = self._init_job(job_order, cachecontext)
+        cachebuilder.pathmapper = self.make_path_mapper(
+            cachebuilder.files,
+            cachebuilder.stagedir,
+            runtimeContext,
+            separateDirs=False,
+        )
+        # the paths the inputs had before being staged under /stage
+        unstaged: list[tuple[CWLFileType | CWLDirectoryType, dict[str, Any]]] = []
+
+        def _check_adjust(
+            file_o: CWLFileType | CWLDirectoryType,
+        ) -> CWLFileType | CWLDirectoryType:
+            fields = cast(dict[str, Any], file_o)
+            unstaged.append((file_o, {k: fields[k] for k in STAGED_FIELDS if k in fields}))
+            return check_adjust(self.path_check_mode.value, cachebuilder, file_o)
+
+        visit_files_directories(
+            [cachebuilder.files, cachebuilder.bindings],
+            _check_adjust,
+        )
+        fileobjs: list[CWLFileType] = []
+        visit_files([cachebuilder.files, cachebuilder.bindings], fileobjs.append)
+        fs_access = runtimeContext.make_fs_access(runtimeContext.basedir)
+        checksum_files(fs_access, fileobjs)
+        self._initialworkdir(None, cachebuilder)  # test the initial working directory
+
+        cmdline = flatten(
+            [
+                cachebuilder.generate_arg(binding)
+                for binding in cachebuilder.bindings
+                if binding.get("prefix") not in excludeArguments
+            ]
+        )
+        docker_req, _ = self.get_requirement("DockerRequirement")
+        if docker_req is not None and runtimeContext.use_container:
+            dockerimg = docker_req.get("dockerImageId") or docker_req.get("dockerPull")
+        elif runtimeContext.default_container is not None and runtimeContext.use_container:
+            dockerimg = runtimeContext.default_container
+        else:
+            dockerimg = None
 
-        jobname = uniquename(runtimeContext.name or shortname(self.tool.get("id", "job")))
-        if runtimeContext.cachedir and enableReuse:
-            cachecontext = runtimeContext.copy()
-            cachecontext.outdir = "/out"
-            cachecontext.tmpdir = "/tmp"  # nosec
-            cachecontext.stagedir = "/stage"
-            cachebuilder = self._init_job(job_order, cachecontext)
-            cachebuilder.pathmapper = self.make_path_mapper(
+        if dockerimg is not None:
+            cmdline = ["docker", "run", dockerimg] + cmdline
+            # not really run using docker, just for hashing purposes
+
+        keydict: dict[str, MutableSequence[str | int] | CWLObjectType] = {"cmdline": cmdline}
+
+        for shortcut in ["stdin", "stdout", "stderr"]:
+            if shortcut in self.tool:
+                keydict[shortcut] = self.tool[shortcut]
+
+        keydict.update(
+            cache_key_files(
                 cachebuilder.files,
-                cachebuilder.stagedir,
-                runtimeContext,
-                separateDirs=False,
-            )
-            _check_adjust = partial(check_adjust, self.path_check_mode.value, cachebuilder)
-            _checksum = partial(
-                compute_checksums,
-                runtimeContext.make_fs_access(runtimeContext.basedir),
+                cachebuilder.pathmapper,
+                runtimeContext.basedir,
+                fs_access if cacheKey.get("useChecksums") else None,
             )
-            visit_files_directories(
-                [cachebuilder.files, cachebuilder.bindings],
-                _check_adjust,
-            )
-            visit_files([cachebuilder.files, cachebuilder.bindings], _checksum)
-            self._initialworkdir(None, cachebuilder)  # test the initial working directory
+        )
 
-            cmdline = flatten(list(map(cachebuilder.generate_arg, cachebuilder.bindings)))
+        interesting = {
+            "DockerRequirement",
+            "EnvVarRequirement",
+            "InitialWorkDirRequirement",
+            "ShellCommandRequirement",
+            "NetworkAccess",
+        }
+        for rh in (self.original_requirements, self.original_hints):
+            for r in reversed(rh):
+                cls = cast(str, r["class"])
+                if cls in interesting and cls not in keydict:
+                    keydict[cls] = r
+
+        # If there are environmental variables to preserve, add it to the key
+        env_var_requirement = cast(dict[str, str], keydict.get("EnvVarRequirement", {}))
+        env_def = dict(self.get_requirement("EnvVarRequirement")[0] or {})
+        if runtimeContext.preserve_environment is not None:
+            env_def.update(JobBase.extract_environment(runtimeContext, env_var_requirement))
+        if excludeEnvVars:
+            env_def = {name: value for name, value in env_def.items() if name not in excludeEnvVars}
+            if "envDef" in env_def:
+                env_def["envDef"] = [
+                    env
+                    for env in cast(list[CWLObjectType], env_def["envDef"])
+                    if env["envName"] not in excludeEnvVars
+                ]
+
+        if env_def:
+            keydict["EnvVarRequirement"] = env_def
+        keydictstr = json_dumps(keydict, separators=(",", ":"), sort_keys=True)
+        cachekey = hashlib.md5(keydictstr.encode("utf-8")).hexdigest()  # nosec
+
+        _logger.debug(
+            "[job %s] keydictstr is %s -> %s",
+            runtimeContext.name or shortname(self.tool.get("id", "job")),
+            keydictstr,
+            cachekey,
+        )
+
+        cache_backend = runtimeContext.get_cache_backend()
+        return CacheLookup(
+            cachebuilder, cachekey, cache_backend.lookup(cachekey, wait=False), unstaged
+        )
+
+    def job(
+        self,
+        job_order: CWLObjectType,
+        output_callbacks: OutputCallbackType,
+        runtimeContext: RuntimeContext,
+    ) -> Generator[JobBase | CallbackJob | CachedOutputsJob | None, None, None]:
+        jobname = uniquename(runtimeContext.name or shortname(self.tool.get("id", "job")))
+        builder: Builder | None = None
+        if runtimeContext.cache_lookup is not None:
+            # looked up ahead, with the other jobs of a scatter
+            lookup = runtimeContext.cache_lookup()
+        else:
+            lookup = self.cache_lookup(job_order, runtimeContext)
+        if lookup is not None:
+            cachebuilder, cachekey, entry = lookup.builder, lookup.key, lookup.entry
+            cache_backend = runtimeContext.get_cache_backend()
+            if entry is None and runtimeContext.cache_plan is None:
+                # wait for an earlier job of this run computing the same outputs,
+                # then for other processes
+                while cache_backend.leased(cachekey):
+                    yield None
+                entry = cache_backend.lookup(cachekey)
+            if (
+                entry is not None
+                and runtimeContext.cache_check != "none"
+                and not cache_backend.verify(entry, runtimeContext.cache_check == "checksum")
+            ):
+                # damaged: computed again under a lease, which replaces it
+                _logger.warning("[job %s] Not using damaged cached output %s", jobname, cachekey)
+                cache_backend.release(entry)
+                entry = None
             docker_req, _ = self.get_requirement("DockerRequirement")
-            if docker_req is not None and runtimeContext.use_container:
-                dockerimg = docker_req.get("dockerImageId") or docker_req.get("dockerPull")
-            elif runtimeContext.default_container is not None and runtimeContext.use_container:
-                dockerimg = runtimeContext.default_container
-            else:
-                dockerimg = None
-
-            if dockerimg is not None:
-                cmdline = ["docker", "run", dockerimg] + cmdline
-                # not really run using docker, just for hashing purposes
-
-            keydict: dict[str, MutableSequence[str | int] | CWLObjectType] = {"cmdline": cmdline}
-
-            for shortcut in ["stdin", "stdout", "stderr"]:
-                if shortcut in self.tool:
-                    keydict[shortcut] = self.tool[shortcut]
-
-            def calc_checksum(location: str) -> str | None:
-                for e in cachebuilder.files:
-                    if (
-                        "location" in e
-                        and e["location"] == location
-                        and is_file(e)
-                        and "checksum" in e
-                        and e["checksum"] != "sha1$hash"
-                    ):
-                        return e["checksum"]
-                return None
-
-            def remove_prefix(s: str, prefix: str) -> str:
-                return s.removeprefix(prefix)
-
-            for location, fobj in cachebuilder.pathmapper.items():
-                if fobj.type == "File":
-                    checksum = calc_checksum(location)
-                    fobj_stat = os.stat(fobj.resolved)
-                    path = remove_prefix(fobj.resolved, runtimeContext.basedir + "/")
-                    if checksum is not None:
-                        keydict[path] = [fobj_stat.st_size, checksum]
+
+            if entry is not None:
+                try:
+                    jobcache = cache_backend.fetch(entry)
+                    if docker_req and runtimeContext.use_container:
+                        cachebuilder.outdir = runtimeContext.docker_outdir or random_outdir()
                     else:
-                        keydict[path] = [
-                            fobj_stat.st_size,
-                            int(fobj_stat.st_mtime * 1000),
-                        ]
-
-            interesting = {
-                "DockerRequirement",
-                "EnvVarRequirement",
-                "InitialWorkDirRequirement",
-                "ShellCommandRequirement",
-                "NetworkAccess",
-            }
-            for rh in (self.original_requirements, self.original_hints):
-                for r in reversed(rh):
-                    cls = cast(str, r["class"])
-                    if cls in interesting and cls not in keydict:
-                        keydict[cls] = r
-
-            # If there are environmental variables to preserve, add it to the key
-            env_var_requirement = cast(dict[str, str], keydict.get("EnvVarRequirement", {}))
-            env_def = self.get_requirement("EnvVarRequirement")[0] or {}
-            if runtimeContext.preserve_environment is not None:
-                env_def.update(JobBase.extract_environment(runtimeContext, env_var_requirement))
-
-            if env_def:
-                keydict["EnvVarRequirement"] = env_def
-            keydictstr = json_dumps(keydict, separators=(",", ":"), sort_keys=True)
-            cachekey = hashlib.md5(keydictstr.encode("utf-8")).hexdigest()  # nosec
-
-            _logger.debug("[job %s] keydictstr is %s -> %s", jobname, keydictstr, cachekey)
-
-            jobcache = os.path.join(runtimeContext.cachedir, cachekey)
-
-            # Create a lockfile to manage cache status.
-            jobcachepending = f"{jobcache}.status"
-            jobcachelock = None
-            jobstatus = None
-
-            # Opens the file for read/write, or creates an empty file.
-            jobcachelock = open(jobcachepending, "a+")
-
-            # get the shared lock to ensure no other process is trying
-            # to write to this cache
-            shared_file_lock(jobcachelock)
-            jobcachelock.seek(0)
-            jobstatus = jobcachelock.read()
-
-            if os.path.isdir(jobcache) and jobstatus == "success":
-                if docker_req and runtimeContext.use_container:
-                    cachebuilder.outdir = runtimeContext.docker_outdir or random_outdir()
-                else:
-                    cachebuilder.outdir = jobcache
+                        cachebuilder.outdir = jobcache
 
-                _logger.info("[job %s] Using cached output in %s", jobname, jobcache)
-                yield CallbackJob(self, output_callbacks, cachebuilder, jobcache)
-                # we're done with the cache so release lock
-                jobcachelock.close()
+                    _logger.info("[job %s] Using cached output in %s", jobname, jobcache)
+                    if runtimeContext.cache_plan is not None:
+                        runtimeContext.cache_plan.add(
+                            jobname, self.tool["id"], "hit", cachekey, cachebuilder.resources
+                        )
+                    yield CallbackJob(self, output_callbacks, cachebuilder, jobcache)
+                finally:
+                    # we're done with the cache so release it, also if the job is abandoned
+                    cache_backend.release(entry)
+                return
+            elif runtimeContext.cache_plan is not None:
+                runtimeContext.cache_plan.add(
+                    jobname, self.tool["id"], "miss", cachekey, cachebuilder.resources
+                )
+                yield self.pending_job(jobname, output_callbacks)
                 return
             else:
-                _logger.info("[job %s] Output of job will be cached in %s", jobname, jobcache)
-
-                # turn shared lock into an exclusive lock since we'll
-                # be writing the cache directory
-                upgrade_lock(jobcachelock)
-
-                shutil.rmtree(jobcache, True)
-                os.makedirs(jobcache)
+                lease = cache_backend.lease(cachekey)
+                _logger.info("[job %s] Output of job will be cached in %s", jobname, lease.outdir)
                 runtimeContext = runtimeContext.copy()
-                runtimeContext.outdir = jobcache
+                runtimeContext.outdir = lease.outdir
+                # the job runs with the builder that computed its key, moved to
+                # the directories of the real run
+                builder = cachebuilder
+                builder.outdir, builder.tmpdir, builder.stagedir = self._builder_dirs(
+                    runtimeContext, builder.fs_access
+                )
+                lookup.unstage()
 
                 def update_status_output_callback(
                     output_callbacks: OutputCallbackType,
-                    jobcachelock: TextIO,
+                    lease: CacheLease,
                     outputs: CWLObjectType | None,
                     processStatus: str,
                 ) -> None:
-                    # save status to the lockfile then release the lock
-                    jobcachelock.seek(0)
-                    jobcachelock.truncate()
-                    jobcachelock.write(processStatus)
-                    jobcachelock.close()
+                    cache_backend.publish(lease, self.tool.get("id", ""), processStatus, outputs)
                     output_callbacks(outputs, processStatus)
 
-                output_callbacks = partial(
-                    update_status_output_callback, output_callbacks, jobcachelock
-                )
+                output_callbacks = partial(update_status_output_callback, output_callbacks, lease)
 
-        builder = self._init_job(job_order, runtimeContext)
+        if builder is None:
+            builder = self._init_job(job_order, runtimeContext)
+
+        if runtimeContext.cache_plan is not None:
+            runtimeContext.cache_plan.add(
+                jobname, self.tool["id"], "uncached", resources=builder.resources
+            )
+            yield self.pending_job(jobname, output_callbacks)
+            return
 
         reffiles = copy.deepcopy(builder.files)
 
@@ -1113,6 +1289,12 @@ class CommandLineTool(Process):
         if inplaceUpdateReq is not None:
             j.inplace_update = cast(bool, inplaceUpdateReq["inplaceUpdate"])
         normalizeFilesDirs(j.generatefiles)
+        if j.inplace_update and runtimeContext.cachedir:
+            for li in j.generatefiles["listing"]:
+                if li.get("writable"):
+                    copy_cached_writable(
+                        runtimeContext.cachedir, runtimeContext.create_tmpdir(), li
+                    )
 
         readers: dict[str, CWLFileType | CWLDirectoryType] = {}
         muts: set[str] = set()
@@ -1214,7 +1396,7 @@ class CommandLineTool(Process):
             self.collect_output_ports,
             self.tool["outputs"],
             builder,
-            compute_checksum=getdefault(runtimeContext.compute_checksum, True),
+            compute_checksum=self.output_checksums(runtimeContext),
             jobname=jobname,
             readers=readers,
         )
@@ -1238,6 +1420,16 @@ class CommandLineTool(Process):
             j.mpi_procs = np
         yield j
 
+    def output_checksums(self, runtimeContext: RuntimeContext) -> bool:
+        """Tell if the checksums of the outputs are computed as they are collected."""
+        if not getdefault(runtimeContext.compute_checksum, True):
+            return False
+        return (
+            not runtimeContext.lazy_checksum
+            or runtimeContext.research_obj is not None
+            or self.reads_checksums
+        )
+
     def collect_output_ports(
         self,
         ports: CommentedSeq | set[CWLObjectType],
@@ -1308,7 +1500,9 @@ class CommandLineTool(Process):
                 )
 
                 if compute_checksum:
-                    adjustFileObjs(ret, partial(compute_checksums, fs_access))
+                    fileobjs: list[CWLFileType] = []
+                    visit_files(ret, fileobjs.append)
+                    checksum_files(fs_access, fileobjs)
             validate_ex(
                 expected_schema,
                 ret,
@@ -1414,6 +1608,7 @@ class CommandLineTool(Process):
                             _logger.error("Unexpected error from fs_access", exc_info=True)
                             raise
 
+                to_checksum: list[tuple[CWLFileType, CWLFileType]] = []
                 for files in r:
                     rfile = files.copy()
                     revmap(rfile)
@@ -1428,14 +1623,14 @@ class CommandLineTool(Process):
                                     content_limit_respected_read_bytes(f), "utf-8"
                                 )
                         if compute_checksum:
-                            with fs_access.open(rfile["location"], "rb") as f:
-                                checksum = hashlib.sha1()  # nosec
-                                contents = f.read(1024 * 1024)
-                                while contents != b"":
-                                    checksum.update(contents)
-                                    contents = f.read(1024 * 1024)
-                                files["checksum"] = "sha1$%s" % checksum.hexdigest()
+                            to_checksum.append(
+                                (files, {"class": "File", "location": rfile["location"]})
+                            )
                         files["size"] = fs_access.size(rfile["location"])
+                # hash the files found together, reading each one once
+                checksum_files(fs_access, (located for _files, located in to_checksum))
+                for files, located in to_checksum:
+                    files["checksum"] = located["checksum"]
 
             optional = False
             single = False
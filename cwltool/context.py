@@ -5,7 +5,7 @@ import os
 import shutil
 import tempfile
 import threading
-from collections.abc import Callable, Iterable
+from collections.abc import Callable, Iterable, Mapping
 from typing import IO, TYPE_CHECKING, Any, Literal, Optional, TextIO, Union
 
 from cwl_utils.types import CWLObjectType
@@ -14,6 +14,7 @@ from schema_salad.avro.schema import Names
 from schema_salad.ref_resolver import Loader
 from schema_salad.utils import FetcherCallableType
 
+from .cache_backend import CacheBackend, DirectoryCacheBackend
 from .mpi import MpiConfig
 from .pathmapper import PathMapper
 from .stdfsaccess import StdFsAccess
@@ -24,10 +25,13 @@ if TYPE_CHECKING:
     from schema_salad.runtime import LoadingOptions
 
     from .builder import Builder
+    from .cache_lookup import CacheLookup
+    from .cache_plan import CachePlan
     from .cwlprov.provenance_profile import ProvenanceProfile
     from .cwlprov.ro import ResearchObject
     from .mutation import MutationManager
     from .process import Process
+    from .relocate import EarlyRelocator
     from .secrets import SecretStore
     from .software_requirements import DependenciesConfiguration
     from .workflow_job import WorkflowJobStep
@@ -141,6 +145,8 @@ class RuntimeContext(ContextBase):
         self.preserve_entire_environment: bool = False
         self.use_container: bool = True
         self.force_docker_pull: bool = False
+        self.prefetch_images: bool = False
+        self.prefetch_downloads: bool = False
 
         self.rm_tmpdir: bool = True
         self.pull_image: bool = True
@@ -156,14 +162,22 @@ class RuntimeContext(ContextBase):
         self.podman: bool = False
         self.debug: bool = False
         self.compute_checksum: bool = True
+        self.lazy_checksum: bool = False
         self.name: str = ""
         self.default_container: str | None = ""
         self.find_default_container: Callable[[HasReqsHints], str | None] | None = None
         self.cachedir: str | None = None
+        self.cache_backend: CacheBackend | None = None
+        self.cache_subworkflows: bool = False
+        self.cache_check: Literal["none"] | Literal["size"] | Literal["checksum"] = "none"
+        self.cache_plan: Optional["CachePlan"] = None
+        self.cache_lookup: Callable[[], Optional["CacheLookup"]] | None = None
         self.part_of: str = ""
         self.basedir: str = ""
         self.toplevel: bool = False
         self.mutation_manager: Optional["MutationManager"] = None
+        self.relocate_early: bool = False
+        self.early_relocator: Optional["EarlyRelocator"] = None
         self.make_fs_access = StdFsAccess
         self.path_mapper = PathMapper
         self.builder: Optional["Builder"] = None
@@ -173,6 +187,8 @@ class RuntimeContext(ContextBase):
         self.js_console: bool = False
         self.job_script_provider: DependenciesConfiguration | None = None
         self.select_resources: select_resources_callable | None = None
+        # whether the executor can ever allocate the given resources to a job
+        self.can_allocate: Callable[[Mapping[str, Union[int, float]]], bool] | None = None
         self.eval_timeout: float = 60
         self.postScatterEval: Callable[[CWLObjectType], CWLObjectType | None] | None = None
         self.on_error: Literal["stop"] | Literal["continue"] = "stop"
@@ -221,6 +237,12 @@ class RuntimeContext(ContextBase):
         tmp_dir, tmp_prefix = os.path.split(self.tmpdir_prefix)
         return tempfile.mkdtemp(prefix=tmp_prefix, dir=tmp_dir)
 
+    def get_cache_backend(self) -> CacheBackend:
+        """Return :py:attr:`cache_backend` or set it to one for :py:attr:`cachedir`."""
+        if self.cache_backend is None:
+            self.cache_backend = DirectoryCacheBackend(str(self.cachedir))
+        return self.cache_backend
+
     def create_tmpdir(self) -> str:
         """Create a temporary directory that respects :py:attr:`tmpdir_prefix`."""
         tmp_dir, tmp_prefix = os.path.split(self.tmpdir_prefix)
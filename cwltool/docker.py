@@ -20,7 +20,7 @@ from .builder import Builder
 from .context import RuntimeContext
 from .docker_id import docker_vm_id
 from .errors import WorkflowException
-from .job import ContainerCommandLineJob
+from .job import ContainerCommandLineJob, image_lock
 from .loghandler import _logger
 from .pathmapper import MapperEnt, PathMapper
 from .utils import create_tmp_dir, ensure_writable
@@ -78,52 +78,42 @@ def _check_docker_machine_path(path: str | None) -> None:
         )
 
 
-class DockerCommandLineJob(ContainerCommandLineJob):
-    """Runs a :py:class:`~cwltool.job.CommandLineJob` in a software container using the Docker engine."""
-
-    def __init__(
-        self,
-        builder: Builder,
-        joborder: CWLObjectType,
-        make_path_mapper: Callable[
-            [MutableSequence[CWLFileType | CWLDirectoryType], str, RuntimeContext, bool], PathMapper
-        ],
-        requirements: list[CWLObjectType],
-        hints: list[CWLObjectType],
-        name: str,
-    ) -> None:
-        """Initialize a command line builder using the Docker software container engine."""
-        super().__init__(builder, joborder, make_path_mapper, requirements, hints, name)
-        self.docker_exec = "docker"
+def get_image(
+    docker_exec: str,
+    docker_requirement: dict[str, str],
+    pull_image: bool,
+    force_pull: bool,
+    tmp_outdir_prefix: str,
+) -> bool:
+    """
+    Retrieve the Docker container image described by a DockerRequirement.
 
-    def get_image(
-        self,
-        docker_requirement: dict[str, str],
-        pull_image: bool,
-        force_pull: bool,
-        tmp_outdir_prefix: str,
-    ) -> bool:
-        """
-        Retrieve the relevant Docker container image.
+    Used by :py:meth:`DockerCommandLineJob.get_image` and by the image
+    pre-fetch stage in :py:mod:`cwltool.prefetch`.
 
-        :returns: True upon success
-        """
-        found = False
+    :returns: True upon success
+    """
+    lock = image_lock(docker_requirement)
+    if "dockerImageId" not in docker_requirement and "dockerPull" in docker_requirement:
+        docker_requirement["dockerImageId"] = docker_requirement["dockerPull"]
 
-        if "dockerImageId" not in docker_requirement and "dockerPull" in docker_requirement:
-            docker_requirement["dockerImageId"] = docker_requirement["dockerPull"]
+    image_id = docker_requirement["dockerImageId"]
+    with _IMAGES_LOCK:
+        if image_id in _IMAGES:
+            return True
 
+    with lock:
         with _IMAGES_LOCK:
-            if docker_requirement["dockerImageId"] in _IMAGES:
+            # Another job may have retrieved the image while we were waiting
+            if image_id in _IMAGES:
                 return True
+        found = False
 
         if (docker_image_id := docker_requirement.get("dockerImageId")) is not None:
             try:
                 manifest = json.loads(
                     str(
-                        subprocess.check_output(
-                            [self.docker_exec, "inspect", docker_image_id]
-                        ),  # nosec
+                        subprocess.check_output([docker_exec, "inspect", docker_image_id]),  # nosec
                         "utf-8",
                     )
                 )
@@ -137,7 +127,7 @@ class DockerCommandLineJob(ContainerCommandLineJob):
             with open(os.path.join(dockerfile_dir, "Dockerfile"), "w") as dfile:
                 dfile.write(docker_requirement["dockerFile"])
             cmd = [
-                self.docker_exec,
+                docker_exec,
                 "build",
                 "--tag=%s" % str(docker_requirement["dockerImageId"]),
                 dockerfile_dir,
@@ -148,12 +138,12 @@ class DockerCommandLineJob(ContainerCommandLineJob):
 
         if (force_pull or not found) and pull_image:
             if "dockerPull" in docker_requirement:
-                cmd = [self.docker_exec, "pull", str(docker_requirement["dockerPull"])]
+                cmd = [docker_exec, "pull", str(docker_requirement["dockerPull"])]
                 _logger.info(str(cmd))
                 subprocess.check_call(cmd, stdout=sys.stderr)  # nosec
                 found = True
             elif "dockerLoad" in docker_requirement:
-                cmd = [self.docker_exec, "load"]
+                cmd = [docker_exec, "load"]
                 _logger.info(str(cmd))
                 if os.path.exists(docker_requirement["dockerLoad"]):
                     _logger.info(
@@ -183,7 +173,7 @@ class DockerCommandLineJob(ContainerCommandLineJob):
                 found = True
             elif "dockerImport" in docker_requirement:
                 cmd = [
-                    self.docker_exec,
+                    docker_exec,
                     "import",
                     str(docker_requirement["dockerImport"]),
                     str(docker_requirement["dockerImageId"]),
@@ -198,6 +188,41 @@ class DockerCommandLineJob(ContainerCommandLineJob):
 
         return found
 
+
+class DockerCommandLineJob(ContainerCommandLineJob):
+    """Runs a :py:class:`~cwltool.job.CommandLineJob` in a software container using the Docker engine."""
+
+    def __init__(
+        self,
+        builder: Builder,
+        joborder: CWLObjectType,
+        make_path_mapper: Callable[
+            [MutableSequence[CWLFileType | CWLDirectoryType], str, RuntimeContext, bool], PathMapper
+        ],
+        requirements: list[CWLObjectType],
+        hints: list[CWLObjectType],
+        name: str,
+    ) -> None:
+        """Initialize a command line builder using the Docker software container engine."""
+        super().__init__(builder, joborder, make_path_mapper, requirements, hints, name)
+        self.docker_exec = "docker"
+
+    def get_image(
+        self,
+        docker_requirement: dict[str, str],
+        pull_image: bool,
+        force_pull: bool,
+        tmp_outdir_prefix: str,
+    ) -> bool:
+        """
+        Retrieve the relevant Docker container image.
+
+        :returns: True upon success
+        """
+        return get_image(
+            self.docker_exec, docker_requirement, pull_image, force_pull, tmp_outdir_prefix
+        )
+
     def get_from_requirements(
         self,
         r: CWLObjectType,
@@ -0,0 +1,241 @@
+"""Download remote input files through a shared session, once per process."""
+
+import atexit
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from collections.abc import Iterable
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import IO
+
+import requests
+from cachecontrol.adapter import CacheControlAdapter
+from cachecontrol.caches import FileCache
+
+from .loghandler import _logger
+
+#: Number of files fetched concurrently, and of the connections kept open
+#: to each host for them.
+MAX_DOWNLOAD_WORKERS = 8
+
+_CHUNK_SIZE = 1024 * 1024
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+_downloads: dict[str, "Future[tuple[str, datetime | None]]"] = {}
+_downloads_lock = threading.Lock()
+_download_dir: str | None = None
+_download_dir_lock = threading.Lock()
+
+
+def cache_directory() -> str:
+    """Return the directory cwltool keeps downloaded files in."""
+    if "XDG_CACHE_HOME" in os.environ:
+        directory = os.environ["XDG_CACHE_HOME"]
+    elif "HOME" in os.environ:
+        directory = os.path.join(os.environ["HOME"], ".cache")
+    else:
+        directory = os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(directory, "cwltool")
+
+
+def _downloads_directory() -> str:
+    """
+    Return the directory holding the files downloaded by this process.
+
+    Jobs are handed copies of these files, and it is removed when cwltool exits.
+    """
+    global _download_dir
+    with _download_dir_lock:
+        if _download_dir is None or not os.path.isdir(_download_dir):
+            _download_dir = tempfile.mkdtemp(prefix="cwltool-downloads-")
+            atexit.register(shutil.rmtree, _download_dir, True)
+        return _download_dir
+
+
+def get_session() -> requests.Session:
+    """
+    Return the HTTP session shared by all downloads.
+
+    Connections are pooled and reused between downloads, and responses are
+    cached according to their HTTP caching headers.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = CacheControlAdapter(
+                cache=FileCache(cache_directory()),
+                pool_connections=MAX_DOWNLOAD_WORKERS,
+                pool_maxsize=MAX_DOWNLOAD_WORKERS,
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+def _open_partial(httpurl: str) -> tuple[IO[bytes], str | None]:
+    """
+    Open the partial download of a URL, to be continued.
+
+    :returns: The open file, and its path if another process is not already
+              writing to it. Otherwise, a new temporary file and None.
+    """
+    directory = os.path.join(cache_directory(), "downloads", "partial")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, hashlib.sha1(httpurl.encode("utf-8")).hexdigest())  # nosec
+    partial = open(path, "a+b")
+    try:
+        import fcntl
+
+        fcntl.flock(partial.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except ImportError:
+        pass
+    except OSError:
+        partial.close()
+        return tempfile.NamedTemporaryFile(dir=directory, delete=False), None
+    return partial, path
+
+
+def _request(
+    httpurl: str, partial: IO[bytes], validator_path: str | None
+) -> tuple[requests.Response, int]:
+    """
+    Request a URL, continuing from the end of the partial download if possible.
+
+    :returns: The response, and the offset it starts at.
+    """
+    offset = partial.seek(0, os.SEEK_END)
+    validator = None
+    if offset and validator_path and os.path.exists(validator_path):
+        with open(validator_path) as validator_file:
+            validator = validator_file.read()
+    headers = {"Range": f"bytes={offset}-", "If-Range": validator} if validator else {}
+    r = get_session().get(httpurl, stream=True, headers=headers)
+    if r.status_code == 206:
+        _logger.info("Resuming download of %s at byte %d", httpurl, offset)
+        return r, offset
+    if r.status_code == 416:
+        # The partial download is complete, or stale
+        r.close()
+        r = get_session().get(httpurl, stream=True)
+    r.raise_for_status()
+    partial.seek(0)
+    partial.truncate()
+    validator = r.headers.get("ETag") or r.headers.get("Last-Modified")
+    if validator_path and validator:
+        with open(validator_path, "w") as validator_file:
+            validator_file.write(validator)
+    return r, 0
+
+
+def _download(httpurl: str) -> tuple[str, datetime | None]:
+    partial, partial_path = _open_partial(httpurl)
+    validator_path = partial_path + ".validator" if partial_path else None
+    with partial:
+        try:
+            r, _offset = _request(httpurl, partial, validator_path)
+            with r:
+                for chunk in r.iter_content(chunk_size=_CHUNK_SIZE):
+                    if chunk:  # filter out keep-alive new chunks
+                        partial.write(chunk)
+                date_raw: str | None = r.headers.get("Last-Modified", None)
+        except BaseException:
+            if partial_path is None:
+                os.unlink(partial.name)
+            raise
+        partial.flush()
+
+        path = tempfile.mkstemp(dir=_downloads_directory())[1]
+        shutil.move(partial.name, path)
+        if validator_path and os.path.exists(validator_path):
+            os.unlink(validator_path)
+
+    date = parsedate_to_datetime(date_raw) if date_raw else None
+    if date:
+        os.utime(path, (date.timestamp(), date.timestamp()))
+    return path, date
+
+
+def _downloaded(httpurl: str) -> tuple[str, datetime | None]:
+    """Return the download of a URL by this process, downloading it first if needed."""
+    with _downloads_lock:
+        future = _downloads.get(httpurl)
+        if future is not None and future.done() and future.exception() is None:
+            if not os.path.exists(future.result()[0]):
+                future = None
+        owner = future is None
+        if future is None:
+            future = _downloads[httpurl] = Future()
+    if not owner:
+        return future.result()
+    try:
+        result = _download(httpurl)
+    except BaseException as err:
+        with _downloads_lock:
+            del _downloads[httpurl]
+        future.set_exception(err)
+        raise
+    future.set_result(result)
+    return result
+
+
+def download_file(httpurl: str) -> tuple[str, datetime | None]:
+    """
+    Download a remote file, possibly using a locally cached copy.
+
+    Each URL is downloaded once per process; concurrent requests for the
+    same URL wait for the first one. Every call returns a new, writable copy
+    of the download, as jobs may update their inputs in place. A download
+    interrupted by an error is resumed from where it stopped when the server
+    supports it.
+
+    Returns a tuple:
+    - the local path for the downloaded file
+    - the Last-Modified timestamp if received from the remote server.
+    """
+    path, date = _downloaded(httpurl)
+    with tempfile.NamedTemporaryFile(delete=False) as copy:
+        pass
+    shutil.copy2(path, copy.name)
+    return copy.name, date
+
+
+def _prefetch(httpurl: str) -> None:
+    try:
+        _downloaded(httpurl)
+    except Exception as err:
+        # The job that needs this file will retry and report the failure.
+        _logger.warning("[prefetch] Unable to download %s: %s", httpurl, err)
+
+
+def prefetch_downloads(locations: Iterable[str]) -> ThreadPoolExecutor | None:
+    """
+    Start downloading the given locations that are HTTP(S) URLs.
+
+    The downloads run in parallel with each other and with the workflow.
+    Jobs needing a file still being downloaded wait for it.
+
+    :returns: The executor running the downloads (to be shut down by the
+              caller), or None if there was nothing to download.
+    """
+    urls = list(
+        dict.fromkeys(
+            location for location in locations if location.startswith(("http://", "https://"))
+        )
+    )
+    if not urls:
+        return None
+    _logger.info("[prefetch] Downloading %d file(s)", len(urls))
+    pool = ThreadPoolExecutor(
+        max_workers=min(MAX_DOWNLOAD_WORKERS, len(urls)),
+        thread_name_prefix="cwltool-download",
+    )
+    for url in urls:
+        pool.submit(_prefetch, url)
+    return pool
@@ -8,7 +8,7 @@ import os
 import sys
 import threading
 from abc import ABCMeta, abstractmethod
-from collections.abc import Iterable, MutableSequence
+from collections.abc import Iterable, Mapping, MutableSequence
 from threading import Lock
 from typing import Optional, cast
 
@@ -18,17 +18,22 @@ from mypy_extensions import mypyc_attr
 from schema_salad.exceptions import ValidationException
 from schema_salad.sourceline import SourceLine
 
-from .command_line_tool import CallbackJob, ExpressionJob
+from .cache_plan import CachePlan
 from .context import RuntimeContext, getdefault
 from .cuda import cuda_version_and_device_count
+from .download import prefetch_downloads
 from .errors import WorkflowException
 from .job import JobBase
 from .loghandler import _logger
 from .mutation import MutationManager
+from .pathmapper import symlink_cache
+from .prefetch import prefetch_images
 from .process import Process, cleanIntermediate, relocateOutputs
+from .relocate import EarlyRelocator
+from .streaming import StreamingJobPair
 from .task_queue import TaskQueue
 from .update import ORIGINAL_CWLVERSION
-from .utils import JobsType
+from .utils import JobsType, visit_class
 from .workflow import Workflow
 from .workflow_job import WorkflowJob, WorkflowJobStep
 
@@ -103,6 +108,9 @@ class JobExecutor(metaclass=ABCMeta):
         runtime_context.mutation_manager = MutationManager()
         runtime_context.toplevel = True
         runtime_context.workflow_eval_lock = threading.Condition(threading.RLock())
+        if runtime_context.cachedir:
+            # shared by all the jobs of the run
+            runtime_context.get_cache_backend()
 
         job_reqs: list[CWLObjectType] | None = None
         if "https://w3id.org/cwl/cwl#requirements" in job_order_object:
@@ -135,20 +143,59 @@ class JobExecutor(metaclass=ABCMeta):
             for req in job_reqs:
                 process.requirements.append(req)
 
-        self.run_jobs(process, job_order_object, logger, runtime_context)
-        if runtime_context.validate_only is True:
-            return (None, "ValidationSuccess")
-
-        if self.final_output and self.final_output[0] is not None and finaloutdir is not None:
-            self.final_output[0] = relocateOutputs(
-                self.final_output[0],
+        prefetcher = None
+        downloader = None
+        if (
+            finaloutdir is not None
+            and runtime_context.relocate_early
+            and runtime_context.move_outputs in ("move", "copy")
+            and not runtime_context.validate_only
+        ):
+            runtime_context.early_relocator = EarlyRelocator(
                 finaloutdir,
                 self.output_dirs,
                 runtime_context.move_outputs,
-                runtime_context.make_fs_access(""),
                 getdefault(runtime_context.compute_checksum, True),
-                path_mapper=runtime_context.path_mapper,
             )
+        if runtime_context.prefetch_images and not runtime_context.validate_only:
+            prefetcher = prefetch_images(process, runtime_context)
+        if runtime_context.prefetch_downloads and not runtime_context.validate_only:
+            locations: list[str] = []
+            visit_class(
+                job_order_object, ("File",), lambda f: locations.append(f.get("location", ""))
+            )
+            downloader = prefetch_downloads(locations)
+        try:
+            self.run_jobs(process, job_order_object, logger, runtime_context)
+        except BaseException:
+            if runtime_context.early_relocator is not None:
+                runtime_context.early_relocator.close()
+            raise
+        finally:
+            if prefetcher is not None:
+                prefetcher.shutdown(wait=True, cancel_futures=True)
+            if downloader is not None:
+                downloader.shutdown(wait=True, cancel_futures=True)
+            if runtime_context.cache_backend is not None:
+                runtime_context.cache_backend.flush()
+        if runtime_context.validate_only is True:
+            return (None, "ValidationSuccess")
+
+        try:
+            if self.final_output and self.final_output[0] is not None and finaloutdir is not None:
+                self.final_output[0] = relocateOutputs(
+                    self.final_output[0],
+                    finaloutdir,
+                    self.output_dirs,
+                    runtime_context.move_outputs,
+                    runtime_context.make_fs_access(""),
+                    getdefault(runtime_context.compute_checksum, True),
+                    path_mapper=runtime_context.path_mapper,
+                    relocator=runtime_context.early_relocator,
+                )
+        finally:
+            if runtime_context.early_relocator is not None:
+                runtime_context.early_relocator.close()
 
         if runtime_context.rm_tmpdir:
             if not runtime_context.cachedir:
@@ -160,6 +207,9 @@ class JobExecutor(metaclass=ABCMeta):
                 )
             cleanIntermediate(output_dirs)
 
+        if symlink_cache.hits:
+            _logger.debug("%s", symlink_cache)
+
         if self.final_output and self.final_status:
             if (
                 runtime_context.research_obj is not None
@@ -216,7 +266,9 @@ class SingleJobExecutor(JobExecutor):
                 if job is not None:
                     if runtime_context.builder is not None and hasattr(job, "builder"):
                         job.builder = runtime_context.builder
-                    if job.outdir is not None:
+                    if isinstance(job, StreamingJobPair):
+                        self.output_dirs.update(job.outdirs)
+                    elif job.outdir is not None:
                         self.output_dirs.add(job.outdir)
                     if runtime_context.research_obj is not None:
                         if not isinstance(process, Workflow):
@@ -270,6 +322,13 @@ else:
         return psutil.cpu_count() or 1
 
 
+def _job_resources(job: JobBase | StreamingJobPair) -> Mapping[str, int | float]:
+    """Return the resources a job must be allocated before it runs."""
+    if isinstance(job, StreamingJobPair):
+        return job.resources
+    return job.builder.resources
+
+
 class MultithreadedJobExecutor(JobExecutor):
     """
     Experimental multi-threaded CWL executor.
@@ -320,9 +379,17 @@ class MultithreadedJobExecutor(JobExecutor):
 
         return result
 
+    def can_allocate(self, resources: Mapping[str, int | float]) -> bool:
+        """Return whether a job needing ``resources`` can ever run on this host."""
+        return (
+            resources["ram"] <= self.max_ram
+            and resources["cores"] <= self.max_cores
+            and resources.get("cudaDeviceCount", 0) <= self.max_cuda
+        )
+
     def _runner(
         self,
-        job: JobBase | WorkflowJob | CallbackJob | ExpressionJob,
+        job: JobsType,
         runtime_context: RuntimeContext,
         TMPDIR_LOCK: threading.Lock,
     ) -> None:
@@ -346,14 +413,13 @@ class MultithreadedJobExecutor(JobExecutor):
         finally:
             if runtime_context.workflow_eval_lock:
                 with runtime_context.workflow_eval_lock:
-                    if isinstance(job, JobBase):
-                        ram = job.builder.resources["ram"]
+                    if isinstance(job, (JobBase, StreamingJobPair)):
+                        resources = _job_resources(job)
+                        ram = resources["ram"]
                         self.allocated_ram -= ram
-                        cores = job.builder.resources["cores"]
+                        cores = resources["cores"]
                         self.allocated_cores -= cores
-                        cudaDevices: int = cast(
-                            int, job.builder.resources.get("cudaDeviceCount", 0)
-                        )
+                        cudaDevices: int = cast(int, resources.get("cudaDeviceCount", 0))
                         self.allocated_cuda -= cudaDevices
                     runtime_context.workflow_eval_lock.notify_all()
 
@@ -375,18 +441,19 @@ class MultithreadedJobExecutor(JobExecutor):
                 # generated and add them to the queue only if there
                 # are resources available.
                 job = self.pending_jobs[n]
-                if isinstance(job, JobBase):
-                    ram = job.builder.resources["ram"]
-                    cores = job.builder.resources["cores"]
-                    cudaDevices = cast(int, job.builder.resources.get("cudaDeviceCount", 0))
-                    if ram > self.max_ram or cores > self.max_cores or cudaDevices > self.max_cuda:
+                if isinstance(job, (JobBase, StreamingJobPair)):
+                    resources = _job_resources(job)
+                    ram = resources["ram"]
+                    cores = resources["cores"]
+                    cudaDevices = cast(int, resources.get("cudaDeviceCount", 0))
+                    if not self.can_allocate(resources):
                         _logger.error(
                             'Job "%s" cannot be run, requests more resources (%s) '
                             "than available on this host (already allocated ram is %d, "
                             "allocated cores is %d, allocated CUDA is %d, "
                             "max ram %d, max cores %d, max CUDA %d).",
                             job.name,
-                            job.builder.resources,
+                            resources,
                             self.allocated_ram,
                             self.allocated_cores,
                             self.allocated_cuda,
@@ -408,7 +475,7 @@ class MultithreadedJobExecutor(JobExecutor):
                             "allocated CUDA devices is %d, "
                             "max ram %d, max cores %d, max CUDA %d).",
                             job.name,
-                            job.builder.resources,
+                            resources,
                             self.allocated_ram,
                             self.allocated_cores,
                             self.allocated_cuda,
@@ -419,12 +486,13 @@ class MultithreadedJobExecutor(JobExecutor):
                         n += 1
                         continue
 
-                if isinstance(job, JobBase):
-                    ram = job.builder.resources["ram"]
+                if isinstance(job, (JobBase, StreamingJobPair)):
+                    resources = _job_resources(job)
+                    ram = resources["ram"]
                     self.allocated_ram += ram
-                    cores = job.builder.resources["cores"]
+                    cores = resources["cores"]
                     self.allocated_cores += cores
-                    cuda = cast(int, job.builder.resources.get("cudaDevices", 0))
+                    cuda = cast(int, resources.get("cudaDevices", 0))
                     self.allocated_cuda += cuda
                 self.taskqueue.add(
                     functools.partial(self._runner, job, runtime_context, TMPDIR_LOCK),
@@ -460,6 +528,8 @@ class MultithreadedJobExecutor(JobExecutor):
                         job.builder = runtime_context.builder or job.builder
                         if job.outdir is not None:
                             self.output_dirs.add(job.outdir)
+                    elif isinstance(job, StreamingJobPair):
+                        self.output_dirs.update(job.outdirs)
 
                 self.run_job(job, runtime_context)
 
@@ -481,6 +551,62 @@ class MultithreadedJobExecutor(JobExecutor):
             self.taskqueue.join()
 
 
+@mypyc_attr(allow_interpreted_subclasses=True)
+class CachePlanExecutor(JobExecutor):
+    """
+    Plan which CommandLineTool jobs would be found in the --cachedir.
+
+    The process is walked as it would run, but jobs found in the cache only
+    collect their outputs, and the others are not staged nor run: they hand
+    back pending outputs instead, see :py:mod:`cwltool.cache_plan`.
+    """
+
+    def __init__(self) -> None:
+        """Initialize."""
+        super().__init__()
+        self.plan = CachePlan()
+
+    def run_jobs(
+        self,
+        process: Process,
+        job_order_object: CWLObjectType,
+        logger: logging.Logger,
+        runtime_context: RuntimeContext,
+    ) -> None:
+        for job in process.job(job_order_object, self.output_callback, runtime_context):
+            if job is None:
+                logger.error("Workflow cannot make any more progress.")
+                break
+            job.run(runtime_context)
+
+    def execute(
+        self,
+        process: Process,
+        job_order_object: CWLObjectType,
+        runtime_context: RuntimeContext,
+        logger: logging.Logger = _logger,
+    ) -> tuple[CWLObjectType | None, str]:
+        self.final_output = []
+        self.final_status = []
+        self.plan = CachePlan()
+        runtime_context = runtime_context.copy()
+        # not created, as no job is staged
+        runtime_context.outdir = "/out"
+        runtime_context.tmpdir = "/tmp"  # nosec
+        runtime_context.stagedir = "/stage"
+        runtime_context.mutation_manager = MutationManager()
+        runtime_context.toplevel = True
+        runtime_context.workflow_eval_lock = threading.Condition(threading.RLock())
+        if runtime_context.cachedir:
+            # shared by all the jobs of the run
+            runtime_context.get_cache_backend()
+        runtime_context.cache_plan = self.plan
+        self.run_jobs(process, job_order_object, logger, runtime_context)
+        if self.final_output and self.final_status:
+            return (self.final_output[0], self.final_status[0])
+        return (None, "permanentFail")
+
+
 class NoopJobExecutor(JobExecutor):
     """Do nothing executor, for testing purposes only."""
 
@@ -1,3 +1,4 @@
+import atexit
 import datetime
 import functools
 import itertools
@@ -11,6 +12,7 @@ import signal
 import stat
 import subprocess  # nosec
 import sys
+import tempfile
 import threading
 import time
 import uuid
@@ -35,6 +37,7 @@ from .loghandler import _logger
 from .pathmapper import MapperEnt, PathMapper
 from .process import stage_files
 from .secrets import SecretStore
+from .staging import log_stats
 from .utils import (
     HasReqsHints,
     OutputCallbackType,
@@ -62,6 +65,50 @@ SHELL_COMMAND_TEMPLATE = """#!/bin/bash
 python3 "run_job.py" "job.json"
 """
 
+_RUNNER_DIR: str | None = None
+_RUNNER_DIR_LOCK = threading.Lock()
+
+_IMAGE_LOCKS: dict[str, threading.Lock] = {}
+_IMAGE_LOCKS_LOCK = threading.Lock()
+
+
+def _runner_dir(make_dir: Callable[[], str]) -> str:
+    """
+    Return the directory holding the job runner scripts.
+
+    It is prepared once per cwltool process, shared by all the shelled jobs,
+    and removed when cwltool exits.
+    """
+    global _RUNNER_DIR  # pylint: disable=global-statement
+    with _RUNNER_DIR_LOCK:
+        if _RUNNER_DIR is None or not os.path.isdir(_RUNNER_DIR):
+            runner_dir = make_dir()
+            shutil.copyfile(run_job.__file__, os.path.join(runner_dir, "run_job.py"))
+            shutil.copyfile(env_to_stdout.__file__, os.path.join(runner_dir, "env_to_stdout.py"))
+            atexit.register(shutil.rmtree, runner_dir, True)
+            _RUNNER_DIR = runner_dir
+        return _RUNNER_DIR
+
+
+def image_lock(docker_requirement: Mapping[str, str]) -> threading.Lock:
+    """
+    Return the lock that serialises the retrieval of the image of a DockerRequirement.
+
+    Held while an image is pulled, built, loaded or converted, so that the jobs
+    and the pre-fetch stage needing the same image wait for the first retrieval
+    instead of repeating it. The image is identified by the fields that its
+    retrieval does not rewrite: ``dockerImageId`` is set to where the image was
+    found, and ``dockerPull`` may be given a ``docker://`` prefix.
+    """
+    if "dockerFile" in docker_requirement:
+        key = "dockerFile:" + docker_requirement["dockerFile"]
+    elif "dockerPull" in docker_requirement:
+        key = "dockerPull:" + docker_requirement["dockerPull"].removeprefix("docker://")
+    else:
+        key = "dockerImageId:" + docker_requirement.get("dockerImageId", "")
+    with _IMAGE_LOCKS_LOCK:
+        return _IMAGE_LOCKS.setdefault(key, threading.Lock())
+
 
 def relink_initialworkdir(
     pathmapper: PathMapper,
@@ -584,7 +631,7 @@ class CommandLineJob(JobBase):
 
         self._setup(runtimeContext)
 
-        stage_files(
+        staging_stats = stage_files(
             self.pathmapper,
             ignore_writable=True,
             symlink=True,
@@ -596,6 +643,7 @@ class CommandLineJob(JobBase):
                 ignore_writable=self.inplace_update,
                 symlink=True,
                 secret_store=runtimeContext.secret_store,
+                stats=staging_stats,
             )
             relink_initialworkdir(
                 self.generatemapper,
@@ -603,6 +651,7 @@ class CommandLineJob(JobBase):
                 self.builder.outdir,
                 inplace_update=self.inplace_update,
             )
+        log_stats(self.name, staging_stats)
 
         monitor_function = functools.partial(self.process_monitor)
 
@@ -1017,9 +1066,6 @@ def _job_popen(
 
         return rcode
     else:
-        if job_script_contents is None:
-            job_script_contents = SHELL_COMMAND_TEMPLATE
-
         job_description = {
             "commands": commands,
             "cwd": cwd,
@@ -1029,24 +1075,41 @@ def _job_popen(
             "stdin_path": stdin_path,
         }
 
-        job_dir = make_job_dir()
-        try:
+        runner_dir = _runner_dir(make_job_dir)
+        if job_script_contents is None:
+            # Without a custom job script there is nothing for bash to do and
+            # no per job files besides the description, so start the runner
+            # directly from the shared runner directory.
+            job_fd, job_path = tempfile.mkstemp(prefix="job_", suffix=".json", dir=runner_dir)
+            with open(job_fd, mode="w", encoding="utf-8") as job_file:
+                json_dump(job_description, job_file, ensure_ascii=False)
+            popen_args = [
+                sys.executable,
+                "-S",
+                os.path.join(runner_dir, "run_job.py"),
+                job_path,
+            ]
+            popen_cwd = runner_dir
+        else:
+            job_dir = job_path = make_job_dir()
             with open(os.path.join(job_dir, "job.json"), mode="w", encoding="utf-8") as job_file:
                 json_dump(job_description, job_file, ensure_ascii=False)
             job_script = os.path.join(job_dir, "run_job.bash")
             with open(job_script, "w") as _:
                 _.write(job_script_contents)
+            for runner_script in ("run_job.py", "env_to_stdout.py"):
+                os.symlink(
+                    os.path.join(runner_dir, runner_script),
+                    os.path.join(job_dir, runner_script),
+                )
+            popen_args = ["bash", job_script]
+            popen_cwd = job_dir
 
-            job_run = os.path.join(job_dir, "run_job.py")
-            shutil.copyfile(run_job.__file__, job_run)
-
-            env_getter = os.path.join(job_dir, "env_to_stdout.py")
-            shutil.copyfile(env_to_stdout.__file__, env_getter)
-
+        try:
             sproc = subprocess.Popen(  # nosec
-                ["bash", job_script],
+                popen_args,
                 shell=False,  # nosec
-                cwd=job_dir,
+                cwd=popen_cwd,
                 # The nested script will output the paths to the correct files if they need
                 # to be captured. Else just write everything to stderr (same as above).
                 stdout=sys.stderr,
@@ -1082,4 +1145,7 @@ def _job_popen(
 
             return rcode
         finally:
-            shutil.rmtree(job_dir)
+            if os.path.isdir(job_path):
+                shutil.rmtree(job_path)
+            else:
+                os.remove(job_path)
@@ -0,0 +1,574 @@
+"""Keep an index of the jobs cached in a --cachedir, to report on and bound its size."""
+
+import errno
+import os
+import re
+import shutil
+import sqlite3
+import stat
+import threading
+import time
+from collections.abc import Mapping, MutableMapping
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+try:
+    import fcntl
+except ImportError:
+    # Guard against `from .job_cache import ...` on windows.
+    # See windows_check() in main.py
+    pass
+
+from .checksum import MAX_CHECKSUM_WORKERS, checksum_stream
+from .loghandler import _logger
+from .utils import ThreadLocalConnection
+
+#: Name of the index, in the cache directory.
+INDEX_NAME = "jobs.sqlite"
+
+#: Name of the directory of the content-addressed blob store, in the cache directory.
+BLOBS_NAME = "blobs"
+
+#: Files smaller than this are not worth storing once by content.
+BLOB_MIN_SIZE = 4096
+
+_KEY_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+def directory_size(path: str) -> int:
+    """Return the total size of the files under ``path``, not following symbolic links."""
+    size = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return size
+
+
+class ManifestEntry(NamedTuple):
+    """A file of a cached job, as recorded when the job was cached."""
+
+    path: str
+    """The path of the file, relative to the directory of the job."""
+    size: int
+    checksum: str
+    """The ``sha1$`` checksum of the file, or an empty string if not known."""
+
+
+def manifest(jobcache: str, checksums: Mapping[str, str]) -> list[ManifestEntry]:
+    """
+    List the files under ``jobcache``, not following symbolic links.
+
+    :param checksums: Known checksums of the files, by path.
+    """
+    entries = []
+    for root, _dirs, files in os.walk(jobcache):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                st = os.lstat(path)
+            except OSError:
+                continue
+            checksum = checksums.get(path, "") if stat.S_ISREG(st.st_mode) else ""
+            entries.append(
+                ManifestEntry(
+                    os.path.relpath(path, jobcache),
+                    st.st_size,
+                    checksum if checksum.startswith("sha1$") else "",
+                )
+            )
+    return entries
+
+
+def check_manifest(
+    jobcache: str, entries: list[ManifestEntry], checksums: bool = False
+) -> str | None:
+    """
+    Check that the files of a cached job are those recorded when it was cached.
+
+    :param checksums: Also compare the contents of the files with their checksums.
+    :returns: The path of the first file found missing or changed, or None.
+    """
+    for entry in entries:
+        path = os.path.join(jobcache, entry.path)
+        try:
+            if os.lstat(path).st_size != entry.size:
+                return path
+            if checksums and entry.checksum:
+                with open(path, "rb") as f:
+                    if checksum_stream(f) != entry.checksum:
+                        return path
+        except OSError:
+            return path
+    return None
+
+
+class ToolStats(NamedTuple):
+    """How much of a job cache the jobs of one tool take."""
+
+    tool: str
+    entries: int
+    size: int
+    hits: int
+
+
+class CacheStats(NamedTuple):
+    """How much a job cache holds, and how often it was used."""
+
+    cachedir: str
+    entries: int
+    size: int
+    hits: int
+    blobs: int
+    blob_size: int
+    tools: list[ToolStats]
+
+
+class JobCache:
+    """
+    An index of the jobs cached in a cache directory.
+
+    Each completed job is recorded with the id of its tool, the size of its
+    outputs, when it was created and when it was last used. With
+    ``max_size``, the least recently used jobs are removed whenever the cache
+    grows beyond it. A job is only removed while holding the exclusive lock
+    on its ``<key>.status`` file, so jobs being read or written by another
+    cwltool are skipped; the jobs used by this cwltool are never removed.
+
+    With ``deduplicate``, the files of each job are stored once by content
+    in a ``blobs`` directory, and hardlinked into the directory of the job.
+    The size of a job then only counts the files it does not share; each
+    blob is counted once, and removed with the last job referencing it.
+    Cached outputs are therefore copied before a job updates them in place
+    (see :py:func:`cwltool.command_line_tool.copy_cached_writable`); other
+    writable inputs are always copied.
+
+    The size, and checksum when known, of each file of a job is recorded in
+    its manifest, against which :py:meth:`verify` checks the job.
+
+    The uses of cached jobs are only written to the index by :py:meth:`flush`,
+    as a lookup should not wait for the index. The index uses a rollback
+    journal, as a write-ahead log does not work on network filesystems.
+    """
+
+    def __init__(
+        self, cachedir: str, max_size: int | None = None, deduplicate: bool = False
+    ) -> None:
+        """Index the jobs cached in ``cachedir``."""
+        self.cachedir = cachedir
+        self.max_size = max_size
+        self.deduplicate = deduplicate
+        self.path = os.path.join(cachedir, INDEX_NAME)
+        self.blobdir = os.path.join(cachedir, BLOBS_NAME)
+        self._used: set[str] = set()
+        self._hits: dict[str, tuple[float, int]] = {}
+        self._hits_lock = threading.Lock()
+        self._connection = ThreadLocalConnection(self.path)
+        os.makedirs(cachedir, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (key TEXT PRIMARY KEY, tool TEXT, "
+                "size INTEGER, created REAL, last_hit REAL, hits INTEGER)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS blobs (digest TEXT PRIMARY KEY, size INTEGER, "
+                "refs INTEGER)"
+            )
+            connection.execute("CREATE TABLE IF NOT EXISTS job_blobs (key TEXT, digest TEXT)")
+            connection.execute("CREATE INDEX IF NOT EXISTS job_blobs_key ON job_blobs (key)")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS files (key TEXT, path TEXT, size INTEGER, "
+                "checksum TEXT)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS files_key ON files (key)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return self._connection.get()
+
+    def add(self, key: str, tool: str, checksums: Mapping[str, str] | None = None) -> None:
+        """
+        Record the job just cached under ``key``, and make room for it if needed.
+
+        :param checksums: Known checksums of the files of the job, by path.
+        """
+        self._used.add(key)
+        now = time.time()
+        jobcache = os.path.join(self.cachedir, key)
+        blobs: list[tuple[str, int]] = []
+        known = dict(checksums or {})
+        if self.deduplicate:
+            size = self._store_blobs(jobcache, known, blobs)
+            files = manifest(jobcache, known)
+        else:
+            files = manifest(jobcache, known)
+            size = sum(entry.size for entry in files)
+        with self._connect() as connection:
+            self._unreference(connection, key)
+            self._record(connection, key, files)
+            connection.execute(
+                "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, 0)",
+                (key, tool, size, now, now),
+            )
+            for digest, blob_size in blobs:
+                connection.execute(
+                    "INSERT INTO blobs VALUES (?, ?, 1) "
+                    "ON CONFLICT (digest) DO UPDATE SET refs = refs + 1",
+                    (digest, blob_size),
+                )
+            connection.executemany(
+                "INSERT INTO job_blobs VALUES (?, ?)", ((key, digest) for digest, _ in blobs)
+            )
+        if self.max_size is not None:
+            self.evict(self.max_size)
+
+    def _store_blobs(
+        self, jobcache: str, checksums: MutableMapping[str, str], blobs: list[tuple[str, int]]
+    ) -> int:
+        """
+        Replace the files of a job with hardlinks to the blobs of their contents.
+
+        :param checksums: Known checksums of the files, by path, to which
+            those computed are added.
+        :param blobs: Where to add the digest and size of each blob linked.
+        :returns: The size of the files left unshared.
+        """
+        size = 0
+        for root, _dirs, files in os.walk(jobcache):
+            for name in files:
+                path = os.path.join(root, name)
+                st = os.lstat(path)
+                if not stat.S_ISREG(st.st_mode) or st.st_size < BLOB_MIN_SIZE:
+                    size += st.st_size
+                    continue
+                checksum = checksums.get(path)
+                if checksum is None or not checksum.startswith("sha1$"):
+                    with open(path, "rb") as f:
+                        checksum = checksum_stream(f)
+                    checksums[path] = checksum
+                digest = checksum[len("sha1$") :]
+                try:
+                    self._link_blob(path, digest)
+                except OSError as err:
+                    _logger.debug("Not storing %s once by content: %s", path, err)
+                    size += st.st_size
+                    continue
+                blobs.append((digest, st.st_size))
+        return size
+
+    def _link_blob(self, path: str, digest: str) -> None:
+        """Make ``path`` a hardlink to the blob of ``digest``, creating it from ``path`` if new."""
+        blob = os.path.join(self.blobdir, digest[:2], digest)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        for _attempt in range(3):
+            try:
+                os.link(path, blob)
+                return
+            except FileExistsError:
+                pass
+            if os.path.samefile(path, blob):
+                return
+            linked = f"{path}.cwltool-blob"
+            try:
+                os.link(blob, linked)
+            except FileNotFoundError:
+                # removed meanwhile, as no longer referenced
+                continue
+            os.replace(linked, path)
+            return
+        raise OSError(errno.EAGAIN, "Blob store busy", blob)
+
+    def _record(self, connection: sqlite3.Connection, key: str, files: list[ManifestEntry]) -> None:
+        """Replace the manifest of a job."""
+        connection.execute("DELETE FROM files WHERE key = ?", (key,))
+        connection.executemany(
+            "INSERT INTO files VALUES (?, ?, ?, ?)", ((key, *entry) for entry in files)
+        )
+
+    def _unreference(self, connection: sqlite3.Connection, key: str) -> None:
+        """Drop the references of a job to its blobs, removing those no longer used."""
+        for (digest,) in connection.execute(
+            "SELECT digest FROM job_blobs WHERE key = ?", (key,)
+        ).fetchall():
+            connection.execute("UPDATE blobs SET refs = refs - 1 WHERE digest = ?", (digest,))
+        connection.execute("DELETE FROM job_blobs WHERE key = ?", (key,))
+        for (digest,) in connection.execute("SELECT digest FROM blobs WHERE refs <= 0").fetchall():
+            self._remove_blob(connection, digest)
+
+    def _remove_blob(self, connection: sqlite3.Connection, digest: str) -> None:
+        """Remove a blob, unless it is still linked from outside the index."""
+        blob = os.path.join(self.blobdir, digest[:2], digest)
+        try:
+            if os.lstat(blob).st_nlink == 1:
+                os.unlink(blob)
+        except FileNotFoundError:
+            pass
+        connection.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+
+    def hit(self, key: str) -> None:
+        """Note a use of the job cached under ``key``, to be recorded by :py:meth:`flush`."""
+        self._used.add(key)
+        with self._hits_lock:
+            _last_hit, hits = self._hits.get(key, (0.0, 0))
+            self._hits[key] = (time.time(), hits + 1)
+
+    def flush(self) -> None:
+        """Record the uses of cached jobs noted since the last flush, all at once."""
+        with self._hits_lock:
+            pending, self._hits = self._hits, {}
+        if not pending:
+            return
+        unindexed = []
+        with self._connect() as connection:
+            for key, (last_hit, hits) in pending.items():
+                if not connection.execute(
+                    "UPDATE jobs SET last_hit = ?, hits = hits + ? WHERE key = ?",
+                    (last_hit, hits, key),
+                ).rowcount:
+                    unindexed.append(key)
+        for key in unindexed:
+            # cached before the index existed
+            if os.path.isdir(os.path.join(self.cachedir, key)):
+                self._index(key)
+
+    def _index(self, key: str) -> None:
+        jobcache = os.path.join(self.cachedir, key)
+        mtime = os.stat(jobcache).st_mtime
+        files = manifest(jobcache, {})
+        with self._connect() as connection:
+            inserted = connection.execute(
+                "INSERT OR IGNORE INTO jobs VALUES (?, '', ?, ?, ?, 0)",
+                (key, sum(entry.size for entry in files), mtime, mtime),
+            ).rowcount
+            if inserted:
+                self._record(connection, key, files)
+
+    def remove(self, key: str, completed_only: bool = False) -> bool:
+        """
+        Remove a cached job, unless it is in use.
+
+        :param completed_only: Only remove the job if it completed successfully.
+        :returns: Whether the job was removed.
+        """
+        if key in self._used:
+            return False
+        jobcache = os.path.join(self.cachedir, key)
+        if completed_only and not os.path.exists(f"{jobcache}.status"):
+            # already removed by another cwltool
+            self._drop(key)
+            return True
+        try:
+            status_file = open(f"{jobcache}.status", "a+")
+        except OSError as err:
+            _logger.debug("Can not lock cached job %s: %s", jobcache, err)
+            return False
+        with status_file:
+            try:
+                fcntl.flock(status_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return False
+            status_file.seek(0)
+            if completed_only and status_file.read() != "success":
+                return False
+            status_file.truncate(0)
+            shutil.rmtree(jobcache, ignore_errors=True)
+            os.unlink(f"{jobcache}.status")
+        self._drop(key)
+        return True
+
+    def _drop(self, key: str) -> None:
+        """Remove a job from the index."""
+        with self._connect() as connection:
+            self._unreference(connection, key)
+            connection.execute("DELETE FROM files WHERE key = ?", (key,))
+            connection.execute("DELETE FROM jobs WHERE key = ?", (key,))
+
+    def manifest(self, key: str) -> list[ManifestEntry]:
+        """Return the files of a job recorded when it was cached."""
+        return [
+            ManifestEntry(*row)
+            for row in self._connect().execute(
+                "SELECT path, size, checksum FROM files WHERE key = ?", (key,)
+            )
+        ]
+
+    def verify(self, key: str, checksums: bool = False) -> bool:
+        """
+        Check that the files of a cached job were not changed since it was cached.
+
+        A damaged file shared by content is also dropped from the blob store,
+        so that the job is not linked to it again when computed anew.
+
+        :param checksums: Also compare the contents of the files with their checksums.
+        :returns: Whether the job is intact; jobs cached without a manifest are.
+        """
+        jobcache = os.path.join(self.cachedir, key)
+        files = self.manifest(key)
+        damaged = check_manifest(jobcache, files, checksums)
+        if damaged is None:
+            return True
+        _logger.warning("Cached job %s is damaged: %s was changed", key, damaged)
+        self._unlink_blobs(jobcache, files)
+        return False
+
+    def _unlink_blobs(self, jobcache: str, files: list[ManifestEntry]) -> None:
+        """Remove the blobs still linked from the files of a damaged job from the blob store."""
+        for entry in files:
+            if not entry.checksum:
+                continue
+            digest = entry.checksum[len("sha1$") :]
+            blob = os.path.join(self.blobdir, digest[:2], digest)
+            try:
+                if os.path.samefile(os.path.join(jobcache, entry.path), blob):
+                    os.unlink(blob)
+            except OSError:
+                pass
+
+    def verify_all(self, checksums: bool = True) -> int:
+        """
+        Check all the jobs of the cache, and remove the damaged ones.
+
+        The jobs are checked in parallel.
+
+        :param checksums: Also compare the contents of the files with their checksums.
+        :returns: The number of jobs removed.
+        """
+        self.sync()
+        keys = [key for (key,) in self._connect().execute("SELECT key FROM jobs")]
+        manifests = [self.manifest(key) for key in keys]
+        with ThreadPoolExecutor(
+            max_workers=MAX_CHECKSUM_WORKERS, thread_name_prefix="cwltool-verify"
+        ) as pool:
+            damaged = list(
+                pool.map(
+                    lambda key, files: check_manifest(
+                        os.path.join(self.cachedir, key), files, checksums
+                    ),
+                    keys,
+                    manifests,
+                )
+            )
+        removed = 0
+        for key, files, path in zip(keys, manifests, damaged):
+            if path is None:
+                continue
+            _logger.warning("Cached job %s is damaged: %s was changed", key, path)
+            self._unlink_blobs(os.path.join(self.cachedir, key), files)
+            if self.remove(key, completed_only=True):
+                removed += 1
+        return removed
+
+    def size(self) -> int:
+        """Return the size of the jobs in the index, counting each blob once."""
+        return int(
+            self._connect()
+            .execute(
+                "SELECT (SELECT COALESCE(SUM(size), 0) FROM jobs) "
+                "+ (SELECT COALESCE(SUM(size), 0) FROM blobs)"
+            )
+            .fetchone()[0]
+        )
+
+    def evict(self, max_size: int) -> int:
+        """
+        Remove the least recently used jobs until the cache is no larger than ``max_size``.
+
+        :returns: The number of jobs removed.
+        """
+        size = self.size()
+        if size <= max_size:
+            return 0
+        removed = 0
+        for (key,) in self._connect().execute("SELECT key FROM jobs ORDER BY last_hit").fetchall():
+            if size <= max_size:
+                break
+            if self.remove(key, completed_only=True):
+                _logger.debug("Evicted cached job %s", key)
+                size = self.size()
+                removed += 1
+        if size > max_size:
+            _logger.warning(
+                "Job cache %s is %d bytes, over its maximum size of %d bytes, "
+                "with its remaining jobs in use",
+                self.cachedir,
+                size,
+                max_size,
+            )
+        return removed
+
+    def sync(self, remove_incomplete: bool = False) -> int:
+        """
+        Bring the index in line with the cache directory.
+
+        Completed jobs missing from the index are added, and the others are
+        dropped from it.
+
+        :param remove_incomplete: Also remove the jobs that did not complete
+            successfully, unless they are running, and the blobs no longer linked.
+        :returns: The number of jobs removed.
+        """
+        connection = self._connect()
+        indexed = {key for (key,) in connection.execute("SELECT key FROM jobs")}
+        seen = set()
+        completed = set()
+        removed = 0
+        for name in os.listdir(self.cachedir):
+            key = name.removesuffix(".status")
+            if not _KEY_RE.match(key) or key in seen:
+                continue
+            seen.add(key)
+            jobcache = os.path.join(self.cachedir, key)
+            status = ""
+            if os.path.exists(f"{jobcache}.status"):
+                with open(f"{jobcache}.status") as status_file:
+                    status = status_file.read()
+            if status == "success" and os.path.isdir(jobcache):
+                completed.add(key)
+                if key not in indexed:
+                    self._index(key)
+            elif remove_incomplete and self.remove(key):
+                removed += 1
+        for key in indexed - completed:
+            self._drop(key)
+        if remove_incomplete and os.path.isdir(self.blobdir):
+            # blobs left behind by an interrupted cwltool
+            for root, _dirs, files in os.walk(self.blobdir):
+                for name in files:
+                    if os.lstat(os.path.join(root, name)).st_nlink == 1:
+                        with connection:
+                            self._remove_blob(connection, name)
+        return removed
+
+    def gc(self) -> int:
+        """
+        Remove the jobs that did not complete, then the least recently used ones if needed.
+
+        :returns: The number of jobs removed.
+        """
+        removed = self.sync(remove_incomplete=True)
+        if self.max_size is not None:
+            removed += self.evict(self.max_size)
+        return removed
+
+    def stats(self) -> CacheStats:
+        """Report on the jobs in the index."""
+        tools = [
+            ToolStats(*row)
+            for row in self._connect().execute(
+                "SELECT tool, COUNT(*), SUM(size), SUM(hits) FROM jobs "
+                "GROUP BY tool ORDER BY SUM(size) DESC"
+            )
+        ]
+        blobs, blob_size = (
+            self._connect().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+        )
+        return CacheStats(
+            self.cachedir,
+            sum(tool.entries for tool in tools),
+            sum(tool.size for tool in tools) + blob_size,
+            sum(tool.hits for tool in tools),
+            blobs,
+            blob_size,
+            tools,
+        )
@@ -46,6 +46,8 @@ from schema_salad.utils import (
 
 from . import CWL_CONTENT_TYPES, workflow
 from .argparser import arg_parser, generate_parser, get_default_args
+from .cache_backend import DirectoryCacheBackend, ObjectStoreCacheBackend, object_store
+from .checksum import use_database
 from .context import LoadingContext, RuntimeContext, getdefault
 from .cwlprov.ro import ResearchObject  # , WritableBagFile
 from .cwlprov.writablebagfile import (  # change this later
@@ -56,13 +58,20 @@ from .cwlprov.writablebagfile import (  # change this later
     packed_workflow,
 )
 from .cwlrdf import printdot, printrdf
+from .download import cache_directory
 from .errors import (
     ArgumentException,
     GraphTargetMissingException,
     UnsupportedRequirement,
     WorkflowException,
 )
-from .executors import JobExecutor, MultithreadedJobExecutor, SingleJobExecutor
+from .executors import (
+    CachePlanExecutor,
+    JobExecutor,
+    MultithreadedJobExecutor,
+    SingleJobExecutor,
+)
+from .job_cache import JobCache
 from .load_tool import (
     default_loader,
     fetch_document,
@@ -78,6 +87,7 @@ from .loghandler import _logger, configure_logging, defaultStreamHandler
 from .mpi import MpiConfig
 from .mutation import MutationManager
 from .pack import pack
+from .pathmapper import CompactPathMapper, PathMapper
 from .process import (
     CWL_IANA,
     Process,
@@ -1052,6 +1062,35 @@ def main(
             print("\n".join(supported_cwl_versions(args.enable_dev)), file=stdout)
             return 0
 
+        if args.cache_stats or args.cache_gc or args.cache_verify:
+            if not args.cachedir:
+                _logger.error("--cache-stats, --cache-gc and --cache-verify require a --cachedir")
+                return 1
+            job_cache = JobCache(os.path.abspath(args.cachedir), args.cache_max_size)
+            if args.cache_verify:
+                _logger.info(
+                    "Removed %d damaged job(s) from %s",
+                    job_cache.verify_all(checksums=args.cache_check != "size"),
+                    job_cache.cachedir,
+                )
+            if args.cache_gc:
+                _logger.info("Removed %d job(s) from %s", job_cache.gc(), job_cache.cachedir)
+            elif not args.cache_verify:
+                job_cache.sync()
+            if args.cache_stats:
+                stats = job_cache.stats()
+                print(
+                    json_dumps(
+                        {
+                            **stats._asdict(),
+                            "tools": [tool._asdict() for tool in stats.tools],
+                        },
+                        indent=4,
+                    ),
+                    file=stdout,
+                )
+            return 0
+
         if not args.workflow:
             if os.path.isfile("CWLFile"):
                 args.workflow = "CWLFile"
@@ -1251,21 +1290,54 @@ def main(
         if check_working_directories(runtimeContext) is not None:
             return 1
 
+        use_database(
+            os.path.join(
+                os.path.abspath(args.cachedir) if args.cachedir else cache_directory(),
+                "checksums.sqlite",
+            )
+            if args.checksum_cache
+            else None
+        )
+
         if args.cachedir:
             if args.move_outputs == "move":
                 runtimeContext.move_outputs = "copy"
             runtimeContext.tmp_outdir_prefix = os.path.abspath(args.cachedir) + "_tmp"
+            if args.cache_url:
+                try:
+                    store = object_store(args.cache_url)
+                except ValueError as err:
+                    _logger.error(str(err))
+                    return 1
+                runtimeContext.cache_backend = ObjectStoreCacheBackend(
+                    store,
+                    os.path.abspath(args.cachedir),
+                    args.cache_max_size,
+                    args.cache_deduplicate,
+                )
+            else:
+                runtimeContext.cache_backend = DirectoryCacheBackend(
+                    os.path.abspath(args.cachedir), args.cache_max_size, args.cache_deduplicate
+                )
+        elif args.cache_url or args.print_cache_plan:
+            _logger.error("--cache-url and --cache-plan require a --cachedir")
+            return 1
 
         runtimeContext.log_dir = args.log_dir
 
         runtimeContext.secret_store = getdefault(runtimeContext.secret_store, SecretStore())
         runtimeContext.make_fs_access = getdefault(runtimeContext.make_fs_access, StdFsAccess)
+        if args.compact_path_mapper and runtimeContext.path_mapper is PathMapper:
+            runtimeContext.path_mapper = CompactPathMapper
 
-        if not executor:
+        if args.print_cache_plan:
+            real_executor: JobExecutor = CachePlanExecutor()
+        elif not executor:
             if args.parallel:
                 temp_executor = MultithreadedJobExecutor(max_parallel=args.parallel_max)
                 runtimeContext.select_resources = temp_executor.select_resources
-                real_executor: JobExecutor = temp_executor
+                runtimeContext.can_allocate = temp_executor.can_allocate
+                real_executor = temp_executor
             else:
                 real_executor = SingleJobExecutor()
         else:
@@ -1331,6 +1403,9 @@ def main(
             out, status = real_executor(
                 tool, initialized_job_order_object, runtimeContext, logger=_logger
             )
+            if isinstance(real_executor, CachePlanExecutor):
+                print(json_dumps(real_executor.plan.report(), indent=4), file=stdout)
+                return 0 if status == "success" else 1
             if runtimeContext.validate_only is True:
                 return 0
 
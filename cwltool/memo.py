@@ -0,0 +1,233 @@
+"""
+Memoise the outputs of ExpressionTools and subworkflows in the job cache.
+
+Their outputs are cached as a ``cwl.output.json`` file, keyed on the
+process document and the job order, with ``--cache-subworkflows``. The Files
+they refer to are not copied: they are inputs, or outputs of CommandLineTools
+kept in the cache, so the outputs are only reused while all of their local
+Files still exist unchanged.
+"""
+
+import hashlib
+import json
+import os
+from collections.abc import Mapping, MutableSequence
+from typing import TYPE_CHECKING, Any
+
+from cwl_utils.types import CWLDirectoryType, CWLFileType, CWLObjectType
+from schema_salad.ref_resolver import uri_file_path
+from schema_salad.utils import json_dumps
+
+from .cache_backend import CacheBackend
+from .checksum import checksum_stream, stat_files
+from .loghandler import _logger
+from .utils import OutputCallbackType, visit_files, visit_files_directories
+
+if TYPE_CHECKING:
+    from .process import Process
+
+OUTPUTS_NAME = "cwl.output.json"
+
+
+def _collect_bases(document: Any, bases: set[str]) -> None:
+    if isinstance(document, Mapping):
+        identifier = document.get("id")
+        if isinstance(identifier, str):
+            base, sep, _fragment = identifier.partition("#")
+            if sep:
+                bases.add(base + sep)
+            elif identifier.startswith("_:"):
+                bases.add(identifier)
+        for value in document.values():
+            _collect_bases(value, bases)
+    elif isinstance(document, MutableSequence):
+        for value in document:
+            _collect_bases(value, bases)
+
+
+def _relative(document: Any, bases: list[tuple[str, str]]) -> Any:
+    if isinstance(document, Mapping):
+        return {key: _relative(value, bases) for key, value in document.items()}
+    if isinstance(document, MutableSequence):
+        return [_relative(value, bases) for value in document]
+    if isinstance(document, str):
+        for base, replacement in bases:
+            if base in document:
+                document = document.replace(base, replacement)
+    return document
+
+
+def process_document(process: "Process") -> Any:
+    """
+    Return the document of a process, with the processes run by its steps.
+
+    Identifiers are made relative to their document, so that the same
+    process loaded from elsewhere, or inline with a new blank node, has
+    the same document.
+
+    :returns: The document, or None if a process disables reuse.
+    """
+
+    def _embed(process: "Process") -> dict[str, Any] | None:
+        workReuse, _ = process.get_requirement("WorkReuse")
+        if workReuse and not workReuse.get("enableReuse", True):
+            return None
+        document: dict[str, Any] = dict(process.tool)
+        document["requirements"] = process.requirements
+        document["hints"] = process.hints
+        steps = getattr(process, "steps", None)
+        if steps is not None:
+            embedded: list[dict[str, Any]] = []
+            # steps are in a random order
+            for step in sorted(steps, key=lambda step: str(step.id)):
+                run = _embed(step.embedded_tool)
+                if run is None:
+                    return None
+                embedded.append(dict(step.tool, run=run))
+            document["steps"] = embedded
+        return document
+
+    document = _embed(process)
+    if document is None:
+        return None
+    found: set[str] = set()
+    _collect_bases(document, found)
+    bases = [
+        (base, "#" if base.endswith("#") else "_:") for base in sorted(found, key=len, reverse=True)
+    ]
+    return _relative(document, bases)
+
+
+def process_digest(process: "Process") -> str:
+    """
+    Return the digest of the document of a process, computed once.
+
+    :returns: The digest, or an empty string if the process cannot be memoised.
+    """
+    if process.memo_digest is None:
+        document = process_document(process)
+        if document is None:
+            process.memo_digest = ""
+        else:
+            process.memo_digest = hashlib.md5(  # nosec
+                json_dumps(document, separators=(",", ":"), sort_keys=True).encode("utf-8")
+            ).hexdigest()
+    return process.memo_digest
+
+
+def memo_key(
+    process: "Process", job_order: CWLObjectType, extra: Mapping[str, Any] | None = None
+) -> str | None:
+    """
+    Return the cache key of the outputs of a process for a job order.
+
+    Local Files are described by their size and either their checksum or
+    their modification time, as for the jobs of CommandLineTools.
+
+    :param extra: Anything else the outputs depend on.
+    :returns: The key, or None if the process cannot be memoised.
+    """
+    digest = process_digest(process)
+    if not digest:
+        return None
+    checksums: dict[str, str] = {}
+
+    def _local(fileobj: CWLFileType) -> None:
+        location = fileobj.get("location", "")
+        if location.startswith("file://"):
+            checksums.setdefault(uri_file_path(location), fileobj.get("checksum", ""))
+
+    visit_files(job_order, _local)
+    stats = stat_files(checksums)
+    files = {
+        path: [stats[path].st_size, checksum or int(stats[path].st_mtime * 1000)]
+        for path, checksum in checksums.items()
+    }
+    keydict = {"process": digest, "job": job_order, "files": files, "extra": extra or {}}
+    keydictstr = json_dumps(keydict, separators=(",", ":"), sort_keys=True)
+    return hashlib.md5(keydictstr.encode("utf-8")).hexdigest()  # nosec
+
+
+def lookup_outputs(
+    cache_backend: CacheBackend, key: str, checksums: bool = False
+) -> CWLObjectType | None:
+    """
+    Return the outputs memoised under ``key``, if all of their local Files are unchanged.
+
+    Files must exist with the size recorded in the outputs, as for
+    :py:meth:`cwltool.job_cache.JobCache.verify`.
+
+    :param checksums: Also compare the contents of the Files with their checksums.
+    """
+    entry = cache_backend.lookup(key)
+    if entry is None:
+        return None
+    try:
+        with open(os.path.join(cache_backend.fetch(entry), OUTPUTS_NAME), "rb") as f:
+            outputs: CWLObjectType = json.load(f)
+    except (OSError, ValueError) as err:
+        _logger.debug("Not using the outputs memoised under %s: %s", key, err)
+        return None
+    finally:
+        cache_backend.release(entry)
+    changed: list[str] = []
+
+    def _check(fileobj: CWLFileType | CWLDirectoryType) -> None:
+        location = fileobj.get("location", "")
+        if not location.startswith("file://"):
+            return
+        path = uri_file_path(location)
+        try:
+            st = os.stat(path)
+            if fileobj["class"] != "File":
+                return
+            if "size" in fileobj and st.st_size != fileobj["size"]:
+                changed.append(location)
+            elif checksums and "checksum" in fileobj:
+                with open(path, "rb") as f:
+                    if checksum_stream(f) != fileobj["checksum"]:
+                        changed.append(location)
+        except OSError:
+            changed.append(location)
+
+    visit_files_directories(outputs, _check)
+    if changed:
+        _logger.debug("Not using the outputs memoised under %s, %s changed", key, changed[0])
+        return None
+    return outputs
+
+
+def store_outputs(cache_backend: CacheBackend, key: str, tool: str, outputs: CWLObjectType) -> None:
+    """
+    Memoise the outputs of a process under ``key``.
+
+    The outputs are only written once computed, so that identical invocations
+    running at the same time do not wait for each other.
+    """
+    lease = cache_backend.lease(key)
+    status = "permanentFail"
+    try:
+        with open(os.path.join(lease.outdir, OUTPUTS_NAME), "w", encoding="utf-8") as f:
+            f.write(json_dumps(outputs, sort_keys=True))
+        status = "success"
+    except OSError as err:
+        _logger.warning("Could not cache the outputs of %s: %s", tool, err)
+    finally:
+        cache_backend.publish(lease, tool, status)
+
+
+def memoizing_callback(
+    cache_backend: CacheBackend,
+    key: str,
+    tool: str,
+    output_callback: OutputCallbackType | None,
+) -> OutputCallbackType:
+    """Wrap an output callback to memoise the outputs of successful invocations."""
+
+    def _callback(outputs: CWLObjectType | None, processStatus: str) -> None:
+        if processStatus == "success" and outputs is not None:
+            store_outputs(cache_backend, key, tool, outputs)
+        if output_callback is not None:
+            output_callback(outputs, processStatus)
+
+    return _callback
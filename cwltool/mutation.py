@@ -3,8 +3,10 @@
 from typing import Final, NamedTuple
 
 from cwl_utils.types import CWLDirectoryType, CWLFileType
+from schema_salad.ref_resolver import uri_file_path
 
 from .errors import WorkflowException
+from .pathmapper import symlink_cache
 
 
 class _MutationState(NamedTuple):
@@ -84,6 +86,8 @@ class MutationManager:
             )
 
         self.generations[loc] = _MutationState(current.generation + 1, current.readers, stepname)
+        if loc.startswith("file://"):
+            symlink_cache.invalidate(uri_file_path(loc))
 
     def set_generation(self, obj: CWLFileType) -> None:
         """Register a File for mutation tracking."""
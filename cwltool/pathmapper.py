@@ -1,10 +1,19 @@
 import logging
 import os
 import stat
+import threading
 import urllib
 import uuid
-from collections.abc import ItemsView, Iterable, Iterator, KeysView, MutableSequence
-from typing import NamedTuple, Optional, cast
+from array import array
+from collections import OrderedDict
+from collections.abc import (
+    ItemsView,
+    Iterator,
+    KeysView,
+    MutableMapping,
+    MutableSequence,
+)
+from typing import Any, NamedTuple, Optional, cast
 
 from cwl_utils.types import CWLDirectoryType, CWLFileType, is_directory
 from mypy_extensions import mypyc_attr
@@ -36,6 +45,377 @@ class MapperEnt(NamedTuple):
     """If the File has been staged yet."""
 
 
+@mypyc_attr(native_class=False)
+class _TargetIndexedMap(dict[str, MapperEnt]):
+    """A dictionary of mapper entries, also indexed by target."""
+
+    def __init__(self) -> None:
+        """Create an empty map."""
+        super().__init__()
+        # A target maps to its key, or to a set of keys if it is shared.
+        self._keys_by_target: dict[str, str | set[str]] = {}
+
+    def _index(self, key: str, target: str) -> None:
+        keys = self._keys_by_target.get(target)
+        if keys is None:
+            self._keys_by_target[target] = key
+        elif isinstance(keys, str):
+            self._keys_by_target[target] = {keys, key}
+        else:
+            keys.add(key)
+
+    def _unindex(self, key: str, target: str) -> None:
+        keys = self._keys_by_target[target]
+        if isinstance(keys, str):
+            del self._keys_by_target[target]
+            return
+        keys.discard(key)
+        if len(keys) == 1:
+            self._keys_by_target[target] = next(iter(keys))
+
+    def __setitem__(self, key: str, value: MapperEnt) -> None:
+        """Set an entry, updating the index."""
+        if key in self:
+            self._unindex(key, self[key][1])
+        super().__setitem__(key, value)
+        self._index(key, value[1])
+
+    def __delitem__(self, key: str) -> None:
+        """Remove an entry, updating the index."""
+        if key in self:
+            self._unindex(key, self[key][1])
+        super().__delitem__(key)
+
+    def pop(self, key: str, *default: MapperEnt) -> MapperEnt:  # type: ignore[override]
+        """Remove an entry and return it, updating the index."""
+        if key in self:
+            self._unindex(key, self[key][1])
+        return super().pop(key, *default)
+
+    def popitem(self) -> tuple[str, MapperEnt]:
+        """Remove the last entry and return it, updating the index."""
+        key, value = super().popitem()
+        self._unindex(key, value[1])
+        return key, value
+
+    def setdefault(self, key: str, default: MapperEnt) -> MapperEnt:
+        """Return an entry, setting it first if it is missing."""
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args: Any, **kwargs: MapperEnt) -> None:
+        """Set several entries, updating the index."""
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        super().clear()
+        self._keys_by_target.clear()
+
+    def key_for_target(self, target: str) -> str | None:
+        """Return the first key mapped to the given target, if any."""
+        keys = self._keys_by_target.get(target)
+        if keys is None or isinstance(keys, str):
+            return keys
+        return next(key for key in self if key in keys)
+
+
+class _ResolvedLink(NamedTuple):
+    hops: tuple[tuple[str, int, int], ...]
+    """The path, inode and modification time of each link of the chain."""
+    resolved: str
+
+
+def _within(path: str, targets: set[str]) -> bool:
+    """Whether ``path`` is one of ``targets``, or below one of them."""
+    while path not in targets:
+        parent = os.path.dirname(path)
+        if parent == path:
+            return False
+        path = parent
+    return True
+
+
+class SymlinkCache:
+    """
+    A size-bounded cache of the files symbolic links resolve to.
+
+    Entries are keyed by the path of the link, and only used while every link
+    of the chain has the same inode and modification time, so a cached
+    resolution costs an ``lstat`` for each link instead of an ``lstat`` and a
+    ``readlink`` for each link, and an ``lstat`` of the file. It is shared by
+    the path mappers of all the jobs in a run; cwltool invalidates it when it
+    moves, removes or updates files in place.
+    """
+
+    def __init__(self, maxsize: int = 100_000) -> None:
+        """Create an empty cache holding up to ``maxsize`` links."""
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.calls_saved = 0
+        self._links: OrderedDict[str, _ResolvedLink] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def resolve(self, path: str) -> str:
+        """Return the path of the file ``path`` is, or links to."""
+        st = os.lstat(path)
+        if not stat.S_ISLNK(st.st_mode):
+            return path
+        with self._lock:
+            link = self._links.get(path)
+        if link is not None and self._unchanged(link, st):
+            with self._lock:
+                if path in self._links:
+                    self._links.move_to_end(path)
+                self.hits += 1
+                # a readlink for each link, and the lstat of the file
+                self.calls_saved += len(link.hops) + 1
+            return link.resolved
+        deref = path
+        hops: list[tuple[str, int, int]] = []
+        while stat.S_ISLNK(st.st_mode):
+            hops.append((deref, st.st_ino, st.st_mtime_ns))
+            rl = os.readlink(deref)
+            deref = rl if os.path.isabs(rl) else os.path.join(os.path.dirname(deref), rl)
+            st = os.lstat(deref)
+        with self._lock:
+            self.misses += 1
+            self._links[path] = _ResolvedLink(tuple(hops), deref)
+            self._links.move_to_end(path)
+            while len(self._links) > self.maxsize:
+                self._links.popitem(last=False)
+        return deref
+
+    @staticmethod
+    def _unchanged(link: _ResolvedLink, st: os.stat_result) -> bool:
+        """Whether no link of a cached chain changed, ``st`` being that of the first."""
+        for index, (hop, inode, mtime_ns) in enumerate(link.hops):
+            if index:
+                try:
+                    st = os.lstat(hop)
+                except OSError:
+                    return False
+            if (st.st_ino, st.st_mtime_ns) != (inode, mtime_ns) or not stat.S_ISLNK(st.st_mode):
+                return False
+        return True
+
+    def invalidate(self, *paths: str) -> None:
+        """
+        Forget the links at, below, or resolving through any of ``paths``.
+
+        The cache is scanned once for all of them, so callers moving or
+        removing many files invalidate them together.
+        """
+        if not paths:
+            return
+        targets = {path.rstrip("/") or "/" for path in paths}
+        with self._lock:
+            for link_path, link in list(self._links.items()):
+                if _within(link_path, targets) or _within(link.resolved, targets):
+                    del self._links[link_path]
+
+    def clear(self) -> None:
+        """Forget all links."""
+        with self._lock:
+            self._links.clear()
+
+    def __str__(self) -> str:
+        """Summarise the use of the cache."""
+        return "{} symbolic links resolved from cache, {} resolved, {} system calls saved".format(
+            self.hits, self.misses, self.calls_saved
+        )
+
+
+symlink_cache = SymlinkCache()
+"""The cache of symbolic links shared by all path mappers."""
+
+
+_TYPES: tuple[str | None, ...] = (
+    "File",
+    "Directory",
+    "WritableFile",
+    "WritableDirectory",
+    "CreateFile",
+    "CreateWritableFile",
+    None,
+)
+_TYPE_CODES = {ctype: code for code, ctype in enumerate(_TYPES)}
+_STAGED: tuple[bool | None, ...] = (False, True, None)
+_DEAD = 2**32 - 1
+
+
+def _split(path: str) -> tuple[str, str]:
+    """Split a path after its last slash, so that the parts join back to it."""
+    head, sep, tail = path.rpartition("/")
+    return head + sep, tail
+
+
+class _CompactPathMap(MutableMapping[str, MapperEnt]):
+    """
+    A mapping of mapper entries stored in arrays, with shared path prefixes.
+
+    Keys, resolved paths, and targets are split after their last slash. The
+    directory parts are stored once in a table of prefixes, and the entries
+    as columns of prefix numbers and file names, so that the entries of a
+    large directory listing share most of their storage. Entries are
+    rebuilt as :py:class:`MapperEnt` tuples when read.
+    """
+
+    def __init__(self) -> None:
+        """Create an empty map."""
+        self._prefixes: list[str] = []
+        self._prefix_ids: dict[str, int] = {}
+        # Columns, one row per entry ever set; removed rows are marked _DEAD
+        self._key_prefix = array("I")
+        self._key_name: list[str] = []
+        self._resolved_prefix = array("I")
+        self._resolved_name: list[str] = []
+        self._target_prefix = array("I")
+        self._target_name: list[str] = []
+        self._kind = array("B")
+        # For each key prefix, the row of each key name
+        self._rows: dict[int, dict[str, int]] = {}
+        # For each target prefix, the first row of each target name
+        self._target_rows: dict[int, dict[str, int]] = {}
+        self._shared_targets: dict[tuple[int, str], int] = {}
+        self._len = 0
+
+    def _prefix_id(self, prefix: str) -> int:
+        prefix_id = self._prefix_ids.get(prefix)
+        if prefix_id is None:
+            prefix_id = self._prefix_ids[prefix] = len(self._prefixes)
+            self._prefixes.append(prefix)
+        return prefix_id
+
+    def _row(self, key: str) -> int | None:
+        prefix, name = _split(key)
+        prefix_id = self._prefix_ids.get(prefix)
+        if prefix_id is None:
+            return None
+        return self._rows.get(prefix_id, {}).get(name)
+
+    def _entry(self, row: int) -> MapperEnt:
+        kind = self._kind[row]
+        return MapperEnt(
+            self._prefixes[self._resolved_prefix[row]] + self._resolved_name[row],
+            self._prefixes[self._target_prefix[row]] + self._target_name[row],
+            _TYPES[kind // len(_STAGED)],
+            _STAGED[kind % len(_STAGED)],
+        )
+
+    def _index_target(self, row: int) -> None:
+        target = (self._target_prefix[row], self._target_name[row])
+        rows = self._target_rows.setdefault(target[0], {})
+        first = rows.get(target[1])
+        if first is None:
+            rows[target[1]] = row
+            return
+        self._shared_targets[target] = self._shared_targets.get(target, 0) + 1
+        rows[target[1]] = min(first, row)
+
+    def _unindex_target(self, row: int) -> None:
+        target = (self._target_prefix[row], self._target_name[row])
+        rows = self._target_rows[target[0]]
+        shared = self._shared_targets.pop(target, 0)
+        if not shared:
+            del rows[target[1]]
+            return
+        if shared > 1:
+            self._shared_targets[target] = shared - 1
+        if rows[target[1]] == row:
+            rows[target[1]] = next(
+                other
+                for other in range(row + 1, len(self._kind))
+                if self._key_prefix[other] != _DEAD
+                and (self._target_prefix[other], self._target_name[other]) == target
+            )
+
+    def __getitem__(self, key: str) -> MapperEnt:
+        """Return the entry of a key."""
+        row = self._row(key)
+        if row is None:
+            raise KeyError(key)
+        return self._entry(row)
+
+    def __contains__(self, key: object) -> bool:
+        """Test for the presence of a key."""
+        return isinstance(key, str) and self._row(key) is not None
+
+    def __setitem__(self, key: str, value: MapperEnt) -> None:
+        """Set the entry of a key."""
+        resolved, target, ctype, staged = value
+        if ctype is not None and ctype.startswith("Create"):
+            # the resolved value holds the contents of the file
+            resolved_prefix, resolved_name = "", resolved
+        else:
+            resolved_prefix, resolved_name = _split(resolved)
+        target_prefix, target_name = _split(target)
+        # Share the name strings, which are often equal
+        if target_name == resolved_name:
+            target_name = resolved_name
+        kind = _TYPE_CODES[ctype] * len(_STAGED) + _STAGED.index(staged)
+
+        row = self._row(key)
+        if row is None:
+            key_prefix, key_name = _split(key)
+            if key_name == resolved_name:
+                key_name = resolved_name
+            row = len(self._kind)
+            key_prefix_id = self._prefix_id(key_prefix)
+            self._rows.setdefault(key_prefix_id, {})[key_name] = row
+            self._key_prefix.append(key_prefix_id)
+            self._key_name.append(key_name)
+            self._resolved_prefix.append(self._prefix_id(resolved_prefix))
+            self._resolved_name.append(resolved_name)
+            self._target_prefix.append(self._prefix_id(target_prefix))
+            self._target_name.append(target_name)
+            self._kind.append(kind)
+            self._len += 1
+        else:
+            self._unindex_target(row)
+            self._resolved_prefix[row] = self._prefix_id(resolved_prefix)
+            self._resolved_name[row] = resolved_name
+            self._target_prefix[row] = self._prefix_id(target_prefix)
+            self._target_name[row] = target_name
+            self._kind[row] = kind
+        self._index_target(row)
+
+    def __delitem__(self, key: str) -> None:
+        """Remove the entry of a key."""
+        row = self._row(key)
+        if row is None:
+            raise KeyError(key)
+        self._unindex_target(row)
+        del self._rows[self._key_prefix[row]][self._key_name[row]]
+        self._key_prefix[row] = _DEAD
+        self._key_name[row] = self._resolved_name[row] = self._target_name[row] = ""
+        self._len -= 1
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over the keys, in the order they were first set."""
+        for row, prefix_id in enumerate(self._key_prefix):
+            if prefix_id != _DEAD:
+                yield self._prefixes[prefix_id] + self._key_name[row]
+
+    def __len__(self) -> int:
+        """Return the number of entries."""
+        return self._len
+
+    def key_for_target(self, target: str) -> str | None:
+        """Return the first key mapped to the given target, if any."""
+        prefix, name = _split(target)
+        prefix_id = self._prefix_ids.get(prefix)
+        if prefix_id is None:
+            return None
+        row = self._target_rows.get(prefix_id, {}).get(name)
+        if row is None:
+            return None
+        return self._prefixes[self._key_prefix[row]] + self._key_name[row]
+
+
 @mypyc_attr(allow_interpreted_subclasses=True)
 class PathMapper:
     """
@@ -82,11 +462,15 @@ class PathMapper:
         separateDirs: bool = True,
     ) -> None:
         """Initialize the PathMapper."""
-        self._pathmap: dict[str, MapperEnt] = {}
+        self._pathmap: MutableMapping[str, MapperEnt] = self._new_map()
         self.stagedir = stagedir
         self.separateDirs = separateDirs
         self.setup(dedup(referenced_files), basedir)
 
+    def _new_map(self) -> MutableMapping[str, MapperEnt]:
+        """Return the empty mapping to store the entries in."""
+        return _TargetIndexedMap()
+
     def visitlisting(
         self,
         listing: MutableSequence[CWLFileType | CWLDirectoryType],
@@ -158,16 +542,7 @@ class PathMapper:
                     if urllib.parse.urlsplit(deref).scheme in ["http", "https"]:
                         deref, _last_modified = downloadHttpFile(path)
                     else:
-                        # Dereference symbolic links
-                        st = os.lstat(deref)
-                        while stat.S_ISLNK(st.st_mode):
-                            rl = os.readlink(deref)
-                            deref = (
-                                rl
-                                if os.path.isabs(rl)
-                                else os.path.join(os.path.dirname(deref), rl)
-                            )
-                            st = os.lstat(deref)
+                        deref = symlink_cache.resolve(deref)
 
                     self._pathmap[path] = MapperEnt(
                         deref, tgt, "WritableFile" if copy else "File", staged
@@ -206,7 +581,39 @@ class PathMapper:
             i = src.index("#")
             p = self._pathmap[src[:i]]
             return MapperEnt(p.resolved, p.target + src[i:], p.type, p.staged)
-        return self._pathmap[src]
+        try:
+            return self._pathmap[src]
+        except KeyError:
+            child = self._child_entry(src)
+            if child is None:
+                raise
+            return child
+
+    def _child_entry(self, location: str) -> MapperEnt | None:
+        """
+        Return the entry of a location inside a mapped Directory.
+
+        Directories are mapped as a single entry when their listing is not
+        loaded; the entries of their contents are derived when needed.
+        """
+        parent = location
+        while len(parent) > 1:
+            parent = os.path.dirname(parent)
+            if parent in self._pathmap:
+                return self._derive_child(parent, location[len(parent) :].lstrip("/"))
+        return None
+
+    def _derive_child(self, parent: str, relative: str) -> MapperEnt | None:
+        entry = self._pathmap[parent]
+        if entry.type not in ("Directory", "WritableDirectory") or parent.startswith("_:"):
+            return None
+        if parent.startswith("file://"):
+            relative = urllib.parse.unquote(relative)
+        resolved = os.path.join(entry.resolved, relative)
+        ctype = "Directory" if os.path.isdir(resolved) else "File"
+        if entry.type == "WritableDirectory":
+            ctype = "Writable" + ctype
+        return MapperEnt(resolved, os.path.join(entry.target, relative), ctype, False)
 
     def files(self) -> KeysView[str]:
         """Return a dictionary keys view of locations."""
@@ -218,16 +625,30 @@ class PathMapper:
 
     def items_exclude_children(self) -> ItemsView[str, MapperEnt]:
         """Return a dictionary items view minus any entries which are children of other entries."""
-        newitems = {}
+        # Whether a path, or one of its parents, is an entry; shared between siblings.
+        covered: dict[str, bool] = {}
 
-        def parents(path: str) -> Iterable[str]:
-            result = path
-            while len(result) > 1:
-                result = os.path.dirname(result)
-                yield result
+        def is_covered(path: str) -> bool:
+            chain = []
+            result = False
+            while True:
+                if path in covered:
+                    result = covered[path]
+                    break
+                if path in self._pathmap:
+                    result = True
+                    break
+                chain.append(path)
+                if len(path) <= 1:
+                    break
+                path = os.path.dirname(path)
+            for parent in chain:
+                covered[parent] = result
+            return result
 
+        newitems = {}
         for key, entry in self.items():
-            if not self.files().isdisjoint(parents(key)):
+            if len(key) > 1 and is_covered(os.path.dirname(key)):
                 continue
             newitems[key] = entry
         return newitems.items()
@@ -237,9 +658,30 @@ class PathMapper:
         target: str,
     ) -> tuple[str, str] | None:
         """Find the (source, resolved_path) for the given target, if any."""
+        key = self._key_for_target(target)
+        if key is not None:
+            return (key, self._pathmap[key][0])
+        # The target may be inside a Directory mapped without its listing
+        parent = target
+        while len(parent) > 1:
+            parent = os.path.dirname(parent)
+            key = self._key_for_target(parent)
+            if key is not None:
+                relative = target[len(parent) :].lstrip("/")
+                child = self._derive_child(key, relative)
+                if child is None:
+                    return None
+                if key.startswith("file://"):
+                    relative = urllib.parse.quote(relative)
+                return (key + "/" + relative, child.resolved)
+        return None
+
+    def _key_for_target(self, target: str) -> str | None:
+        if isinstance(self._pathmap, (_TargetIndexedMap, _CompactPathMap)):
+            return self._pathmap.key_for_target(target)
         for k, v in self._pathmap.items():
             if v[1] == target:
-                return (k, v[0])
+                return k
         return None
 
     def update(
@@ -257,3 +699,17 @@ class PathMapper:
     def __iter__(self) -> Iterator[MapperEnt]:
         """Get iterator for the maps."""
         return self._pathmap.values().__iter__()
+
+
+@mypyc_attr(allow_interpreted_subclasses=True)
+class CompactPathMapper(PathMapper):
+    """
+    A :py:class:`PathMapper` that stores its entries compactly.
+
+    Use it for inputs with very many files, such as large directory
+    listings: entries sharing a directory share the storage of its path.
+    """
+
+    def _new_map(self) -> MutableMapping[str, MapperEnt]:
+        """Return the empty mapping to store the entries in."""
+        return _CompactPathMap()
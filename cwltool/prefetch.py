@@ -0,0 +1,118 @@
+"""Retrieve the software container images of a workflow ahead of its jobs."""
+
+import copy
+import shutil
+from collections.abc import MutableMapping, MutableSequence
+from concurrent.futures import ThreadPoolExecutor
+from typing import cast
+
+from ruamel.yaml.comments import CommentedMap
+from schema_salad.utils import json_dumps
+
+from . import docker, singularity_cache
+from .context import RuntimeContext
+from .loghandler import _logger
+from .process import Process
+from .singularity import SingularityCommandLineJob
+
+#: Images pulled or built concurrently; each one is already bandwidth or
+#: CPU heavy, so only a few run at once.
+MAX_PREFETCH_WORKERS = 4
+
+
+def collect_docker_requirements(process: Process) -> list[dict[str, str]]:
+    """
+    Return the distinct DockerRequirements of a process and its embedded processes.
+
+    Both ``requirements`` and ``hints`` are considered, as are any requirements
+    added to the top level process (e.g. via ``cwl:requirements`` in the job
+    order). The order of first appearance is preserved.
+    """
+    found: dict[str, dict[str, str]] = {}
+
+    def _add(reqs: object) -> None:
+        if not isinstance(reqs, MutableSequence):
+            return
+        for req in reqs:
+            if isinstance(req, MutableMapping) and req.get("class") == "DockerRequirement":
+                found.setdefault(json_dumps(req, sort_keys=True), cast(dict[str, str], req))
+
+    def _visit(tool: CommentedMap) -> None:
+        _add(tool.get("requirements"))
+        _add(tool.get("hints"))
+
+    _add(process.requirements)
+    _add(process.hints)
+    process.visit(_visit)
+    return list(found.values())
+
+
+def _fetch(docker_requirement: dict[str, str], runtime_context: RuntimeContext) -> None:
+    try:
+        if runtime_context.singularity:
+            found = SingularityCommandLineJob.get_image(
+                docker_requirement,
+                runtime_context.pull_image,
+                runtime_context.tmp_outdir_prefix,
+                runtime_context.force_docker_pull,
+                sandbox_base_path=runtime_context.image_base_path,
+            )
+            if found:
+                # the jobs hold the image while they use it
+                singularity_cache.release_image(docker_requirement["dockerImageId"])
+        else:
+            found = docker.get_image(
+                "podman" if runtime_context.podman else "docker",
+                docker_requirement,
+                runtime_context.pull_image,
+                runtime_context.force_docker_pull,
+                runtime_context.tmp_outdir_prefix,
+            )
+        if not found:
+            _logger.warning("[prefetch] Container image not found for %s", docker_requirement)
+    except Exception as err:
+        # The job that needs this image will retry and report the failure.
+        _logger.warning("[prefetch] Unable to retrieve %s: %s", docker_requirement, err)
+
+
+def prefetch_images(process: Process, runtime_context: RuntimeContext) -> ThreadPoolExecutor | None:
+    """
+    Start retrieving all the container images needed by the process.
+
+    Each distinct image is fetched once, in parallel with the others and with
+    the execution of the workflow. Jobs that need an image still being fetched
+    wait for it through the per-image locks in :py:mod:`cwltool.docker` and
+    :py:mod:`cwltool.singularity`.
+
+    :returns: The executor running the retrievals (to be shut down by the
+              caller), or None if there was nothing to fetch.
+    """
+    if not runtime_context.use_container or runtime_context.user_space_docker_cmd:
+        return None
+    if runtime_context.singularity:
+        engine = "singularity"
+    elif runtime_context.podman:
+        engine = "podman"
+    else:
+        engine = "docker"
+    if not shutil.which(engine):
+        _logger.debug("[prefetch] %s executable is not available, skipping.", engine)
+        return None
+
+    requirements = collect_docker_requirements(process)
+    if runtime_context.default_container:
+        requirements.append(
+            {"class": "DockerRequirement", "dockerPull": runtime_context.default_container}
+        )
+    if not requirements:
+        return None
+
+    _logger.info("[prefetch] Retrieving %d container image(s)", len(requirements))
+    pool = ThreadPoolExecutor(
+        max_workers=min(MAX_PREFETCH_WORKERS, len(requirements)),
+        thread_name_prefix="cwltool-prefetch",
+    )
+    for req in requirements:
+        # get_image() mutates the requirement, so hand it a private copy.
+        pool.submit(_fetch, copy.deepcopy(dict(req)), runtime_context)
+    return pool
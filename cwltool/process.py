@@ -3,7 +3,6 @@
 import abc
 import copy
 import functools
-import hashlib
 import json
 import logging
 import math
@@ -11,6 +10,7 @@ import os
 import shutil
 import stat
 import textwrap
+import time
 import urllib.parse
 import uuid
 from collections.abc import (
@@ -54,12 +54,21 @@ from schema_salad.utils import convert_to_dict
 from schema_salad.validate import avro_type_name, validate_ex
 
 from .builder import INPUT_OBJ_VOCAB, Builder
+from .checksum import checksum_file, checksum_files, mentions_checksum
 from .context import LoadingContext, RuntimeContext, getdefault
 from .errors import UnsupportedRequirement, WorkflowException
 from .loghandler import _logger
 from .mpi import MPIRequirementName
-from .pathmapper import MapperEnt, PathMapper
+from .pathmapper import MapperEnt, PathMapper, symlink_cache
+from .relocate import EarlyRelocator
 from .secrets import SecretStore
+from .staging import (
+    StagingStats,
+    copy_file,
+    copy_tree,
+    copy_with_checksum,
+    run_operations,
+)
 from .stdfsaccess import StdFsAccess
 from .update import INTERNAL_VERSION, ORDERED_VERSIONS, ORIGINAL_CWLVERSION
 from .utils import (
@@ -124,6 +133,7 @@ supportedProcessRequirements = [
     "http://commonwl.org/cwltool#InplaceUpdateRequirement",
     "http://commonwl.org/cwltool#CUDARequirement",
     "http://commonwl.org/cwltool#ShmSize",
+    "http://commonwl.org/cwltool#CacheKey",
 ]
 
 cwl_files = (
@@ -230,6 +240,45 @@ def shortname(inputid: str) -> str:
     return d.path.split("/")[-1]
 
 
+def _staging_waves(
+    entries: list[tuple[str, MapperEnt]],
+) -> list[list[tuple[str, MapperEnt]]]:
+    """Group entries so that each is staged after the entries containing its target."""
+    targets = {entry.target for _key, entry in entries}
+    waves: dict[int, list[tuple[str, MapperEnt]]] = {}
+    for key, entry in entries:
+        depth = 0
+        parent = os.path.dirname(entry.target)
+        while parent != os.path.dirname(parent):
+            depth += parent in targets
+            parent = os.path.dirname(parent)
+        waves.setdefault(depth, []).append((key, entry))
+    return [waves[depth] for depth in sorted(waves)]
+
+
+def _symlink(src: str, dst: str, stats: StagingStats) -> None:
+    os.symlink(src, dst)
+    stats.record("symlink")
+
+
+def _copy_writable(src: str, dst: str, stats: StagingStats) -> None:
+    copy_file(src, dst, stats)
+    ensure_writable(dst)
+
+
+def _create_file(entry: MapperEnt, stats: StagingStats, secret_store: SecretStore | None) -> None:
+    with open(entry.target, "w") as new:
+        if secret_store is not None:
+            new.write(cast(str, secret_store.retrieve(entry.resolved)))
+        else:
+            new.write(entry.resolved)
+    if entry.type == "CreateFile":
+        os.chmod(entry.target, stat.S_IRUSR)  # Read only
+    else:  # it is a "CreateWritableFile"
+        ensure_writable(entry.target)
+    stats.record("create")
+
+
 def stage_files(
     pathmapper: PathMapper,
     stage_func: Callable[[str, str], None] | None = None,
@@ -237,10 +286,16 @@ def stage_files(
     symlink: bool = True,
     secret_store: SecretStore | None = None,
     fix_conflicts: bool = False,
-) -> None:
+    stats: StagingStats | None = None,
+) -> StagingStats:
     """
     Link or copy files to their targets. Create them as needed.
 
+    Entries are staged concurrently, each after the entries containing its
+    target. Writable copies are copy-on-write clones where the filesystem
+    allows. ``stage_func`` is called in order, from the calling thread.
+
+    :returns: The operations run, added to ``stats`` if given.
     :raises WorkflowException: if there is a file staging conflict
     """
     items = pathmapper.items() if not symlink else pathmapper.items_exclude_children()
@@ -266,42 +321,58 @@ def stage_files(
                     "File staging conflict, trying to stage both %s and %s to the same target %s"
                     % (targets[entry.target].resolved, entry.resolved, entry.target)
                 )
+    if stats is None:
+        stats = StagingStats()
+    start = time.perf_counter()
     # refresh the items, since we may have updated the pathmapper due to file name clashes
     items = pathmapper.items() if not symlink else pathmapper.items_exclude_children()
-    for key, entry in list(items):
-        if not entry.staged:
-            continue
-        if not os.path.exists(os.path.dirname(entry.target)):
-            os.makedirs(os.path.dirname(entry.target))
-        match entry.type:
-            case "File" | "Directory" if os.path.exists(entry.resolved) and symlink:
-                os.symlink(entry.resolved, entry.target)  # Use symlink func if allowed
-            case "File" | "Directory" if os.path.exists(entry.resolved) and stage_func is not None:
-                stage_func(entry.resolved, entry.target)
-            case "Directory" if not os.path.exists(entry.target) and entry.resolved.startswith(
-                "_:"
-            ):
-                os.makedirs(entry.target)
-            case "WritableFile" if not ignore_writable:
-                shutil.copy(entry.resolved, entry.target)
-                ensure_writable(entry.target)
-            case "WritableDirectory" if not ignore_writable:
-                if entry.resolved.startswith("_:"):
+    for wave in _staging_waves([(key, entry) for key, entry in items if entry.staged]):
+        operations: list[Callable[[], None]] = []
+        finish: list[Callable[[], Any]] = []
+        for key, entry in wave:
+            os.makedirs(os.path.dirname(entry.target), exist_ok=True)
+            match entry.type:
+                case "File" | "Directory" if os.path.exists(entry.resolved) and symlink:
+                    operations.append(
+                        functools.partial(_symlink, entry.resolved, entry.target, stats)
+                    )
+                case "File" | "Directory" if (
+                    os.path.exists(entry.resolved) and stage_func is not None
+                ):
+                    stage_func(entry.resolved, entry.target)
+                case "Directory" if not os.path.exists(entry.target) and entry.resolved.startswith(
+                    "_:"
+                ):
                     os.makedirs(entry.target)
-                else:
-                    shutil.copytree(entry.resolved, entry.target)
-                    ensure_writable(entry.target, include_root=True)
-            case "CreateFile" | "CreateWritableFile" as etype:
-                with open(entry.target, "w") as new:
-                    if secret_store is not None:
-                        new.write(cast(str, secret_store.retrieve(entry.resolved)))
+                case "WritableFile" if not ignore_writable:
+                    operations.append(
+                        functools.partial(_copy_writable, entry.resolved, entry.target, stats)
+                    )
+                case "WritableDirectory" if not ignore_writable:
+                    if entry.resolved.startswith("_:"):
+                        os.makedirs(entry.target)
                     else:
-                        new.write(entry.resolved)
-                if etype == "CreateFile":
-                    os.chmod(entry.target, stat.S_IRUSR)  # Read only
-                else:  # it is a "CreateWritableFile"
-                    ensure_writable(entry.target)
-                pathmapper.update(key, entry.target, entry.target, entry.type, entry.staged)
+                        operations.extend(copy_tree(entry.resolved, entry.target, stats))
+                        finish.append(
+                            functools.partial(ensure_writable, entry.target, include_root=True)
+                        )
+                case "CreateFile" | "CreateWritableFile":
+                    operations.append(functools.partial(_create_file, entry, stats, secret_store))
+                    finish.append(
+                        functools.partial(
+                            pathmapper.update,
+                            key,
+                            entry.target,
+                            entry.target,
+                            entry.type,
+                            entry.staged,
+                        )
+                    )
+        run_operations(operations)
+        for step in finish:
+            step()
+    stats.seconds += time.perf_counter() - start
+    return stats
 
 
 def relocateOutputs(
@@ -312,10 +383,16 @@ def relocateOutputs(
     fs_access: StdFsAccess,
     compute_checksum: bool = True,
     path_mapper: type[PathMapper] = PathMapper,
+    relocator: EarlyRelocator | None = None,
 ) -> CWLObjectType:
     adjustDirObjs(outputObj, functools.partial(get_listing, fs_access, recursive=True))
 
     if action not in ("move", "copy"):
+        if compute_checksum:
+            # outputs left in place may still lack the checksums deferred by --lazy-checksum
+            fileobjs: list[CWLFileType] = []
+            visit_files(outputObj, fileobjs.append)
+            checksum_files(fs_access, fileobjs)
         return outputObj
 
     def _collectDirEntries(
@@ -331,18 +408,37 @@ def relocateOutputs(
             for sub_obj in obj:
                 yield from _collectDirEntries(sub_obj)
 
+    # Checksums of the files copied, the directories copied whole, and the paths moved
+    checksums: dict[str, str] = {}
+    copied: dict[str, str] = {}
+    moved: list[str] = []
+    # Files with a checksum already, not hashed again while copied
+    hashed: set[str] = set()
+    copy_function: Callable[[str, str], object] = shutil.copy2
+    if compute_checksum:
+        copy_function = functools.partial(copy_with_checksum, checksums=checksums, hashed=hashed)
+
     def _relocate(src: str, dst: str) -> None:
         src = fs_access.realpath(src)
         dst = fs_access.realpath(dst)
 
         if src == dst:
             return
+        for copied_src, copied_dst in copied.items():
+            if src.startswith(copied_src + os.sep) and dst == copied_dst + src[len(copied_src) :]:
+                # already copied with its directory
+                return
 
         # If the source is not contained in source_directories we're not allowed to delete it
         src_can_deleted = any(os.path.commonprefix([p, src]) == p for p in source_directories)
 
         _action = "move" if action == "move" and src_can_deleted else "copy"
 
+        if relocator is not None and relocator.take(src, dst, _action == "move"):
+            if _action == "move":
+                moved.append(src)
+            return
+
         if _action == "move":
             _logger.debug("Moving %s to %s", src, dst)
             if fs_access.isdir(src) and fs_access.isdir(dst):
@@ -350,7 +446,8 @@ def relocateOutputs(
                 for dir_entry in scandir(src):
                     _relocate(dir_entry.path, fs_access.join(dst, dir_entry.name))
             else:
-                shutil.move(src, dst)
+                shutil.move(src, dst, copy_function=copy_function)
+                moved.append(src)
 
         elif _action == "copy":
             _logger.debug("Copying %s to %s", src, dst)
@@ -359,9 +456,10 @@ def relocateOutputs(
                     shutil.rmtree(dst)
                 elif os.path.isfile(dst):
                     os.unlink(dst)
-                shutil.copytree(src, dst)
+                shutil.copytree(src, dst, copy_function=copy_function)
+                copied[src] = dst
             else:
-                shutil.copy2(src, dst)
+                copy_function(src, dst)
 
     def _realpath(
         ob: CWLFileType | CWLDirectoryType,
@@ -376,8 +474,15 @@ def relocateOutputs(
 
     outfiles = list(_collectDirEntries(outputObj))
     visit_files_directories(outfiles, _realpath)
+
+    def _hashed(fileobj: CWLFileType) -> None:
+        if "checksum" in fileobj and fileobj["location"].startswith("file://"):
+            hashed.add(uri_file_path(fileobj["location"]))
+
+    visit_files(outfiles, _hashed)
     pm = path_mapper(outfiles, "", destination_path, separateDirs=False)
     stage_files(pm, stage_func=_relocate, symlink=False, fix_conflicts=True)
+    symlink_cache.invalidate(*moved)
 
     def _check_adjust(a_file: CWLFileType | CWLDirectoryType) -> CWLFileType | CWLDirectoryType:
         a_file["location"] = file_uri(pm.mapper(a_file["location"])[1])
@@ -388,15 +493,33 @@ def relocateOutputs(
     visit_files_directories(outputObj, _check_adjust)
 
     if compute_checksum:
-        visit_files(outputObj, functools.partial(compute_checksums, fs_access))
+        if relocator is not None:
+            checksums.update(relocator.checksums)
+
+        fileobjs = []
+
+        def _checksum(fileobj: CWLFileType) -> None:
+            location = fileobj["location"]
+            if "checksum" not in fileobj and location.startswith("file://"):
+                checksum = checksums.get(os.path.realpath(uri_file_path(location)))
+                if checksum is not None:
+                    fileobj["checksum"] = checksum
+                    fileobj["size"] = fs_access.size(location)
+            fileobjs.append(fileobj)
+
+        visit_files(outputObj, _checksum)
+        checksum_files(fs_access, fileobjs)
     return outputObj
 
 
 def cleanIntermediate(output_dirs: Iterable[str]) -> None:
+    removed: list[str] = []
     for a in output_dirs:
         if os.path.exists(a):
             _logger.debug("Removing intermediate output directory %s", a)
             shutil.rmtree(a, True)
+            removed.append(a)
+    symlink_cache.invalidate(*removed)
 
 
 def add_sizes(fsaccess: StdFsAccess, obj: CWLObjectType) -> None:
@@ -614,6 +737,10 @@ class Process(HasReqsHints, metaclass=abc.ABCMeta):
         # Versions of requirements and hints which aren't mutated.
         self.original_requirements = copy.deepcopy(self.requirements)
         self.original_hints = copy.deepcopy(self.hints)
+        # Whether the expressions of this process may read the checksum of a File
+        self.reads_checksums = mentions_checksum([self.tool, self.requirements, self.hints])
+        # The digest of this document in the keys of memoised outputs, see cwltool.memo
+        self.memo_digest: str | None = None
         self.doc_loader = loadingContext.loader
         self.doc_schema = loadingContext.avsc_names
 
@@ -763,6 +890,80 @@ class Process(HasReqsHints, metaclass=abc.ABCMeta):
         else:
             var_spool_cwl_detector(self.tool)
 
+    def _builder_dirs(
+        self, runtime_context: RuntimeContext, fs_access: StdFsAccess
+    ) -> tuple[str, str, str]:
+        """Return the output, temporary and staging directories of a job, as seen by its command."""
+        outdir = ""
+        tmpdir = ""
+        stagedir = ""
+
+        docker_req, docker_required = self.get_requirement("DockerRequirement")
+        default_docker = None
+        mpi_req, mpi_required = self.get_requirement(MPIRequirementName)
+
+        if docker_req is None and runtime_context.default_container:
+            default_docker = runtime_context.default_container
+
+        if (
+            docker_req is not None
+            and runtime_context.use_container
+            and not runtime_context.singularity
+            and not runtime_context.user_space_docker_cmd
+            and mpi_req is not None
+        ):
+            if mpi_required:
+                if docker_required:
+                    raise UnsupportedRequirement(
+                        "No support for DockerRequirement and MPIRequirement "
+                        "both being required, unless Singularity or uDocker is being used."
+                    )
+                else:
+                    _logger.warning(
+                        "MPI has been required while DockerRequirement is hinted "
+                        "and neither Singularity nor uDocker is being used, discarding Docker hint(s)."
+                    )
+                    self.hints = [h for h in self.hints if h["class"] != "DockerRequirement"]
+                    docker_req = None
+                    docker_required = False
+            else:
+                if docker_required:
+                    _logger.warning(
+                        "Docker has been required (and neither Singularity nor "
+                        "uDocker is being used) while MPI is hinted, discarding MPI hint(s)/"
+                    )
+                    self.hints = [h for h in self.hints if h["class"] != MPIRequirementName]
+                else:
+                    raise UnsupportedRequirement(
+                        "Both Docker and MPI have been hinted and neither "
+                        "Singularity nor uDocker are being used - don't know what to do."
+                    )
+
+        if (docker_req or default_docker) and runtime_context.use_container:
+            if docker_req is not None:
+                # Check if docker output directory is absolute
+                if docker_req.get("dockerOutputDirectory") and cast(
+                    str, docker_req.get("dockerOutputDirectory")
+                ).startswith("/"):
+                    outdir = cast(str, docker_req.get("dockerOutputDirectory"))
+                else:
+                    outdir = cast(
+                        str,
+                        docker_req.get("dockerOutputDirectory")
+                        or runtime_context.docker_outdir
+                        or random_outdir(),
+                    )
+            elif default_docker is not None:
+                outdir = runtime_context.docker_outdir or random_outdir()
+            tmpdir = runtime_context.docker_tmpdir or "/tmp"  # nosec
+            stagedir = runtime_context.docker_stagedir or "/var/lib/cwl"
+        else:
+            if self.tool["class"] == "CommandLineTool":
+                outdir = fs_access.realpath(runtime_context.get_outdir())
+                tmpdir = fs_access.realpath(runtime_context.get_tmpdir())
+                stagedir = fs_access.realpath(runtime_context.get_stagedir())
+        return outdir, tmpdir, stagedir
+
     def _init_job(self, joborder: CWLObjectType, runtime_context: RuntimeContext) -> Builder:
         if self.metadata.get("cwlVersion") != INTERNAL_VERSION:
             raise WorkflowException(
@@ -804,6 +1005,15 @@ class Process(HasReqsHints, metaclass=abc.ABCMeta):
 
             visit_files(job, functools.partial(add_sizes, fs_access))
 
+            if (
+                runtime_context.lazy_checksum
+                and self.reads_checksums
+                and getdefault(runtime_context.compute_checksum, True)
+            ):
+                fileobjs: list[CWLFileType] = []
+                visit_files(job, fileobjs.append)
+                checksum_files(fs_access, fileobjs)
+
             if load_listing == "deep_listing":
                 for i, inparm in enumerate(self.tool["inputs"]):
                     k = shortname(inparm["id"])
@@ -849,74 +1059,7 @@ hints:
 
         files: MutableSequence[CWLFileType | CWLDirectoryType] = []
         bindings = CommentedSeq()
-        outdir = ""
-        tmpdir = ""
-        stagedir = ""
-
-        docker_req, docker_required = self.get_requirement("DockerRequirement")
-        default_docker = None
-        mpi_req, mpi_required = self.get_requirement(MPIRequirementName)
-
-        if docker_req is None and runtime_context.default_container:
-            default_docker = runtime_context.default_container
-
-        if (
-            docker_req is not None
-            and runtime_context.use_container
-            and not runtime_context.singularity
-            and not runtime_context.user_space_docker_cmd
-            and mpi_req is not None
-        ):
-            if mpi_required:
-                if docker_required:
-                    raise UnsupportedRequirement(
-                        "No support for DockerRequirement and MPIRequirement "
-                        "both being required, unless Singularity or uDocker is being used."
-                    )
-                else:
-                    _logger.warning(
-                        "MPI has been required while DockerRequirement is hinted "
-                        "and neither Singularity nor uDocker is being used, discarding Docker hint(s)."
-                    )
-                    self.hints = [h for h in self.hints if h["class"] != "DockerRequirement"]
-                    docker_req = None
-                    docker_required = False
-            else:
-                if docker_required:
-                    _logger.warning(
-                        "Docker has been required (and neither Singularity nor "
-                        "uDocker is being used) while MPI is hinted, discarding MPI hint(s)/"
-                    )
-                    self.hints = [h for h in self.hints if h["class"] != MPIRequirementName]
-                else:
-                    raise UnsupportedRequirement(
-                        "Both Docker and MPI have been hinted and neither "
-                        "Singularity nor uDocker are being used - don't know what to do."
-                    )
-
-        if (docker_req or default_docker) and runtime_context.use_container:
-            if docker_req is not None:
-                # Check if docker output directory is absolute
-                if docker_req.get("dockerOutputDirectory") and cast(
-                    str, docker_req.get("dockerOutputDirectory")
-                ).startswith("/"):
-                    outdir = cast(str, docker_req.get("dockerOutputDirectory"))
-                else:
-                    outdir = cast(
-                        str,
-                        docker_req.get("dockerOutputDirectory")
-                        or runtime_context.docker_outdir
-                        or random_outdir(),
-                    )
-            elif default_docker is not None:
-                outdir = runtime_context.docker_outdir or random_outdir()
-            tmpdir = runtime_context.docker_tmpdir or "/tmp"  # nosec
-            stagedir = runtime_context.docker_stagedir or "/var/lib/cwl"
-        else:
-            if self.tool["class"] == "CommandLineTool":
-                outdir = fs_access.realpath(runtime_context.get_outdir())
-                tmpdir = fs_access.realpath(runtime_context.get_tmpdir())
-                stagedir = fs_access.realpath(runtime_context.get_stagedir())
+        outdir, tmpdir, stagedir = self._builder_dirs(runtime_context, fs_access)
 
         cwl_version = cast(
             str,
@@ -1408,18 +1551,4 @@ def scandeps(
 
 def compute_checksums(fs_access: StdFsAccess, fileobj: CWLFileType) -> None:
     """Compute a SHA1 checksum for the given file and store it as an attribute."""
-    if "checksum" not in fileobj:
-        checksum = hashlib.sha1()  # nosec
-        location = fileobj["location"]
-        if "contents" in fileobj:
-            contents = fileobj["contents"].encode("utf-8")
-            checksum.update(contents)
-            fileobj["size"] = len(contents)
-        else:
-            with fs_access.open(location, "rb") as f:
-                contents = f.read(1024 * 1024)
-                while contents != b"":
-                    checksum.update(contents)
-                    contents = f.read(1024 * 1024)
-            fileobj["size"] = fs_access.size(location)
-        fileobj["checksum"] = "sha1$%s" % checksum.hexdigest()
+    checksum_file(fs_access, fileobj)
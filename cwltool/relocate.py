@@ -0,0 +1,253 @@
+"""Copy final workflow outputs to the output directory as soon as they are produced."""
+
+import functools
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections.abc import Callable, Iterable
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import NamedTuple
+
+try:
+    import fcntl
+except ImportError:
+    # Guard against `from .relocate import ...` on windows.
+    # See windows_check() in main.py
+    pass
+
+from cwl_utils.types import CWLDirectoryType, CWLFileType, CWLOutputType
+from schema_salad.ref_resolver import uri_file_path
+
+from .loghandler import _logger
+from .staging import copy_with_checksum
+from .utils import visit_class
+
+#: Outputs copied to the output directory concurrently while the workflow runs.
+MAX_RELOCATE_WORKERS = 4
+
+#: Early copies not changed for this many seconds, nor locked, are left over
+#: by a cwltool that was killed.
+STALE_AGE = 60
+
+_PREFIX = ".cwltool-relocate-"
+
+_Signature = tuple[tuple[str, int, int], ...]
+
+
+def _signature(path: str) -> _Signature:
+    """Describe the contents of a file or directory, to detect later changes."""
+    if not os.path.isdir(path):
+        st = os.stat(path)
+        return (("", st.st_size, st.st_mtime_ns),)
+    entries = []
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            st = os.stat(os.path.join(root, name))
+            entries.append(
+                (os.path.relpath(os.path.join(root, name), path), st.st_size, st.st_mtime_ns)
+            )
+    return tuple(sorted(entries))
+
+
+def _device(path: str) -> int:
+    """Return the device of a path, or of its closest existing parent."""
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+    return os.stat(path).st_dev
+
+
+def _remove(path: str) -> None:
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    else:
+        os.unlink(path)
+
+
+def _remove_stale(destination: str) -> None:
+    """Remove the early copies left in ``destination`` by cwltool processes that were killed."""
+    try:
+        names = os.listdir(destination)
+    except FileNotFoundError:
+        return
+    for name in names:
+        path = os.path.join(destination, name)
+        if not name.startswith(_PREFIX):
+            continue
+        try:
+            if time.time() - os.lstat(path).st_mtime < STALE_AGE:
+                continue
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            # removed by another cwltool
+            continue
+        try:
+            # held shared by the cwltool using the copies
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            continue
+        else:
+            _logger.debug("Removing the early copies left in %s", path)
+            shutil.rmtree(path, ignore_errors=True)
+        finally:
+            os.close(fd)
+
+
+class _EarlyCopy(NamedTuple):
+    copy: str
+    future: "Future[tuple[_Signature, dict[str, str]]]"
+
+
+class EarlyRelocator:
+    """
+    Copy final workflow outputs next to the output directory while the workflow runs.
+
+    When a step of the top level workflow completes, the Files and
+    Directories it produced for the workflow outputs are copied, in the
+    background, into a temporary directory on the filesystem of the output
+    directory. :py:func:`cwltool.process.relocateOutputs` then only has to
+    rename these copies to their final names, once they are known. Copies
+    are only made when relocating would copy the data anyway: when
+    ``--copy-outputs`` is used, or when moving across filesystems. A copy is
+    discarded if its source changed after it was made.
+
+    With ``compute_checksum``, the files are hashed as they are copied, and
+    the checksums of the relocated files are kept in :py:attr:`checksums`.
+
+    The temporary directory is removed by :py:meth:`close`, and locked while
+    in use, so that the one of a cwltool that was killed is removed by the
+    next one relocating outputs to the same directory.
+    """
+
+    def __init__(
+        self,
+        destination: str,
+        source_directories: Iterable[str],
+        action: str,
+        compute_checksum: bool = False,
+    ) -> None:
+        """Relocate outputs to ``destination``, moving them from ``source_directories``."""
+        self.destination = destination
+        self.source_directories = source_directories
+        self.action = action
+        self.compute_checksum = compute_checksum
+        self.checksums: dict[str, str] = {}
+        # the files with a checksum already, not hashed again while copied
+        self._hashed: set[str] = set()
+        self.used = 0
+        self._count = 0
+        self._copies: dict[str, _EarlyCopy] = {}
+        self._placed: dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._pool: ThreadPoolExecutor | None = None
+        self._directory = os.path.join(destination, f"{_PREFIX}{uuid.uuid4()}")
+        self._directory_fd: int | None = None
+
+    def _needs_copy(self, path: str) -> bool:
+        """Tell if relocating ``path`` would copy its data."""
+        if self.action == "copy":
+            return True
+        if not any(os.path.commonprefix([p, path]) == p for p in self.source_directories):
+            return True
+        return _device(path) != _device(self.destination)
+
+    def _copy(self, src: str, copy: str) -> tuple[_Signature, dict[str, str]]:
+        signature = _signature(src)
+        checksums: dict[str, str] = {}
+        copy_function: Callable[[str, str], object] = shutil.copy2
+        if self.compute_checksum:
+            copy_function = functools.partial(
+                copy_with_checksum, checksums=checksums, hashed=self._hashed
+            )
+        if os.path.isdir(src):
+            shutil.copytree(src, copy, copy_function=copy_function)
+        else:
+            copy_function(src, copy)
+        return signature, checksums
+
+    def submit(self, outputs: CWLOutputType | None) -> None:
+        """Start copying the Files and Directories of the output values of a step."""
+        sources: list[str] = []
+        hashed: list[str] = []
+
+        def _add(obj: CWLFileType | CWLDirectoryType) -> None:
+            if obj["location"].startswith("file://"):
+                sources.append(os.path.realpath(uri_file_path(obj["location"])))
+                if "checksum" in obj:
+                    hashed.append(sources[-1])
+
+        visit_class(outputs, ("File", "Directory"), _add)
+        with self._lock:
+            self._hashed.update(hashed)
+            for src in sources:
+                if src in self._copies or any(
+                    src.startswith(other + os.sep) for other in self._copies
+                ):
+                    continue
+                if not os.path.exists(src) or not self._needs_copy(src):
+                    continue
+                if self._pool is None:
+                    _remove_stale(self.destination)
+                    os.makedirs(self._directory, exist_ok=True)
+                    self._directory_fd = os.open(self._directory, os.O_RDONLY)
+                    fcntl.flock(self._directory_fd, fcntl.LOCK_SH)
+                    self._pool = ThreadPoolExecutor(
+                        max_workers=MAX_RELOCATE_WORKERS, thread_name_prefix="cwltool-relocate"
+                    )
+                copy = os.path.join(self._directory, str(self._count))
+                self._count += 1
+                _logger.debug("Copying output %s ahead of relocation", src)
+                self._copies[src] = _EarlyCopy(copy, self._pool.submit(self._copy, src, copy))
+
+    def take(self, src: str, dst: str, move: bool) -> bool:
+        """
+        Put the early copy of ``src`` at ``dst``, if there is a valid one.
+
+        :param move: Also remove ``src``, as it is being moved.
+        :returns: Whether ``dst`` is in place.
+        """
+        with self._lock:
+            for placed_src, placed_dst in self._placed.items():
+                if (
+                    src.startswith(placed_src + os.sep)
+                    and dst == placed_dst + src[len(placed_src) :]
+                    and os.path.exists(dst)
+                ):
+                    # inside a directory already in place
+                    return True
+            early = self._copies.pop(src, None)
+        if early is None:
+            return False
+        try:
+            signature, checksums = early.future.result()
+            if signature != _signature(src) or os.path.lexists(dst):
+                raise ValueError(f"{src} changed or {dst} exists")
+        except Exception as err:
+            _logger.debug("Not using the early copy of %s: %s", src, err)
+            if os.path.lexists(early.copy):
+                _remove(early.copy)
+            return False
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        os.replace(early.copy, dst)
+        if move:
+            _remove(src)
+        with self._lock:
+            if os.path.isdir(dst):
+                self._placed[src] = dst
+            for path, checksum in checksums.items():
+                self.checksums[dst + path[len(early.copy) :]] = checksum
+            self.used += 1
+        return True
+
+    def close(self) -> None:
+        """Wait for the copies in progress, and remove the unused ones."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+        if os.path.exists(self._directory):
+            shutil.rmtree(self._directory, ignore_errors=True)
+        if self._directory_fd is not None:
+            os.close(self._directory_fd)
+            self._directory_fd = None
+        if self.used:
+            _logger.debug("Relocated %d output(s) from early copies", self.used)
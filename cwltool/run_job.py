@@ -1,11 +1,17 @@
 """Only used when there is a job script or CWLTOOL_FORCE_SHELL_POPEN=1."""
 
+import hashlib
 import json
 import os
 import subprocess  # nosec
 import sys
+import tempfile
 from typing import BinaryIO, TextIO
 
+# Variables that are meaningful to the shell or set specifically by the CWL
+# runtime environment; they are never taken from the environment script.
+_JOB_SPECIFIC_VARS = ("_", "PWD", "SHLVL", "TMPDIR", "HOME", "_CWLTOOL")
+
 
 def handle_software_environment(cwl_env: dict[str, str], script: str) -> dict[str, str]:
     """Update the provided environment dict by running the script."""
@@ -21,14 +27,66 @@ def handle_software_environment(cwl_env: dict[str, str], script: str) -> dict[st
         data = _.read().strip("\0")
     for line in data.split("\0"):
         key, val = line.split("=", 1)
-        if key in ("_", "PWD", "SHLVL", "TMPDIR", "HOME", "_CWLTOOL"):
-            # Skip some variables that are meaningful to the shell or set
-            # specifically by the CWL runtime environment.
+        if key in _JOB_SPECIFIC_VARS:
             continue
         env[key] = val
     return env
 
 
+def _job_dirs_used(cwl_env: dict[str, str], delta: dict[str, str]) -> bool:
+    """Whether a value set by the environment script contains a directory of this job."""
+    job_dirs = {cwl_env.get("HOME"), cwl_env.get("TMPDIR"), cwl_env.get("PWD"), os.getcwd()}
+    return any(
+        job_dir.rstrip("/") in value
+        for job_dir in job_dirs
+        if job_dir and job_dir.rstrip("/")
+        for value in delta.values()
+    )
+
+
+def cached_software_environment(
+    cwl_env: dict[str, str], script: str, cache_dir: str
+) -> dict[str, str]:
+    """
+    Update the provided environment dict by running the script, at most once.
+
+    The variables the script sets or changes are stored in ``cache_dir``,
+    keyed by the script and by the environment it runs in (apart from the
+    job specific variables), and applied directly by later jobs. Variables
+    built from the home, temporary or working directory of the job are only
+    valid for it, so they are not stored.
+    """
+    hasher = hashlib.sha256()
+    with open(script, "rb") as _:
+        hasher.update(_.read())
+    hasher.update(
+        json.dumps(
+            {k: v for k, v in cwl_env.items() if k not in _JOB_SPECIFIC_VARS}, sort_keys=True
+        ).encode("utf-8")
+    )
+    cache_path = os.path.join(cache_dir, hasher.hexdigest() + ".json")
+    try:
+        with open(cache_path) as _:
+            delta = json.load(_)
+    except (OSError, ValueError):
+        env = handle_software_environment(cwl_env, script)
+        if env is cwl_env:
+            # The script failed, do not remember that.
+            return env
+        delta = {k: v for k, v in env.items() if cwl_env.get(k) != v}
+        if _job_dirs_used(cwl_env, delta):
+            return env
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as _:
+            json.dump(delta, _)
+        os.replace(tmp_path, cache_path)
+        return env
+    env = cwl_env.copy()
+    env.update(delta)
+    return env
+
+
 def main(argv: list[str]) -> int:
     """
     Read in the configuration JSON and execute the commands.
@@ -44,6 +102,10 @@ def main(argv: list[str]) -> int:
     The second argument is optional, it specifies a shell script to execute prior,
       and the environment variables it sets will be combined with the environment
       variables from the "env" key in the JSON dictionary from the first argument.
+
+    The third argument is optional, it names a directory where the environment
+      variables set by the shell script are cached, so that the script is only
+      run once for a given environment.
     """
     with open(argv[1]) as f:
         popen_description = json.load(f)
@@ -72,7 +134,10 @@ def main(argv: list[str]) -> int:
         except IndexError:
             env_script = None
         if env_script is not None:
-            env = handle_software_environment(env, env_script)
+            if len(argv) > 3:
+                env = cached_software_environment(env, env_script, argv[3])
+            else:
+                env = handle_software_environment(env, env_script)
 
         sp = subprocess.Popen(  # nosec
             commands,
@@ -12,7 +12,7 @@ import sys
 import threading
 from collections.abc import Callable, MutableMapping, MutableSequence
 from subprocess import check_call, check_output, run  # nosec
-from typing import cast
+from typing import Union, cast
 
 from cwl_utils.types import CWLDirectoryType, CWLFileType, CWLObjectType
 from mypy_extensions import mypyc_attr
@@ -23,11 +23,12 @@ from spython.main import Client
 from spython.main.parse.parsers.docker import DockerParser
 from spython.main.parse.writers.singularity import SingularityWriter
 
+from . import singularity_cache
 from .builder import Builder
 from .context import RuntimeContext
 from .docker import DockerCommandLineJob
 from .errors import WorkflowException
-from .job import ContainerCommandLineJob
+from .job import ContainerCommandLineJob, image_lock
 from .loghandler import _logger
 from .pathmapper import MapperEnt, PathMapper
 from .singularity_utils import singularity_supports_userns
@@ -205,6 +206,19 @@ class SingularityCommandLineJob(ContainerCommandLineJob):
     ) -> None:
         """Builder for invoking the Singularty software container engine."""
         super().__init__(builder, joborder, make_path_mapper, requirements, hints, name)
+        self.image: str | None = None
+
+    def run(
+        self,
+        runtimeContext: RuntimeContext,
+        tmpdir_lock: Union[threading.Lock, None] = None,
+    ) -> None:
+        """Run the job, then release its image from the Singularity image cache."""
+        try:
+            super().run(runtimeContext, tmpdir_lock)
+        finally:
+            if self.image is not None:
+                singularity_cache.release_image(self.image)
 
     @staticmethod
     def get_image(
@@ -221,7 +235,27 @@ class SingularityCommandLineJob(ContainerCommandLineJob):
         provided dockerRequirement with the specific dockerImageId to the full
         path of the local image, if found. Likewise the
         dockerRequirement['dockerPull'] is updated to a docker:// URI if needed.
+
+        Concurrent requests for the same image wait for the first one to
+        finish and then reuse its result instead of pulling or building again.
         """
+        with image_lock(dockerRequirement):
+            return SingularityCommandLineJob._get_image(
+                dockerRequirement,
+                pull_image,
+                tmp_outdir_prefix,
+                force_pull,
+                sandbox_base_path,
+            )
+
+    @staticmethod
+    def _get_image(
+        dockerRequirement: dict[str, str],
+        pull_image: bool,
+        tmp_outdir_prefix: str,
+        force_pull: bool,
+        sandbox_base_path: str | None,
+    ) -> bool:
         found = False
 
         candidates = []
@@ -233,9 +267,13 @@ class SingularityCommandLineJob(ContainerCommandLineJob):
             if "dockerImageId" in dockerRequirement:
                 d_image_id = dockerRequirement["dockerImageId"]
                 if d_image_id in _IMAGES:
-                    if (resolved_image_id := _IMAGES[d_image_id]) != d_image_id:
-                        dockerRequirement["dockerImage_id"] = resolved_image_id
-                    return True
+                    resolved_image_id = _IMAGES[d_image_id]
+                    # held for the job, as when first retrieved, unless evicted since
+                    if singularity_cache.hold_image(resolved_image_id):
+                        if resolved_image_id != d_image_id:
+                            dockerRequirement["dockerImage_id"] = resolved_image_id
+                        return True
+                    del _IMAGES[d_image_id]
                 if d_image_id.startswith("/"):
                     _logger.info(
                         SourceLine(dockerRequirement, "dockerImageId").makeError(
@@ -254,6 +292,12 @@ class SingularityCommandLineJob(ContainerCommandLineJob):
         else:
             image_base_path = cache_folder if cache_folder else ""
 
+        sif_cache = None
+        if "CWL_SINGULARITY_CACHE" in os.environ and is_version_3_or_newer():
+            sif_cache = singularity_cache.SifCache.from_environment(
+                os.environ["CWL_SINGULARITY_CACHE"]
+            )
+
         if not sandbox_base_path:
             sandbox_base_path = os.path.abspath(image_base_path)
         else:
@@ -278,10 +322,9 @@ class SingularityCommandLineJob(ContainerCommandLineJob):
                 image_name = _normalize_image_id(image_name)
             image_name = os.path.join(absolute_path, image_name)
             docker_req["dockerImageId"] = image_name
-            if os.path.exists(image_name):
-                found = True
-            if found is False:
-                dockerfile_path = os.path.join(absolute_path, "Dockerfile")
+
+            def build_from_dockerfile(image: str, build_folder: str) -> None:
+                dockerfile_path = os.path.join(build_folder, "Dockerfile")
                 singularityfile_path = dockerfile_path + ".def"
                 with open(dockerfile_path, "w") as dfile:
                     dfile.write(docker_req["dockerFile"])
@@ -301,11 +344,25 @@ class SingularityCommandLineJob(ContainerCommandLineJob):
                 singularity_options = ["--fakeroot"] if not shutil.which("proot") else []
                 Client.build(
                     recipe=singularityfile_path,
-                    build_folder=absolute_path,
-                    image=image_name,
+                    build_folder=build_folder,
+                    image=image,
                     sudo=False,
                     options=singularity_options,
                 )
+
+            if sif_cache is not None:
+                key = singularity_cache.dockerfile_key(docker_req["dockerFile"])
+                if sif_cache.lookup(key, image_name) is None:
+                    sif_cache.publish(
+                        key,
+                        image_name,
+                        lambda image: build_from_dockerfile(image, os.path.dirname(image)),
+                    )
+                found = True
+            elif os.path.exists(image_name):
+                found = True
+            else:
+                build_from_dockerfile(image_name, absolute_path)
                 found = True
         elif "dockerImageId" not in docker_req and "dockerPull" in docker_req:
             # looking for local singularity sandbox image and handle it as a local image
@@ -331,6 +388,21 @@ class SingularityCommandLineJob(ContainerCommandLineJob):
                     docker_req["dockerImageId"] = img_name
                 if not match:
                     docker_req["dockerPull"] = "docker://" + docker_req["dockerPull"]
+                if (
+                    sif_cache is not None
+                    and os.path.abspath(image_base_path) == sif_cache.root
+                    and not force_pull
+                    and (
+                        cached := sif_cache.lookup(
+                            singularity_cache.pull_key(docker_req["dockerPull"]),
+                            os.path.join(image_base_path, docker_req["dockerImageId"]),
+                        )
+                    )
+                    is not None
+                ):
+                    _logger.info("Using cached Singularity image %s", cached)
+                    docker_req["dockerImageId"] = cached
+                    found = True
         elif "dockerImageId" in docker_req:
             sandbox_image_path = os.path.join(sandbox_base_path, dockerRequirement["dockerImageId"])
             # handling local singularity sandbox image
@@ -362,7 +434,7 @@ class SingularityCommandLineJob(ContainerCommandLineJob):
                     for entry in files:
                         if entry in candidates:
                             path = os.path.join(dirpath, entry)
-                            if os.path.isfile(path):
+                            if os.path.isfile(path) and singularity_cache.hold_image(path):
                                 _logger.info(
                                     "Using local copy of Singularity image %s found in %s",
                                     entry,
@@ -373,7 +445,22 @@ class SingularityCommandLineJob(ContainerCommandLineJob):
         if (force_pull or not found) and pull_image:
             cmd: list[str] = []
             if "dockerPull" in docker_req:
-                if image_base_path:
+                if sif_cache is not None and os.path.abspath(image_base_path) == sif_cache.root:
+                    pull = str(docker_req["dockerPull"])
+
+                    def pull_image_to(image: str) -> None:
+                        cmd = ["singularity", "pull", "--force", "--name", image, pull]
+                        _logger.info(str(cmd))
+                        check_call(cmd, stdout=sys.stderr)  # nosec
+
+                    docker_req["dockerImageId"] = sif_cache.publish(
+                        singularity_cache.pull_key(pull),
+                        os.path.join(image_base_path, docker_req["dockerImageId"]),
+                        pull_image_to,
+                        force=force_pull,
+                    )
+                    found = True
+                elif image_base_path:
                     env = os.environ.copy()
                     if is_version_2_6():
                         env["SINGULARITY_PULLFOLDER"] = image_base_path
@@ -475,7 +562,8 @@ class SingularityCommandLineJob(ContainerCommandLineJob):
         ):
             raise WorkflowException(f"Container image not found for {r}")
 
-        return os.path.abspath(cast(str, r["dockerImageId"]))
+        self.image = os.path.abspath(cast(str, r["dockerImageId"]))
+        return self.image
 
     @staticmethod
     def append_volume(runtime: list[str], source: str, target: str, writable: bool = False) -> None:
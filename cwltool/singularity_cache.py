@@ -0,0 +1,273 @@
+"""Content-addressed store of Singularity images shared between cwltool processes."""
+
+import fcntl
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import IO
+
+from .loghandler import _logger
+from .utils import parse_size
+
+#: Optional upper bound on the total size of the cached images (e.g. ``20G``).
+MAX_SIZE_ENV = "CWL_SINGULARITY_CACHE_MAX_SIZE"
+
+_STORE_DIR = ".cwltool-sif"
+
+# the images held by this process: their locked ``.use`` file, and how many holds
+_held: dict[str, tuple[IO[str], int]] = {}
+_held_lock = threading.Lock()
+
+
+def dockerfile_key(dockerfile: str) -> str:
+    """Return the cache key of an image built from the given Dockerfile."""
+    return "dockerfile-" + hashlib.sha256(dockerfile.encode("utf-8")).hexdigest()
+
+
+def pull_key(docker_pull: str) -> str:
+    """
+    Return the cache key of a pulled image.
+
+    References pinned to a digest are keyed by that digest, so the same image
+    pulled under different names is stored once. Other references are keyed
+    by the reference itself.
+    """
+    if (match := re.search(r"@sha256:([0-9a-f]{64})$", docker_pull)) is not None:
+        return "sha256-" + match.group(1)
+    reference = re.sub(r"^[a-z]*://", "", docker_pull)
+    return "ref-" + hashlib.sha256(reference.encode("utf-8")).hexdigest()
+
+
+def cached_image(image: str) -> tuple["SifCache", str] | None:
+    """Return the cache and the key of an image stored in a :py:class:`SifCache`, if it is."""
+    blob = os.path.realpath(image)
+    blobs_dir = os.path.dirname(blob)
+    store_dir = os.path.dirname(blobs_dir)
+    if (
+        not blob.endswith(".sif")
+        or os.path.basename(blobs_dir) != "blobs"
+        or os.path.basename(store_dir) != _STORE_DIR
+    ):
+        return None
+    return SifCache(os.path.dirname(store_dir)), os.path.basename(blob)[: -len(".sif")]
+
+
+def hold_image(image: str) -> bool:
+    """
+    Hold an image, if it is stored in a :py:class:`SifCache`.
+
+    :returns: Whether the image is still there, as it may have been evicted.
+    """
+    if (cached := cached_image(image)) is None:
+        return os.path.exists(image)
+    cache, key = cached
+    return cache.lookup(key) is not None
+
+
+def release_image(image: str) -> None:
+    """Stop holding an image, if it is stored in a :py:class:`SifCache`."""
+    if (cached := cached_image(image)) is not None:
+        cache, key = cached
+        cache.release(key)
+
+
+class SifCache:
+    """
+    A directory of SIF images, each stored once under its content key.
+
+    Images live in ``<root>/.cwltool-sif/blobs/<key>.sif`` and are exposed
+    under their historical file names in ``<root>`` as symbolic links. An
+    image is built into a temporary file and published with an atomic rename
+    while an exclusive lock on its key is held, so cwltool processes sharing
+    the cache never race to build the same image. The modification time of
+    an image records its last use, for LRU eviction.
+
+    An image looked up or published is held, with a shared lock on its
+    ``<key>.use`` file, until it is released, as when the job using it
+    finishes; images held by any process are never evicted.
+    """
+
+    def __init__(self, root: str, max_size: int | None = None) -> None:
+        """Open (and create if needed) the cache under the given directory."""
+        self.root = os.path.abspath(root)
+        self.max_size = max_size
+        self.blobs_dir = os.path.join(self.root, _STORE_DIR, "blobs")
+        self.locks_dir = os.path.join(self.root, _STORE_DIR, "locks")
+        self.tmp_dir = os.path.join(self.root, _STORE_DIR, "tmp")
+        for path in (self.blobs_dir, self.locks_dir, self.tmp_dir):
+            os.makedirs(path, exist_ok=True)
+
+    @classmethod
+    def from_environment(cls, root: str) -> "SifCache":
+        """Open the cache, taking its size limit from the environment."""
+        max_size = os.environ.get(MAX_SIZE_ENV)
+        return cls(root, parse_size(max_size) if max_size else None)
+
+    def blob_path(self, key: str) -> str:
+        """Return the path of the image stored under the given key."""
+        return os.path.join(self.blobs_dir, key + ".sif")
+
+    @contextmanager
+    def _locked(self, key: str, operation: int) -> Iterator[None]:
+        with open(os.path.join(self.locks_dir, key + ".lock"), "a") as lock:
+            fcntl.flock(lock.fileno(), operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    def _hold(self, key: str) -> None:
+        """Hold an image, under the lock on its key so that it is not evicted meanwhile."""
+        path = os.path.join(self.locks_dir, key + ".use")
+        with _held_lock:
+            use, holds = _held.get(path, (None, 0))
+            if use is None:
+                use = open(path, "a")
+                fcntl.flock(use.fileno(), fcntl.LOCK_SH)
+            _held[path] = (use, holds + 1)
+
+    def release(self, key: str) -> None:
+        """Stop holding an image, which may then be evicted once no process holds it."""
+        path = os.path.join(self.locks_dir, key + ".use")
+        with _held_lock:
+            use, holds = _held.pop(path, (None, 0))
+            if use is None:
+                return
+            if holds > 1:
+                _held[path] = (use, holds - 1)
+            else:
+                use.close()
+
+    def lookup(self, key: str, link_path: str | None = None) -> str | None:
+        """
+        Return the path of a cached image, or None if it is not cached.
+
+        A hit holds the image, marks it as recently used and, if ``link_path``
+        is given, (re)creates the symbolic link there.
+        """
+        with self._locked(key, fcntl.LOCK_SH):
+            blob = self.blob_path(key)
+            if not os.path.isfile(blob):
+                return None
+            self._hold(key)
+            os.utime(blob)
+            if link_path is None:
+                return blob
+            self._link(blob, link_path)
+            return link_path
+
+    def publish(
+        self,
+        key: str,
+        link_path: str,
+        build: Callable[[str], None],
+        force: bool = False,
+    ) -> str:
+        """
+        Return the path of the image stored under the key, building it if needed.
+
+        The image is then held, as by :py:meth:`lookup`.
+
+        :param build: Called with a temporary file path to write the image to.
+        :param force: Rebuild the image even if it is already cached.
+        :returns: ``link_path``, now a symbolic link to the cached image.
+        """
+        blob = self.blob_path(key)
+        with self._locked(key, fcntl.LOCK_EX):
+            if force or not os.path.isfile(blob):
+                build_dir = tempfile.mkdtemp(prefix=key + ".", dir=self.tmp_dir)
+                try:
+                    tmp_image = os.path.join(build_dir, os.path.basename(blob))
+                    build(tmp_image)
+                    os.replace(tmp_image, blob)
+                finally:
+                    shutil.rmtree(build_dir, ignore_errors=True)
+            else:
+                _logger.info("Using cached Singularity image %s", blob)
+                os.utime(blob)
+            self._hold(key)
+            self._link(blob, link_path)
+        if self.max_size is not None:
+            self.evict(self.max_size, keep=(key,))
+        return link_path
+
+    @staticmethod
+    def _link(blob: str, link_path: str) -> None:
+        target = os.path.relpath(blob, os.path.dirname(os.path.abspath(link_path)))
+        if os.path.islink(link_path) and os.readlink(link_path) == target:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(link_path)), exist_ok=True)
+        tmp_link = f"{link_path}.{os.getpid()}.tmp"
+        if os.path.lexists(tmp_link):
+            os.unlink(tmp_link)
+        os.symlink(target, tmp_link)
+        os.replace(tmp_link, link_path)
+
+    def usage(self) -> int:
+        """Return the total size in bytes of the cached images."""
+        total = 0
+        with os.scandir(self.blobs_dir) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False):
+                    total += entry.stat(follow_symlinks=False).st_size
+        return total
+
+    def evict(self, max_size: int, keep: tuple[str, ...] = ()) -> list[str]:
+        """
+        Remove the least recently used images until the cache fits in ``max_size``.
+
+        Images that are being built, looked up or held by any process, and
+        those listed in ``keep``, are skipped. Links left dangling are removed.
+
+        :returns: The keys of the evicted images.
+        """
+        blobs: list[tuple[float, int, str]] = []
+        total = 0
+        with os.scandir(self.blobs_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".sif") or not entry.is_file(follow_symlinks=False):
+                    continue
+                stat = entry.stat(follow_symlinks=False)
+                total += stat.st_size
+                blobs.append((stat.st_mtime, stat.st_size, entry.name[: -len(".sif")]))
+        evicted: list[str] = []
+        for _mtime, size, key in sorted(blobs):
+            if total <= max_size:
+                break
+            if key in keep:
+                continue
+            with (
+                open(os.path.join(self.locks_dir, key + ".lock"), "a") as lock,
+                open(os.path.join(self.locks_dir, key + ".use"), "a") as use,
+            ):
+                try:
+                    fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    fcntl.flock(use.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                os.unlink(self.blob_path(key))
+            _logger.info("Evicted Singularity image %s (%d bytes) from the cache", key, size)
+            total -= size
+            evicted.append(key)
+        if evicted:
+            self._remove_dangling_links()
+        return evicted
+
+    def _remove_dangling_links(self) -> None:
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if not entry.is_symlink():
+                    continue
+                target = os.path.join(self.root, os.readlink(entry.path))
+                if os.path.dirname(
+                    os.path.normpath(target)
+                ) == self.blobs_dir and not os.path.exists(target):
+                    try:
+                        os.unlink(entry.path)
+                    except FileNotFoundError:
+                        pass
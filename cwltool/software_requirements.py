@@ -8,15 +8,23 @@ ways to adapt new packages managers and such as well.
 """
 
 import argparse
+import atexit
+import hashlib
 import importlib.metadata
 import os
+import shutil
 import string
+import tempfile
+import threading
 from collections.abc import MutableMapping, MutableSequence
 from typing import TYPE_CHECKING, Any, Union, cast
 
+from schema_salad.utils import json_dumps
+
 from .utils import HasReqsHints
 
 if TYPE_CHECKING:
+    from galaxy.tool_util.deps import DependencyManager
     from galaxy.tool_util.deps.requirements import ToolRequirements
 
     from .builder import Builder
@@ -37,7 +45,7 @@ if ! env -0 > "output_environment.dat" 2> /dev/null; then
     python3 "env_to_stdout.py" > "output_environment.dat"
 fi
 EOF
-python3 "run_job.py" "job.json" "modify_environment.bash"
+python3 "run_job.py" "job.json" "modify_environment.bash" "$env_cache_dir"
 """)
 
 
@@ -67,35 +75,79 @@ class DependenciesConfiguration:
             self.use_tool_dependencies = False
         if self.tool_dependency_dir and not os.path.exists(self.tool_dependency_dir):
             os.makedirs(self.tool_dependency_dir)
+        self._lock = threading.Lock()
+        self._key_locks: dict[str, threading.Lock] = {}
+        self._dependency_managers: dict[bool, "DependencyManager"] = {}
+        self._shell_commands: dict[str, str] = {}
+        self._env_cache_dir: str | None = None
+
+    def _dependency_manager(self, debug: bool) -> "DependencyManager":
+        """Build the galaxy-tool-util dependency manager, once per process."""
+        from galaxy.tool_util import deps
+
+        with self._lock:
+            if (manager := self._dependency_managers.get(debug)) is None:
+                resolution_config_dict = {
+                    "use": self.use_tool_dependencies,
+                    "default_base_path": self.tool_dependency_dir,
+                }
+                app_config = {
+                    "conda_auto_install": True,
+                    "conda_auto_init": True,
+                    "debug": debug,
+                }
+                manager = deps.build_dependency_manager(
+                    app_config_dict=app_config,
+                    resolution_config_dict=resolution_config_dict,
+                    conf_file=self.dependency_resolvers_config_file,
+                )
+                self._dependency_managers[debug] = manager
+            return manager
+
+    def _work_dir(self) -> str:
+        """Return a directory for the resolved environments of this process."""
+        if self._env_cache_dir is None:
+            self._env_cache_dir = tempfile.mkdtemp(prefix="cwltool_deps_")
+            atexit.register(shutil.rmtree, self._env_cache_dir, True)
+        return self._env_cache_dir
 
     def build_job_script(self, builder: "Builder", command: list[str]) -> str:
-        """Use the galaxy-tool-util library to construct a build script."""
-        from galaxy.tool_util import deps
+        """
+        Use the galaxy-tool-util library to construct a build script.
 
+        The dependencies are resolved once per distinct SoftwareRequirement.
+        Jobs with the same requirement share the resolved shell commands and,
+        through ``run_job.py``, the environment they produce.
+        """
         ensure_galaxy_lib_available()
-        resolution_config_dict = {
-            "use": self.use_tool_dependencies,
-            "default_base_path": self.tool_dependency_dir,
-        }
-        app_config = {
-            "conda_auto_install": True,
-            "conda_auto_init": True,
-            "debug": builder.debug,
-        }
-        tool_dependency_manager: "deps.DependencyManager" = deps.build_dependency_manager(
-            app_config_dict=app_config,
-            resolution_config_dict=resolution_config_dict,
-            conf_file=self.dependency_resolvers_config_file,
-        )
-        handle_dependencies: str = ""
-        if dependencies := get_dependencies(builder):
-            handle_dependencies = "\n".join(
-                tool_dependency_manager.dependency_shell_commands(
-                    dependencies, job_directory=builder.tmpdir
-                )
-            )
+        software_requirement, _ = builder.get_requirement("SoftwareRequirement")
+        key = hashlib.sha256(
+            json_dumps([software_requirement, builder.debug], sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        with self._lock:
+            work_dir = self._work_dir()
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # requirements with different keys are resolved at the same time
+        with key_lock:
+            if (handle_dependencies := self._shell_commands.get(key)) is None:
+                handle_dependencies = ""
+                if dependencies := get_dependencies(builder):
+                    # A job directory that outlives the job, so that
+                    # resolvers which build an environment there (e.g. a
+                    # merged Conda environment) only do so once.
+                    job_directory = os.path.join(work_dir, key)
+                    os.makedirs(job_directory, exist_ok=True)
+                    handle_dependencies = "\n".join(
+                        self._dependency_manager(builder.debug).dependency_shell_commands(
+                            dependencies, job_directory=job_directory
+                        )
+                    )
+                self._shell_commands[key] = handle_dependencies
 
-        template_kwds: dict[str, str] = dict(handle_dependencies=handle_dependencies)
+        template_kwds: dict[str, str] = dict(
+            handle_dependencies=handle_dependencies,
+            env_cache_dir=os.path.join(work_dir, "environments"),
+        )
         job_script = COMMAND_WITH_DEPENDENCIES_TEMPLATE.substitute(template_kwds)
         return job_script
 
@@ -0,0 +1,171 @@
+"""Link and copy files concurrently, preferring copy-on-write clones."""
+
+import errno
+import functools
+import hashlib
+import os
+import shutil
+import sys
+import threading
+from collections.abc import Callable, Container, Iterable
+from concurrent.futures import ThreadPoolExecutor
+
+from .loghandler import _logger
+
+#: Threads creating links and copies of job inputs; mostly metadata
+#: operations, hence more threads than CPUs, as for ThreadPoolExecutor.
+MAX_STAGING_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+#: The Linux ioctl sharing the extents of a file with another (copy-on-write).
+FICLONE = 0x40049409
+
+# the errors of a filesystem, or a pair of them, that can not clone files
+_NO_REFLINK_ERRORS = {errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL}
+_NO_REFLINK: set[tuple[int, int]] = set()
+_NO_REFLINK_LOCK = threading.Lock()
+
+
+class StagingStats:
+    """Counts of the staging operations run for a job, by strategy."""
+
+    STRATEGIES = ("symlink", "reflink", "copy", "create")
+
+    def __init__(self) -> None:
+        """Start with no operations recorded."""
+        self.counts = dict.fromkeys(self.STRATEGIES, 0)
+        self.bytes_copied = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, strategy: str, bytes_copied: int = 0) -> None:
+        """Record one operation, and the bytes it had to copy."""
+        with self._lock:
+            self.counts[strategy] += 1
+            self.bytes_copied += bytes_copied
+
+    @property
+    def total(self) -> int:
+        """Return the number of operations recorded."""
+        return sum(self.counts.values())
+
+    def __str__(self) -> str:
+        """Summarise the operations for the job log."""
+        done = ", ".join(f"{count} {name}" for name, count in self.counts.items() if count)
+        return "{} entries ({}), {} bytes copied, in {:.3f}s".format(
+            self.total, done or "none", self.bytes_copied, self.seconds
+        )
+
+
+def _reflink(src: str, dst: str) -> bool:
+    """Clone ``src`` to ``dst`` if the filesystem supports it."""
+    if not sys.platform.startswith("linux"):
+        return False
+    import fcntl
+
+    devices = (os.stat(src).st_dev, os.stat(os.path.dirname(os.path.abspath(dst))).st_dev)
+    if devices in _NO_REFLINK:
+        return False
+    with open(src, "rb") as source, open(dst, "wb") as target:
+        try:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+            return True
+        except OSError as err:
+            if err.errno in _NO_REFLINK_ERRORS:
+                with _NO_REFLINK_LOCK:
+                    _NO_REFLINK.add(devices)
+    os.unlink(dst)
+    return False
+
+
+def copy_file(
+    src: str,
+    dst: str,
+    stats: StagingStats,
+    preserve_times: bool = False,
+) -> None:
+    """
+    Make ``dst`` a copy of the file ``src``, sharing storage if possible.
+
+    A copy-on-write clone is tried first, then a plain copy. Permissions,
+    and timestamps if ``preserve_times`` is set, are copied too.
+    """
+    if _reflink(src, dst):
+        stats.record("reflink")
+    else:
+        shutil.copyfile(src, dst)
+        stats.record("copy", os.path.getsize(dst))
+    if preserve_times:
+        shutil.copystat(src, dst)
+    else:
+        shutil.copymode(src, dst)
+
+
+def copy_with_checksum(
+    src: str, dst: str, checksums: dict[str, str], hashed: Container[str] = ()
+) -> str:
+    """
+    Copy the file ``src`` and its metadata to ``dst``, computing its checksum on the way.
+
+    The SHA-1 checksum of the contents is stored in ``checksums`` under
+    ``dst``, so that the copy does not have to be read again. It has the
+    signature of :py:func:`shutil.copy2` otherwise.
+
+    :param hashed: The real paths of the files whose checksum is already
+        known, copied by :py:func:`shutil.copy2` without reading them here.
+    """
+    if hashed and os.path.realpath(src) in hashed:
+        shutil.copy2(src, dst)
+        return dst
+    checksum = hashlib.sha1()  # nosec
+    with open(src, "rb") as source, open(dst, "wb") as target:
+        while chunk := source.read(1024 * 1024):
+            checksum.update(chunk)
+            target.write(chunk)
+    shutil.copystat(src, dst)
+    checksums[dst] = "sha1$%s" % checksum.hexdigest()
+    return dst
+
+
+def copy_tree(src: str, dst: str, stats: StagingStats) -> list[Callable[[], None]]:
+    """
+    Create the directories of a copy of ``src`` at ``dst``.
+
+    :returns: The operations copying the files, to be run concurrently.
+    """
+    operations: list[Callable[[], None]] = []
+    for root, _dirs, files in os.walk(src, followlinks=True):
+        target_root = os.path.join(dst, os.path.relpath(root, src))
+        os.makedirs(target_root, exist_ok=True)
+        for name in files:
+            operations.append(
+                functools.partial(
+                    copy_file,
+                    os.path.join(root, name),
+                    os.path.join(target_root, name),
+                    stats,
+                    preserve_times=True,
+                )
+            )
+    return operations
+
+
+def run_operations(operations: Iterable[Callable[[], None]]) -> None:
+    """Run the operations, concurrently if there is more than one."""
+    operations = list(operations)
+    if len(operations) <= 1:
+        for operation in operations:
+            operation()
+        return
+    workers = min(MAX_STAGING_WORKERS, len(operations))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cwltool-stage") as pool:
+        futures = [pool.submit(operation) for operation in operations]
+    for future in futures:
+        future.result()
+
+
+def log_stats(name: str, stats: StagingStats) -> None:
+    """Report the staging of a job's files, when it did more than linking."""
+    if stats.total == stats.counts["symlink"]:
+        _logger.debug("[job %s] staged %s", name, stats)
+    else:
+        _logger.info("[job %s] staged %s", name, stats)
@@ -0,0 +1,313 @@
+"""Stream a step's standard output to the step consuming it through a named pipe."""
+
+import os
+import shutil
+import signal
+import threading
+from typing import TYPE_CHECKING, NamedTuple, Optional, Union, cast
+
+from cwl_utils.types import CWLFileType, CWLObjectType
+from schema_salad.ref_resolver import file_uri
+
+from .context import RuntimeContext
+from .errors import WorkflowException
+from .job import JobBase
+from .loghandler import _logger
+from .process import shortname
+from .utils import JobsType, OutputCallbackType, WorkflowStateItem, aslist
+
+if TYPE_CHECKING:
+    from .workflow_job import WorkflowJob, WorkflowJobStep
+
+
+class StreamingLink(NamedTuple):
+    """A step output that can be streamed to the single step input consuming it."""
+
+    output: CWLObjectType
+    """The producing step output."""
+    output_field: str
+    """The name of the output of the producing tool."""
+    consumer: "WorkflowJobStep"
+
+
+def _is_plain_step(step: "WorkflowJobStep") -> bool:
+    return (
+        "scatter" not in step.tool
+        and "when" not in step.tool
+        and not step.tool.get("loop")
+        and step.step.embedded_tool.tool["class"] == "CommandLineTool"
+    )
+
+
+def find_streaming_links(workflow_job: "WorkflowJob") -> dict[str, StreamingLink]:
+    """
+    Find the producer / consumer step pairs that can be connected by a pipe.
+
+    A pair qualifies when the producer's output is its ``stdout``, marked
+    ``streamable``, and is consumed by exactly one step input (and by no
+    workflow output) whose tool parameter is ``streamable`` too. The
+    consumer must not need the file in any other way: no ``valueFrom``,
+    ``loadContents``, or ``secondaryFiles``. Otherwise the output is written
+    to disk as usual.
+
+    :returns: The links, keyed by the id of the producing step.
+    """
+    consumers: dict[str, list[tuple[Optional["WorkflowJobStep"], CWLObjectType]]] = {}
+    for step in workflow_job.steps:
+        for inp in step.tool["inputs"]:
+            for source in aslist(inp.get("source")):
+                consumers.setdefault(source, []).append((step, inp))
+    for out in workflow_job.tool["outputs"]:
+        for source in aslist(out.get("outputSource")):
+            consumers.setdefault(source, []).append((None, out))
+
+    links: dict[str, StreamingLink] = {}
+    for producer in workflow_job.steps:
+        if not _is_plain_step(producer):
+            continue
+        tool = producer.step.embedded_tool.tool
+        if "stdout" not in tool:
+            continue
+        for tool_out in tool["outputs"]:
+            binding = tool_out.get("outputBinding", {})
+            if (
+                not tool_out.get("streamable")
+                or binding.get("glob") != tool["stdout"]
+                or tool_out.get("secondaryFiles")
+                or binding.get("loadContents")
+                or binding.get("outputEval")
+            ):
+                continue
+            output_field = shortname(tool_out["id"])
+            output = next(
+                (o for o in producer.tool["outputs"] if shortname(o["id"]) == output_field),
+                None,
+            )
+            if output is None:
+                continue
+            users = consumers.get(output["id"], [])
+            if len(users) != 1:
+                continue
+            consumer, step_in = users[0]
+            if (
+                consumer is None
+                or consumer is producer
+                or not _is_plain_step(consumer)
+                or not isinstance(step_in.get("source"), str)
+                or "valueFrom" in step_in
+                or step_in.get("loadContents")
+            ):
+                continue
+            field = shortname(cast(str, step_in["id"]))
+            tool_in = next(
+                (
+                    i
+                    for i in consumer.step.embedded_tool.tool["inputs"]
+                    if shortname(i["id"]) == field
+                ),
+                None,
+            )
+            if (
+                tool_in is None
+                or not tool_in.get("streamable")
+                or tool_in.get("secondaryFiles")
+                or tool_in.get("loadContents")
+            ):
+                continue
+            links[producer.id] = StreamingLink(output, output_field, consumer)
+            break
+    return links
+
+
+def streaming_enabled(runtime_context: RuntimeContext) -> bool:
+    """Return True if steps may be connected by pipes in this run."""
+    return (
+        runtime_context.streaming_allowed
+        and not runtime_context.cachedir
+        and runtime_context.research_obj is None
+        and not runtime_context.log_dir
+    )
+
+
+def pair_resources(producer: JobBase, consumer: JobBase) -> dict[str, int | float]:
+    """Return the resources needed to run the producer and the consumer at once."""
+    resources = dict(producer.builder.resources)
+    for key, value in consumer.builder.resources.items():
+        resources[key] = resources.get(key, 0) + value
+    return resources
+
+
+def _release(fifo: str, flags: int) -> None:
+    """Open and close the pipe, so that a peer blocked opening it can proceed."""
+    try:
+        os.close(os.open(fifo, flags | os.O_NONBLOCK))
+    except OSError:
+        pass
+
+
+class StreamingJobPair:
+    """
+    A producer job and a consumer job, run concurrently and connected by a pipe.
+
+    The producer writes its standard output to a named pipe that the
+    consumer reads as its input. Both jobs run as a single unit, so that
+    neither can be left waiting for the other to be scheduled.
+    """
+
+    def __init__(
+        self,
+        producer: JobBase,
+        consumer: JobBase,
+        fifo: str,
+        output_field: str,
+        streamed: CWLFileType,
+    ) -> None:
+        """Connect the producer's standard output to the pipe read by the consumer."""
+        self.producer = producer
+        self.consumer = consumer
+        self.fifo = fifo
+        self.name = f"{producer.name} | {consumer.name}"
+        self.outdir = producer.outdir
+        self.prov_obj = None
+        assert producer.stdout is not None  # nosec
+        # The output is never written to disk, but its glob must still match.
+        placeholder = os.path.join(producer.outdir, producer.stdout)
+        os.makedirs(os.path.dirname(placeholder), exist_ok=True)
+        open(placeholder, "wb").close()
+        producer.stdout = fifo
+        # As in a shell pipeline, the consumer may stop reading before the end.
+        producer.successCodes = [
+            *producer.successCodes,
+            -signal.SIGPIPE,
+            128 + signal.SIGPIPE,
+        ]
+
+        output_callback = producer.output_callback
+
+        def streamed_output(outputs: CWLObjectType | None, process_status: str) -> None:
+            if outputs is not None and output_field in outputs:
+                outputs[output_field] = cast(CWLObjectType, dict(streamed))
+            if output_callback is not None:
+                output_callback(outputs, process_status)
+
+        producer.output_callback = streamed_output
+
+    @property
+    def outdirs(self) -> tuple[str, str]:
+        """Return the output directories of both jobs."""
+        return (self.producer.outdir, self.consumer.outdir)
+
+    @property
+    def resources(self) -> dict[str, int | float]:
+        """
+        Return the resources to allocate to the pair.
+
+        Both jobs run at the same time, so the pair needs the sum of their
+        resources.
+        """
+        return pair_resources(self.producer, self.consumer)
+
+    def run(
+        self,
+        runtimeContext: RuntimeContext,
+        tmpdir_lock: Union[threading.Lock, None] = None,
+    ) -> None:
+        """Run both jobs, until both have finished."""
+        _logger.info("[job %s] streaming through %s", self.name, self.fifo)
+        errors: list[BaseException] = []
+
+        def run_job(job: JobBase) -> None:
+            try:
+                job.run(runtimeContext, tmpdir_lock)
+            except BaseException as err:  # pylint: disable=broad-except
+                errors.append(err)
+
+        producer = threading.Thread(target=run_job, args=(self.producer,))
+        consumer = threading.Thread(target=run_job, args=(self.consumer,))
+        producer.start()
+        consumer.start()
+        try:
+            while producer.is_alive() or consumer.is_alive():
+                if not consumer.is_alive():
+                    # Nobody will read: let the producer open the pipe and stop.
+                    _release(self.fifo, os.O_RDONLY)
+                elif not producer.is_alive():
+                    # Nothing will be written: let the consumer see the end.
+                    _release(self.fifo, os.O_WRONLY)
+                producer.join(0.1)
+                consumer.join(0.1)
+        finally:
+            shutil.rmtree(os.path.dirname(self.fifo), ignore_errors=True)
+        if errors:
+            raise errors[0]
+
+
+def streamed_file(fifo: str, basename: str) -> CWLFileType:
+    """Return the File object standing for the content sent through the pipe."""
+    return cast(
+        CWLFileType,
+        {
+            "class": "File",
+            "location": file_uri(fifo),
+            "basename": basename,
+            "streamable": True,
+        },
+    )
+
+
+def connect(
+    workflow_job: "WorkflowJob",
+    link: StreamingLink,
+    producer: JobBase,
+    final_output_callback: OutputCallbackType,
+    runtime_context: RuntimeContext,
+) -> JobsType:
+    """
+    Pair the producer job with the job of the step consuming its output.
+
+    The consumer receives the output as a File backed by a named pipe. If
+    it cannot run yet, for instance because it waits for other inputs, or
+    if the executor cannot allocate the resources of both jobs at once, the
+    producer job is returned unchanged and its output is written to disk.
+    """
+    consumer = link.consumer
+    if consumer.submitted or producer.stdout is None:
+        return producer
+    output_id = cast(str, link.output["id"])
+    basename = os.path.basename(producer.stdout)
+    fifo = os.path.join(runtime_context.create_tmpdir(), basename)
+    os.mkfifo(fifo)
+    streamed = streamed_file(fifo, basename)
+    previous = workflow_job.state[output_id]
+    workflow_job.state[output_id] = WorkflowStateItem(
+        link.output, cast(CWLObjectType, dict(streamed)), "success"
+    )
+    consumer_jobs = workflow_job.try_make_job(consumer, final_output_callback, runtime_context)
+    consumer_job = next(consumer_jobs, None)
+    if not isinstance(consumer_job, JobBase):
+        workflow_job.state[output_id] = previous
+        shutil.rmtree(os.path.dirname(fifo), ignore_errors=True)
+        if consumer_job is not None:
+            raise WorkflowException(f"Cannot stream {output_id} to {consumer.name}")
+        return producer
+    if runtime_context.can_allocate is not None and not runtime_context.can_allocate(
+        pair_resources(producer, consumer_job)
+    ):
+        _logger.debug(
+            "[job %s] not streaming to %s, which cannot run at the same time",
+            producer.name,
+            consumer_job.name,
+        )
+        # the consumer is made again, reading the file, once it is written
+        consumer_jobs.close()
+        consumer.submitted = False
+        workflow_job.state[output_id] = previous
+        shutil.rmtree(os.path.dirname(fifo), ignore_errors=True)
+        for directory in (consumer_job.outdir, consumer_job.tmpdir):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                pass
+        return producer
+    consumer.iterable = consumer_jobs
+    return StreamingJobPair(producer, consumer_job, fifo, link.output_field, streamed)
@@ -21,12 +21,15 @@ except ImportError:
 import importlib.metadata
 import os
 import random
+import re
 import shutil
+import sqlite3
 import stat
 import string
 import subprocess  # nosec
 import sys
 import tempfile
+import threading
 import urllib
 import uuid
 from collections.abc import (
@@ -37,12 +40,11 @@ from collections.abc import (
     MutableSequence,
     Sequence,
 )
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from email.utils import parsedate_to_datetime
 from functools import partial
 from itertools import zip_longest
 from pathlib import Path, PurePosixPath
-from tempfile import NamedTemporaryFile
 from typing import (
     IO,
     TYPE_CHECKING,
@@ -56,12 +58,11 @@ from typing import (
     Union,
 )
 
-import requests
-from cachecontrol import CacheControl
-from cachecontrol.caches import FileCache
 from mypy_extensions import mypyc_attr
 from schema_salad.exceptions import ValidationException
 
+from .download import download_file
+
 if sys.version_info >= (3, 11):
     from typing import Required
 else:
@@ -70,9 +71,10 @@ else:
 if TYPE_CHECKING:
     from schema_salad.ref_resolver import Loader
 
-    from .command_line_tool import CallbackJob, ExpressionJob
+    from .command_line_tool import CachedOutputsJob, CallbackJob, ExpressionJob
     from .job import CommandLineJob, JobBase
     from .stdfsaccess import StdFsAccess
+    from .streaming import StreamingJobPair
     from .workflow_job import WorkflowJob
 
 __random_outdir: str | None = None
@@ -83,10 +85,18 @@ DEFAULT_TMP_PREFIX = tempfile.gettempdir() + os.path.sep
 
 processes_to_kill: Deque["subprocess.Popen[str]"] = collections.deque()
 
+_SIZE_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([kmgtp]?)i?b?\s*$", re.IGNORECASE)
+
 """Typical raw dictionary found in lightly parsed CWL."""
 
 JobsType: TypeAlias = Union[
-    "CommandLineJob", "JobBase", "WorkflowJob", "ExpressionJob", "CallbackJob"
+    "CommandLineJob",
+    "JobBase",
+    "WorkflowJob",
+    "ExpressionJob",
+    "CallbackJob",
+    "CachedOutputsJob",
+    "StreamingJobPair",
 ]
 JobsGeneratorType: TypeAlias = Generator[Optional[JobsType], None, None]
 OutputCallbackType: TypeAlias = Callable[[Optional[CWLObjectType], str], None]
@@ -281,14 +291,76 @@ def random_outdir() -> str:
     return __random_outdir
 
 
+def parse_size(value: str) -> int:
+    """Parse a size in bytes, with an optional K, M, G, T or P (binary) suffix."""
+    match = _SIZE_RE.match(value)
+    if match is None:
+        raise ValueError(f"Invalid size {value!r}")
+    number, unit = match.groups()
+    exponent = "kmgtp".index(unit.lower()) + 1 if unit else 0
+    return int(float(number) * 1024**exponent)
+
+
 def shared_file_lock(fd: IO[Any]) -> None:
     fcntl.flock(fd.fileno(), fcntl.LOCK_SH)
 
 
+def try_shared_file_lock(fd: IO[Any]) -> bool:
+    """Take a shared lock unless an exclusive one is held, and return whether it was taken."""
+    try:
+        fcntl.flock(fd.fileno(), fcntl.LOCK_SH | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
 def upgrade_lock(fd: IO[Any]) -> None:
     fcntl.flock(fd.fileno(), fcntl.LOCK_EX)
 
 
+class SharedThreadPool:
+    """A thread pool shared by the whole process, started on first use."""
+
+    def __init__(self, max_workers: int, thread_name_prefix: str) -> None:
+        """Describe the pool, without starting it."""
+        self.max_workers = max_workers
+        self.thread_name_prefix = thread_name_prefix
+        self._pool: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def get(self) -> ThreadPoolExecutor:
+        """Return the pool, starting it if needed."""
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix=self.thread_name_prefix
+                )
+            return self._pool
+
+
+class ThreadLocalConnection:
+    """
+    A connection to an SQLite database for each thread, as connections can not be shared.
+
+    The databases use a rollback journal, as the shared memory of a
+    write-ahead log does not work across the hosts of a network filesystem.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Connect to the database at ``path`` from each thread on its first use."""
+        self.path = path
+        self._local = threading.local()
+
+    def get(self) -> sqlite3.Connection:
+        """Return the connection of the current thread."""
+        connection: sqlite3.Connection | None = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=60)
+            connection.execute("PRAGMA journal_mode=DELETE")
+            self._local.connection = connection
+        return connection
+
+
 def adjustFileObjs(rec: Any, op: Union[Callable[[CWLFileType], Any], "partial[Any]"]) -> None:
     """Apply an update function to each File object in the object `rec`."""
     visit_files(rec, op)
@@ -379,37 +451,13 @@ def downloadHttpFile(httpurl: str) -> tuple[str, datetime | None]:
     """
     Download a remote file, possibly using a locally cached copy.
 
+    See :py:func:`cwltool.download.download_file`.
+
     Returns a tuple:
     - the local path for the downloaded file
     - the Last-Modified timestamp if received from the remote server.
     """
-    cache_session = None
-    if "XDG_CACHE_HOME" in os.environ:
-        directory = os.environ["XDG_CACHE_HOME"]
-    elif "HOME" in os.environ:
-        directory = os.path.join(os.environ["HOME"], ".cache")
-    else:
-        directory = os.path.join(os.path.expanduser("~"), ".cache")
-
-    cache_session = CacheControl(
-        requests.Session(),
-        cache=FileCache(os.path.join(directory, "cwltool")),
-    )
-
-    r = cache_session.get(httpurl, stream=True)
-    with NamedTemporaryFile(mode="wb", delete=False) as f:
-        for chunk in r.iter_content(chunk_size=16384):
-            if chunk:  # filter out keep-alive new chunks
-                f.write(chunk)
-    r.close()
-
-    date_raw: str | None = r.headers.get("Last-Modified", None)
-    date: datetime | None = parsedate_to_datetime(date_raw) if date_raw else None
-    if date:
-        date_epoch = date.timestamp()
-        os.utime(f.name, (date_epoch, date_epoch))
-
-    return str(f.name), date
+    return download_file(httpurl)
 
 
 def ensure_writable(path: str, include_root: bool = False) -> None:
@@ -14,6 +14,7 @@ from schema_salad.exceptions import ValidationException
 from schema_salad.sourceline import SourceLine, indent
 
 from . import command_line_tool, context, procgenerator
+from .cache_lookup import CacheLookup, ScatterLookups
 from .checker import circular_dependency_checker, loop_checker, static_checker
 from .context import LoadingContext, RuntimeContext, getdefault
 from .cwlprov.provenance_profile import ProvenanceProfile
@@ -21,6 +22,7 @@ from .cwlprov.writablebagfile import create_job
 from .errors import WorkflowException
 from .load_tool import load_tool
 from .loghandler import _logger
+from .memo import lookup_outputs, memo_key, memoizing_callback
 from .process import Process, get_overrides, shortname
 from .utils import JobsGeneratorType, OutputCallbackType, StepType, aslist
 from .workflow_job import WorkflowJob
@@ -61,6 +63,8 @@ class Workflow(Process):
     ) -> None:
         """Initialize this Workflow."""
         super().__init__(toolpath_object, loadingContext)
+        # the steps look at their own inputs
+        self.reads_checksums = False
         self.provenance_object: ProvenanceProfile | None = None
         if loadingContext.research_obj is not None:
             run_uuid: UUID | None = None
@@ -404,6 +408,30 @@ class WorkflowStep(Process):
                 processStatus = "permanentFail"
         output_callback(output, processStatus)
 
+    def _step_input(self, job_order: CWLObjectType) -> CWLObjectType:
+        step_input = {}
+        for inp in self.tool["inputs"]:
+            field = shortname(inp["id"])
+            if not inp.get("not_connected"):
+                step_input[field] = job_order[inp["id"]]
+        return step_input
+
+    def scatter_lookups(self, runtimeContext: RuntimeContext) -> ScatterLookups | None:
+        """Return the lookups of the jobs of a scatter, if done ahead of their generation."""
+        if runtimeContext.cachedir and isinstance(
+            self.embedded_tool, command_line_tool.CommandLineTool
+        ):
+            return ScatterLookups(self, runtimeContext)
+        return None
+
+    def cache_lookup(
+        self, job_order: CWLObjectType, runtimeContext: RuntimeContext
+    ) -> CacheLookup | None:
+        """Look up the job of the CommandLineTool run by this step in the --cachedir."""
+        return cast(command_line_tool.CommandLineTool, self.embedded_tool).cache_lookup(
+            self._step_input(job_order), runtimeContext
+        )
+
     def job(
         self,
         job_order: CWLObjectType,
@@ -425,18 +453,48 @@ class WorkflowStep(Process):
                 self.embedded_tool.provenance_object.workflow_run_uri,
             )
 
-        step_input = {}
-        for inp in self.tool["inputs"]:
-            field = shortname(inp["id"])
-            if not inp.get("not_connected"):
-                step_input[field] = job_order[inp["id"]]
-
-        try:
-            yield from self.embedded_tool.job(
+        step_input = self._step_input(job_order)
+        output_callback: OutputCallbackType = functools.partial(
+            self.receive_output, output_callbacks
+        )
+        if (
+            runtimeContext.cache_subworkflows
+            and runtimeContext.cachedir
+            and runtimeContext.research_obj is None
+            and isinstance(self.embedded_tool, Workflow)
+        ):
+            cachekey = memo_key(
+                self.embedded_tool,
                 step_input,
-                functools.partial(self.receive_output, output_callbacks),
-                runtimeContext,
+                {
+                    "use_container": runtimeContext.use_container,
+                    "default_container": runtimeContext.default_container,
+                },
             )
+            if cachekey is not None:
+                cache_backend = runtimeContext.get_cache_backend()
+                outputs = lookup_outputs(
+                    cache_backend, cachekey, runtimeContext.cache_check == "checksum"
+                )
+                if outputs is not None:
+                    _logger.info(
+                        "[step %s] Using cached output of %s", shortname(self.id), cachekey
+                    )
+                    if runtimeContext.cache_plan is not None:
+                        runtimeContext.cache_plan.add(
+                            shortname(self.id), self.embedded_tool.tool["id"], "hit", cachekey
+                        )
+                    yield command_line_tool.CachedOutputsJob(
+                        shortname(self.id), outputs, output_callback
+                    )
+                    return
+                if runtimeContext.cache_plan is None:
+                    output_callback = memoizing_callback(
+                        cache_backend, cachekey, self.embedded_tool.tool["id"], output_callback
+                    )
+
+        try:
+            yield from self.embedded_tool.job(step_input, output_callback, runtimeContext)
         except WorkflowException:
             _logger.error(
                 "Exception on step '%s'", runtimeContext.name, exc_info=runtimeContext.debug
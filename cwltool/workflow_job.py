@@ -3,21 +3,25 @@ import datetime
 import functools
 import logging
 import threading
-from collections.abc import MutableMapping, MutableSequence, Sized
+from collections.abc import MutableMapping, MutableSequence, Sequence, Sized
 from typing import TYPE_CHECKING, Optional, Union, cast
 
 from cwl_utils import expression
-from cwl_utils.types import CWLObjectType, CWLOutputType, SinkType
+from cwl_utils.types import CWLFileType, CWLObjectType, CWLOutputType, SinkType
 from schema_salad.sourceline import SourceLine
 from schema_salad.utils import json_dumps
 
 from .builder import content_limit_respected_read
+from .cache_plan import is_pending, pending
 from .checker import can_assign_src_to_sink
+from .checksum import checksum_files, mentions_checksum
 from .context import RuntimeContext, getdefault
 from .errors import WorkflowException
+from .job import JobBase
 from .loghandler import _logger
 from .process import shortname, uniquename
 from .stdfsaccess import StdFsAccess
+from .streaming import connect, find_streaming_links, streaming_enabled
 from .utils import (
     JobsGeneratorType,
     OutputCallbackType,
@@ -28,9 +32,11 @@ from .utils import (
     adjustDirObjs,
     aslist,
     get_listing,
+    visit_files,
 )
 
 if TYPE_CHECKING:
+    from .cache_lookup import ScatterLookups
     from .cwlprov.provenance_profile import ProvenanceProfile
     from .workflow import Workflow, WorkflowStep
 
@@ -132,36 +138,45 @@ def parallel_steps(
     steps: list[JobsGeneratorType | None],
     rc: ReceiveScatterOutput,
     runtimeContext: RuntimeContext,
+    lookups: Sequence["ScatterLookups"] = (),
 ) -> JobsGeneratorType:
-    while rc.completed < rc.total:
-        made_progress = False
-        for index, step in enumerate(steps):
-            if getdefault(runtimeContext.on_error, "stop") == "stop" and rc.processStatus not in (
-                "success",
-                "skipped",
-            ):
-                break
-            if step is None:
-                continue
-            try:
-                for j in step:
-                    if getdefault(
-                        runtimeContext.on_error, "stop"
-                    ) == "stop" and rc.processStatus not in ("success", "skipped"):
-                        break
-                    if j is not None:
-                        made_progress = True
-                        yield j
-                    else:
-                        break
-                if made_progress:
+    """
+    Generate the jobs of the steps of a scatter, in turns.
+
+    The ``lookups`` of the scatter are closed once it is done, or stopped.
+    """
+    try:
+        while rc.completed < rc.total:
+            made_progress = False
+            for index, step in enumerate(steps):
+                if getdefault(
+                    runtimeContext.on_error, "stop"
+                ) == "stop" and rc.processStatus not in ("success", "skipped"):
                     break
-            except WorkflowException as exc:
-                _logger.error("Cannot make scatter job: %s", str(exc))
-                _logger.debug("", exc_info=True)
-                rc.receive_scatter_output(index, {}, "permanentFail")
-        if not made_progress and rc.completed < rc.total:
-            yield None
+                if step is None:
+                    continue
+                try:
+                    for j in step:
+                        if getdefault(
+                            runtimeContext.on_error, "stop"
+                        ) == "stop" and rc.processStatus not in ("success", "skipped"):
+                            break
+                        if j is not None:
+                            made_progress = True
+                            yield j
+                        else:
+                            break
+                    if made_progress:
+                        break
+                except WorkflowException as exc:
+                    _logger.error("Cannot make scatter job: %s", str(exc))
+                    _logger.debug("", exc_info=True)
+                    rc.receive_scatter_output(index, {}, "permanentFail")
+            if not made_progress and rc.completed < rc.total:
+                yield None
+    finally:
+        for lookup in lookups:
+            lookup.close()
 
 
 def nested_crossproduct_scatter(
@@ -178,6 +193,7 @@ def nested_crossproduct_scatter(
         output[i["id"]] = [None] * jobl
 
     rc = ReceiveScatterOutput(output_callback, output, jobl)
+    lookups = process.step.scatter_lookups(runtimeContext) if len(scatter_keys) == 1 else None
 
     steps: list[JobsGeneratorType | None] = []
     for index in range(0, jobl):
@@ -190,7 +206,11 @@ def nested_crossproduct_scatter(
                 sjob = runtimeContext.postScatterEval(sjob)
             curriedcallback = functools.partial(rc.receive_scatter_output, index)
             if sjob is not None:
-                steps.append(process.job(sjob, curriedcallback, runtimeContext))
+                steps.append(
+                    process.job(
+                        sjob, curriedcallback, lookups.add(sjob) if lookups else runtimeContext
+                    )
+                )
             else:
                 curriedcallback({}, "skipped")
                 steps.append(None)
@@ -206,7 +226,7 @@ def nested_crossproduct_scatter(
             )
 
     rc.setTotal(jobl, steps)
-    return parallel_steps(steps, rc, runtimeContext)
+    return parallel_steps(steps, rc, runtimeContext, [lookups] if lookups else [])
 
 
 def crossproduct_size(joborder: CWLObjectType, scatter_keys: MutableSequence[str]) -> int:
@@ -232,11 +252,12 @@ def flat_crossproduct_scatter(
     for i in process.tool["outputs"]:
         output[i["id"]] = [None] * crossproduct_size(joborder, scatter_keys)
     callback = ReceiveScatterOutput(output_callback, output, 0)
+    lookups: list["ScatterLookups"] = []
     steps, total = _flat_crossproduct_scatter(
-        process, joborder, scatter_keys, callback, 0, runtimeContext
+        process, joborder, scatter_keys, callback, 0, runtimeContext, lookups
     )
     callback.setTotal(total, steps)
-    return parallel_steps(steps, callback, runtimeContext)
+    return parallel_steps(steps, callback, runtimeContext, lookups)
 
 
 def _flat_crossproduct_scatter(
@@ -246,12 +267,16 @@ def _flat_crossproduct_scatter(
     callback: ReceiveScatterOutput,
     startindex: int,
     runtimeContext: RuntimeContext,
+    lookups: list["ScatterLookups"],
 ) -> tuple[list[JobsGeneratorType | None], int]:
-    """Inner loop."""
+    """Inner loop, collecting the ``lookups`` of the scatter."""
     scatter_key = scatter_keys[0]
     jobl = len(cast(Sized, joborder[scatter_key]))
     steps: list[JobsGeneratorType | None] = []
     put = startindex
+    step_lookups = process.step.scatter_lookups(runtimeContext) if len(scatter_keys) == 1 else None
+    if step_lookups:
+        lookups.append(step_lookups)
     for index in range(0, jobl):
         sjob: CWLObjectType | None = copy.copy(joborder)
         assert sjob is not None  # nosec
@@ -262,14 +287,20 @@ def _flat_crossproduct_scatter(
                 sjob = runtimeContext.postScatterEval(sjob)
             curriedcallback = functools.partial(callback.receive_scatter_output, put)
             if sjob is not None:
-                steps.append(process.job(sjob, curriedcallback, runtimeContext))
+                steps.append(
+                    process.job(
+                        sjob,
+                        curriedcallback,
+                        step_lookups.add(sjob) if step_lookups else runtimeContext,
+                    )
+                )
             else:
                 curriedcallback({}, "skipped")
                 steps.append(None)
             put += 1
         else:
             add, _ = _flat_crossproduct_scatter(
-                process, sjob, scatter_keys[1:], callback, put, runtimeContext
+                process, sjob, scatter_keys[1:], callback, put, runtimeContext, lookups
             )
             put += len(add)
             steps.extend(add)
@@ -300,6 +331,7 @@ def dotproduct_scatter(
         output[i["id"]] = [None] * jobl
 
     rc = ReceiveScatterOutput(output_callback, output, jobl)
+    lookups = process.step.scatter_lookups(runtimeContext)
 
     steps: list[JobsGeneratorType | None] = []
     for index in range(0, jobl):
@@ -312,13 +344,17 @@ def dotproduct_scatter(
             sjobo = runtimeContext.postScatterEval(sjobo)
         curriedcallback = functools.partial(rc.receive_scatter_output, index)
         if sjobo is not None:
-            steps.append(process.job(sjobo, curriedcallback, runtimeContext))
+            steps.append(
+                process.job(
+                    sjobo, curriedcallback, lookups.add(sjobo) if lookups else runtimeContext
+                )
+            )
         else:
             curriedcallback({}, "skipped")
             steps.append(None)
 
     rc.setTotal(jobl, steps)
-    return parallel_steps(steps, rc, runtimeContext)
+    return parallel_steps(steps, rc, runtimeContext, [lookups] if lookups else [])
 
 
 def match_types(
@@ -484,6 +520,7 @@ class WorkflowJob:
         self.did_callback = False
         self.made_progress: bool | None = None
         self.outdir = runtimeContext.get_outdir()
+        self.relocator = runtimeContext.early_relocator if runtimeContext.toplevel else None
 
         self.name = uniquename(
             "workflow {}".format(
@@ -562,6 +599,9 @@ class WorkflowJob:
         if _logger.isEnabledFor(logging.DEBUG):
             _logger.debug("[%s] produced output %s", step.name, json_dumps(jobout, indent=4))
 
+        if self.relocator is not None and processStatus == "success":
+            self.relocate_final_outputs(outputparms, jobout)
+
         if processStatus not in ("success", "skipped"):
             if self.processStatus != "permanentFail":
                 self.processStatus = processStatus
@@ -580,6 +620,21 @@ class WorkflowJob:
         if completed == len(self.steps):
             self.do_output_callback(final_output_callback)
 
+    def relocate_final_outputs(
+        self, outputparms: list[CWLObjectType], jobout: CWLObjectType
+    ) -> None:
+        """Start relocating the step outputs that are also workflow outputs."""
+        if self.relocator is None:
+            return
+        sources: set[str] = set()
+        for out in self.tool["outputs"]:
+            source = out.get("outputSource", [])
+            sources.update(aslist(source))
+        for i in outputparms:
+            iid = cast(str, i.get("id"))
+            if iid in sources and iid in jobout:
+                self.relocator.submit(jobout[iid])
+
     def try_make_job(
         self,
         step: WorkflowJobStep,
@@ -615,10 +670,27 @@ class WorkflowJob:
                 self.receive_output, step, outputparms, final_output_callback
             )
 
+            if runtimeContext.cache_plan is not None and is_pending(inputobj):
+                # what the step would run depends on jobs that would run before it
+                runtimeContext.cache_plan.add(
+                    shortname(step.id), step.step.embedded_tool.tool["id"], "pending"
+                )
+                step.submitted = True
+                callback({k["id"]: pending() for k in outputparms}, "success")
+                return
+
             valueFrom = {i["id"]: i["valueFrom"] for i in step.tool["inputs"] if "valueFrom" in i}
 
             loadContents = {i["id"] for i in step.tool["inputs"] if i.get("loadContents")}
 
+            checksumInputs = (
+                runtimeContext.lazy_checksum
+                and getdefault(runtimeContext.compute_checksum, True)
+                and mentions_checksum(
+                    [valueFrom, step.tool.get("when"), self.workflow.requirements]
+                )
+            )
+
             if len(valueFrom) > 0 and not bool(
                 self.workflow.get_requirement("StepInputExpressionRequirement")[0]
             ):
@@ -636,6 +708,10 @@ class WorkflowJob:
                         if val.get("contents") is None:
                             with fs_access.open(cast(str, val["location"]), "rb") as f:
                                 val["contents"] = content_limit_respected_read(f)
+                if checksumInputs:
+                    fileobjs: list[CWLFileType] = []
+                    visit_files(io, fileobjs.append)
+                    checksum_files(fs_access, fileobjs)
 
                 def valueFromFunc(k: str, v: CWLOutputType | None) -> CWLOutputType | None:
                     if k in valueFrom:
@@ -802,6 +878,8 @@ class WorkflowJob:
             for out in step.tool["outputs"]:
                 self.state[out["id"]] = None
 
+        links = find_streaming_links(self) if streaming_enabled(runtimeContext) else {}
+
         completed = 0
         while completed < len(self.steps):
             self.made_progress = False
@@ -831,6 +909,14 @@ class WorkflowJob:
                                 break
                             if newjob is not None:
                                 self.made_progress = True
+                                if step.id in links and isinstance(newjob, JobBase):
+                                    newjob = connect(
+                                        self,
+                                        links[step.id],
+                                        newjob,
+                                        output_callback,
+                                        runtimeContext,
+                                    )
                                 yield newjob
                             else:
                                 break
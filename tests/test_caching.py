@@ -1,7 +1,38 @@
+import fcntl
+import hashlib
+import json
+import os
 import re
+import threading
 from pathlib import Path
+from typing import Any, cast
 
 import pytest
+from cwl_utils.types import CWLDirectoryType, CWLFileType, CWLObjectType
+from pytest_httpserver import HTTPServer
+from schema_salad.ref_resolver import file_uri
+from werkzeug.wrappers import Request, Response
+
+from cwltool.cache_backend import (
+    CacheEntry,
+    DirectoryCacheBackend,
+    HTTPObjectStore,
+    ObjectStoreCacheBackend,
+)
+from cwltool.cache_lookup import STAGED_FIELDS, CacheLookup, ScatterLookups
+from cwltool.command_line_tool import (
+    CallbackJob,
+    CommandLineTool,
+    ExpressionJob,
+    cache_key_files,
+)
+from cwltool.context import LoadingContext, RuntimeContext
+from cwltool.job import JobBase
+from cwltool.job_cache import BLOB_MIN_SIZE, BLOBS_NAME, JobCache
+from cwltool.load_tool import load_tool
+from cwltool.memo import lookup_outputs, store_outputs
+from cwltool.pathmapper import PathMapper
+from cwltool.utils import shared_file_lock, upgrade_lock
 
 from .util import get_data, get_main_output, needs_docker
 
@@ -170,3 +201,583 @@ def test_cache_dockerreq_hint_instead_of_req(tmp_path: Path, factor: str) -> Non
         "when DockerRequirement is in 'requirements" in stderr2
     )
     assert error_code2 == 1
+
+
+def test_cache_key_files(tmp_path: Path) -> None:
+    """The Files of a job with many inputs are all described in its cache key."""
+    files: list[CWLFileType | CWLDirectoryType] = []
+    for i in range(10000):
+        (tmp_path / f"f{i}.txt").write_text(str(i))
+        fileobj: CWLFileType = {
+            "class": "File",
+            "location": file_uri(str(tmp_path / f"f{i}.txt")),
+            "basename": f"f{i}.txt",
+        }
+        if i % 2:
+            fileobj["checksum"] = "sha1$%040d" % i
+        files.append(fileobj)
+    pathmapper = PathMapper(files, str(tmp_path), "/stage", separateDirs=False)
+
+    keys = cache_key_files(files, pathmapper, str(tmp_path))
+
+    assert len(keys) == 10000
+    assert keys["f1.txt"] == [1, "sha1$%040d" % 1]
+    assert keys["f9998.txt"] == [4, int(os.stat(tmp_path / "f9998.txt").st_mtime * 1000)]
+
+
+def test_cache_key_extension(tmp_path: Path) -> None:
+    """The arguments, environment variables and File times excluded by cwltool:CacheKey."""
+    (tmp_path / "dir").mkdir()
+    (tmp_path / "dir" / "f.txt").write_text("x")
+    stderrs = []
+    for threads, contents in (("1", None), ("2", None), ("2", "y")):
+        if contents is not None:
+            (tmp_path / "dir" / "f.txt").write_text(contents)
+        else:
+            # touched but unchanged
+            os.utime(tmp_path / "dir" / "f.txt", (0, int(threads)))
+        error_code, _, stderr = get_main_output(
+            [
+                "--enable-ext",
+                "--out",
+                str(tmp_path / "out"),
+                "--cachedir",
+                str(tmp_path / "cache"),
+                get_data("tests/wf/cache-key-tool.cwl"),
+                "--dir",
+                str(tmp_path / "dir"),
+                "--threads",
+                threads,
+            ]
+        )
+        assert error_code == 0, stderr
+        stderrs.append(stderr)
+    assert "Output of job will be cached in" in stderrs[0]
+    assert "Using cached output in" in stderrs[1]
+    assert "Output of job will be cached in" in stderrs[2]
+
+
+def _sha1(data: bytes) -> str:
+    return "sha1$" + hashlib.sha1(data).hexdigest()  # nosec
+
+
+def _cached_job(cachedir: Path, key: str, size: int, status: str = "success") -> None:
+    (cachedir / key).mkdir(parents=True)
+    (cachedir / key / "out").write_bytes(b"x" * size)
+    (cachedir / f"{key}.status").write_text(status)
+
+
+def test_job_cache_eviction(tmp_path: Path) -> None:
+    """The least recently used jobs not in use are evicted first."""
+    first, second, third, running = (str(i) * 32 for i in range(4))
+    for key in (first, second, third):
+        _cached_job(tmp_path, key, 100)
+    _cached_job(tmp_path, running, 100, status="")
+    job_cache = JobCache(str(tmp_path))
+    job_cache.sync()
+    assert job_cache.stats().entries == 3
+
+    job_cache.hit(first)
+    with open(tmp_path / f"{second}.status", "a+") as status_file:
+        shared_file_lock(status_file)
+        # third is the only job neither used by this cwltool nor locked by another one
+        assert job_cache.evict(250) == 1
+    assert not (tmp_path / third).exists()
+    assert not (tmp_path / f"{third}.status").exists()
+    assert (tmp_path / second).exists()
+    assert job_cache.stats().size == 200
+
+    with open(tmp_path / f"{running}.status", "a+") as status_file:
+        upgrade_lock(status_file)
+        assert job_cache.gc() == 0
+    assert job_cache.gc() == 1
+    assert not (tmp_path / running).exists()
+    assert not (tmp_path / f"{running}.status").exists()
+
+
+def test_cache_stats_and_gc(tmp_path: Path) -> None:
+    """The jobs cached by a run are reported on, and can be collected."""
+    cache_dir = str(tmp_path / "cwltool_cache")
+    error_code, _, stderr = get_main_output(
+        [
+            "--cache-subworkflows",
+            "--out",
+            str(tmp_path / "out"),
+            "--cachedir",
+            cache_dir,
+            get_data("tests/wf/checksum-wf.cwl"),
+            "--message",
+            "hello",
+        ]
+    )
+    assert error_code == 0, stderr
+
+    error_code, stdout, stderr = get_main_output(["--cachedir", cache_dir, "--cache-stats"])
+    assert error_code == 0, stderr
+    stats = json.loads(stdout)
+    # the echo job, and the memoised outputs of the expression
+    outputs = {"checksum": _sha1(b"hello\n")}
+    assert stats["entries"] == 2
+    assert stats["size"] == len("hello\n") + len(json.dumps(outputs))
+    assert [tool["entries"] for tool in stats["tools"]] == [1, 1]
+    assert stats["hits"] == 0
+
+    # the uses of the cached jobs are recorded at the end of the run
+    error_code, _, stderr = get_main_output(
+        [
+            "--cache-subworkflows",
+            "--out",
+            str(tmp_path / "out"),
+            "--cachedir",
+            cache_dir,
+            get_data("tests/wf/checksum-wf.cwl"),
+            "--message",
+            "hello",
+        ]
+    )
+    assert error_code == 0, stderr
+    error_code, stdout, stderr = get_main_output(["--cachedir", cache_dir, "--cache-stats"])
+    assert error_code == 0, stderr
+    assert json.loads(stdout)["hits"] == 2
+
+    error_code, stdout, stderr = get_main_output(
+        ["--cachedir", cache_dir, "--cache-gc", "--cache-max-size", "0", "--cache-stats"]
+    )
+    assert error_code == 0, stderr
+    assert json.loads(stdout)["entries"] == 0
+    assert "Removed 2 job(s)" in stderr
+
+
+def test_cache_check_and_verify(tmp_path: Path) -> None:
+    """Damaged cached jobs are run again with --cache-check, and removed by --cache-verify."""
+    cache_dir = tmp_path / "cwltool_cache"
+    run = [
+        "--cache-subworkflows",
+        "--out",
+        str(tmp_path / "out"),
+        "--cachedir",
+        str(cache_dir),
+        get_data("tests/wf/checksum-wf.cwl"),
+        "--message",
+        "hello",
+    ]
+    error_code, _, stderr = get_main_output(run)
+    assert error_code == 0, stderr
+    (output,) = (path for path in cache_dir.glob("*/*") if path.read_bytes() == b"hello\n")
+
+    # same size, only found by its checksum
+    output.write_bytes(b"HELLO\n")
+    error_code, stdout, stderr = get_main_output(["--cache-check", "size"] + run)
+    assert error_code == 0, stderr
+    assert json.loads(stdout) == {"checksum": _sha1(b"HELLO\n")}
+    error_code, stdout, stderr = get_main_output(["--cache-check", "checksum"] + run)
+    assert error_code == 0, stderr
+    assert "Not using damaged cached output" in stderr
+    assert json.loads(stdout) == {"checksum": _sha1(b"hello\n")}
+    assert output.read_bytes() == b"hello\n"
+
+    output.write_bytes(b"hell")
+    error_code, stdout, stderr = get_main_output(
+        ["--cachedir", str(cache_dir), "--cache-verify", "--cache-check", "size", "--cache-stats"]
+    )
+    assert error_code == 0, stderr
+    assert "Removed 1 damaged job(s)" in stderr
+    # the memoised outputs of the expression, for both contents
+    assert json.loads(stdout)["entries"] == 2
+    assert not output.exists()
+
+
+def test_cache_shared_between_nodes(tmp_path: Path) -> None:
+    """A job cached by one node is reused by another through an object store."""
+    stderrs = []
+    for node in ("node1", "node2"):
+        error_code, stdout, stderr = get_main_output(
+            [
+                "--out",
+                str(tmp_path / node / "out"),
+                "--cachedir",
+                str(tmp_path / node / "cache"),
+                "--cache-url",
+                file_uri(str(tmp_path / "store")),
+                get_data("tests/wf/checksum-wf.cwl"),
+                "--message",
+                "hello",
+            ]
+        )
+        assert error_code == 0, stderr
+        assert json.loads(stdout) == {"checksum": "sha1$f572d396fae9206628714fb2ce00f72e94f2258f"}
+        stderrs.append(re.sub(r"\s\s+", " ", stderr))
+    assert "Output of job will be cached in" in stderrs[0]
+    assert "Using cached output in " + str(tmp_path / "node2" / "cache") in stderrs[1]
+
+
+def test_http_object_store_cache_backend(tmp_path: Path) -> None:
+    """Jobs are published to, fetched from and evicted from an HTTP object store."""
+    objects: dict[str, bytes] = {}
+    uploading = threading.Event()
+
+    def handler(request: Request) -> Response:
+        name = request.path.lstrip("/")
+        if request.method == "PUT":
+            assert uploading.wait(10)
+            objects[name] = request.get_data()
+        elif request.method == "DELETE":
+            objects.pop(name, None)
+        elif name not in objects:
+            return Response(status=404)
+        return Response(objects.get(name, b""))
+
+    with HTTPServer() as httpserver:
+        httpserver.expect_request(re.compile("/.*")).respond_with_handler(handler)
+        store = HTTPObjectStore(httpserver.url_for("/"))
+        node1 = ObjectStoreCacheBackend(store, str(tmp_path / "node1"))
+        node2 = ObjectStoreCacheBackend(store, str(tmp_path / "node2"))
+        key = "0" * 32
+
+        assert node2.lookup(key) is None
+        lease = node1.lease(key)
+        (Path(lease.outdir) / "out.txt").write_text("hello")
+        # uploaded in the background, while the job is available locally
+        node1.publish(lease, "tool.cwl", "success")
+        entry = node1.lookup(key)
+        assert entry is not None
+        node1.release(entry)
+        assert objects == {}
+        uploading.set()
+        node1.flush()
+        assert sorted(objects) == [f"{key}.json", f"{key}.tar"]
+
+        entry = node2.lookup(key)
+        assert entry is not None
+        assert (Path(node2.fetch(entry)) / "out.txt").read_text() == "hello"
+        node2.release(entry)
+        assert node2.local.index.stats().tools[0].tool == "tool.cwl"
+
+        # jobs used by a cwltool are not evicted by it
+        assert not node2.evict(key)
+        assert ObjectStoreCacheBackend(store, str(tmp_path / "node2")).evict(key)
+        assert objects == {}
+        assert not (tmp_path / "node2" / key).exists()
+
+
+def test_cached_output_updated_in_place(tmp_path: Path) -> None:
+    """Deduplicated cached outputs are copied before a job updates them in place."""
+    cache_dir = tmp_path / "cwltool_cache"
+    error_code, stdout, stderr = get_main_output(
+        [
+            "--enable-ext",
+            "--no-container",
+            "--out",
+            str(tmp_path / "out"),
+            "--cachedir",
+            str(cache_dir),
+            "--cache-deduplicate",
+            get_data("tests/wf/cache-inplace-wf.cwl"),
+        ]
+    )
+    assert error_code == 0, stderr
+    outputs = json.loads(stdout)
+    assert Path(outputs["updated"]["path"]).read_text().startswith("1 ")
+    assert Path(outputs["other"]["path"]).read_text().startswith("0 ")
+
+    error_code, stdout, stderr = get_main_output(
+        ["--cachedir", str(cache_dir), "--cache-verify", "--cache-stats"]
+    )
+    assert error_code == 0, stderr
+    assert "Removed 0 damaged job(s)" in stderr
+    assert json.loads(stdout)["blobs"] == 1
+
+
+def test_job_cache_deduplication(tmp_path: Path) -> None:
+    """Identical outputs are stored once, until the last job using them is removed."""
+    contents = b"x" * BLOB_MIN_SIZE
+    first, second = "1" * 32, "2" * 32
+    _cached_job(tmp_path, first, 10)
+    _cached_job(tmp_path, second, 10)
+    for key in (first, second):
+        (tmp_path / key / "index").write_bytes(contents)
+    job_cache = JobCache(str(tmp_path), deduplicate=True)
+    job_cache.add(first, "tool.cwl")
+    job_cache.add(second, "tool.cwl", {str(tmp_path / second / "index"): _sha1(contents)})
+
+    assert os.path.samefile(tmp_path / first / "index", tmp_path / second / "index")
+    assert not os.path.samefile(tmp_path / first / "out", tmp_path / second / "out")
+    stats = job_cache.stats()
+    assert (stats.size, stats.blobs, stats.blob_size) == (20 + len(contents), 1, len(contents))
+
+    job_cache = JobCache(str(tmp_path), deduplicate=True)
+    assert job_cache.remove(first)
+    assert (tmp_path / second / "index").read_bytes() == contents
+    assert job_cache.stats().blobs == 1
+    assert job_cache.remove(second)
+    assert job_cache.stats().blobs == 0
+    assert os.listdir(tmp_path / BLOBS_NAME / _sha1(contents)[5:7]) == []
+
+
+def test_job_cache_verify_deduplicated(tmp_path: Path) -> None:
+    """A damaged blob is dropped from the store, and not linked into the job computed again."""
+    contents = b"x" * BLOB_MIN_SIZE
+    first, second = "1" * 32, "2" * 32
+    _cached_job(tmp_path, first, 10)
+    _cached_job(tmp_path, second, 10)
+    for key in (first, second):
+        (tmp_path / key / "index").write_bytes(contents)
+    job_cache = JobCache(str(tmp_path), deduplicate=True)
+    job_cache.add(first, "tool.cwl")
+    job_cache.add(second, "tool.cwl")
+    assert job_cache.verify(first, checksums=True)
+
+    with open(tmp_path / first / "index", "r+b") as f:
+        f.write(b"y")
+    assert job_cache.verify(first)
+    assert not job_cache.verify(first, checksums=True)
+    assert os.listdir(tmp_path / BLOBS_NAME / _sha1(contents)[5:7]) == []
+
+    (tmp_path / first / "index").unlink()
+    (tmp_path / first / "index").write_bytes(contents)
+    job_cache.add(first, "tool.cwl")
+    assert job_cache.verify(first, checksums=True)
+    assert not job_cache.verify(second, checksums=True)
+
+
+def test_memoised_expressions_and_subworkflows(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Cached ExpressionTools are not evaluated again, nor cached subworkflows expanded."""
+    cache_dir = str(tmp_path / "cwltool_cache")
+    args = [
+        "--out",
+        str(tmp_path / "out"),
+        "--cachedir",
+        cache_dir,
+        get_data("tests/wf/checksum-scatter-wf.cwl"),
+        "--messages",
+        "hello",
+        "--messages",
+        "world",
+    ]
+    expected = {"checksums": [_sha1(b"hello\n"), _sha1(b"world\n")]}
+    error_code, stdout, stderr = get_main_output(["--cache-subworkflows"] + args)
+    assert error_code == 0, stderr
+    assert json.loads(stdout) == expected
+
+    ran: list[str] = []
+    monkeypatch.setattr(ExpressionJob, "run", lambda *args, **kwargs: ran.append("expression"))
+    monkeypatch.setattr(CallbackJob, "run", lambda *args, **kwargs: ran.append("cached job"))
+    error_code, stdout, stderr = get_main_output(["--cache-subworkflows"] + args)
+    assert error_code == 0, stderr
+    assert json.loads(stdout) == expected
+    assert ran == []
+    assert stderr.count("[step checksum] Using cached output") == 2
+
+    # only memoised with --cache-subworkflows
+    monkeypatch.undo()
+    error_code, stdout, stderr = get_main_output(args)
+    assert error_code == 0, stderr
+    assert json.loads(stdout) == expected
+    assert "Using cached output of" not in stderr
+
+    # memoised outputs are not reused once the files they refer to change
+    cache_backend = DirectoryCacheBackend(cache_dir)
+    output = tmp_path / "output.txt"
+    output.write_text("output")
+    outputs: CWLObjectType = {
+        "out": {
+            "class": "File",
+            "location": file_uri(str(output)),
+            "size": 6,
+            "checksum": _sha1(b"output"),
+        }
+    }
+    store_outputs(cache_backend, "f" * 32, "tool.cwl", outputs)
+    assert lookup_outputs(cache_backend, "f" * 32, checksums=True) == outputs
+    output.write_text("OUTPUT")
+    assert lookup_outputs(cache_backend, "f" * 32) == outputs
+    assert lookup_outputs(cache_backend, "f" * 32, checksums=True) is None
+    output.write_text("output, longer")
+    assert lookup_outputs(cache_backend, "f" * 32) is None
+    output.unlink()
+    assert lookup_outputs(cache_backend, "f" * 32) is None
+
+
+def test_cache_plan(tmp_path: Path) -> None:
+    """The jobs of a run are looked up in the cache, without running any."""
+    cache_dir = str(tmp_path / "cwltool_cache")
+    workflow = get_data("tests/wf/cache-plan-wf.cwl")
+    messages = ["--messages", "hello", "--messages", "world", "--messages", "hello"]
+
+    def _plan(*args: str) -> list[int]:
+        error_code, stdout, stderr = get_main_output(
+            ["--cachedir", cache_dir, "--cache-plan", workflow] + messages + list(args)
+        )
+        assert error_code == 0, stderr
+        plan = json.loads(stdout)
+        assert plan["cores"] == plan["miss"] + plan["uncached"]
+        return [plan[status] for status in ("hit", "miss", "repeat", "pending")]
+
+    # the expressions after each echo wait for its output
+    assert _plan("--shout") == [0, 3, 1, 3]
+    assert not [name for name in os.listdir(cache_dir) if name.endswith(".status")]
+    # the step skipped by its condition is not planned
+    assert _plan() == [0, 2, 1, 3]
+
+    error_code, _, stderr = get_main_output(
+        ["--out", str(tmp_path / "out"), "--cachedir", cache_dir, workflow, "--messages", "hello"]
+    )
+    assert error_code == 0, stderr
+    assert _plan() == [2, 1, 0, 1]
+
+
+def test_cache_miss_builds_job_once(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """A job not found in the cache runs with the Builder that computed its key."""
+    init_job = CommandLineTool._init_job
+    built: list[str] = []
+
+    def _init_job(self: CommandLineTool, *args: Any, **kwargs: Any) -> Any:
+        built.append(self.tool["id"])
+        return init_job(self, *args, **kwargs)
+
+    monkeypatch.setattr(CommandLineTool, "_init_job", _init_job)
+    args = [
+        "--no-container",
+        "--out",
+        str(tmp_path / "out"),
+        "--cachedir",
+        str(tmp_path / "cwltool_cache"),
+        get_data("tests/wf/cat-tool.cwl"),
+        "--file1",
+        get_data("tests/wf/whale.txt"),
+    ]
+    for cached in (False, True):
+        error_code, stdout, stderr = get_main_output(args)
+        assert error_code == 0, stderr
+        assert ("Using cached output" in stderr) is cached
+        # the inputs are not staged where they were to compute the key
+        assert "/stage/" not in stderr
+        with open(json.loads(stdout)["output"]["path"]) as f:
+            assert f.read() == Path(get_data("tests/wf/whale.txt")).read_text()
+        assert len(built) == 1
+        built.clear()
+
+
+def test_cache_lookup_unstage() -> None:
+    """Unstaging restores every field of the inputs that staging rewrote."""
+    file_o: CWLFileType = {
+        "class": "File",
+        "location": "file:///data/whale.txt",
+        "path": "/data/whale.txt",
+        "basename": "whale.txt",
+        "dirname": "/data",
+        "nameroot": "whale",
+        "nameext": ".txt",
+    }
+    original = dict(file_o)
+    unstaged: list[tuple[CWLFileType | CWLDirectoryType, dict[str, Any]]] = [
+        (file_o, {k: original[k] for k in STAGED_FIELDS})
+    ]
+    # as staged under a renamed basename
+    file_o.update(
+        {
+            "path": "/stage/1/whale_2.txt",
+            "basename": "whale_2.txt",
+            "dirname": "/stage/1",
+            "nameroot": "whale_2",
+            "nameext": ".txt",
+        }
+    )
+    CacheLookup(cast(Any, None), "key", None, unstaged).unstage()
+    assert file_o == original
+
+
+@pytest.mark.parametrize("factor", ["", "--parallel"])
+def test_scatter_cache_lookups(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, factor: str
+) -> None:
+    """The jobs of a scatter are looked up in the cache ahead, in other threads."""
+    cache_lookup = CommandLineTool.cache_lookup
+    threads: list[str] = []
+
+    def _cache_lookup(self: CommandLineTool, *args: Any, **kwargs: Any) -> Any:
+        threads.append(threading.current_thread().name)
+        return cache_lookup(self, *args, **kwargs)
+
+    monkeypatch.setattr(CommandLineTool, "cache_lookup", _cache_lookup)
+    args = factor.split() + [
+        "--out",
+        str(tmp_path / "out"),
+        "--cachedir",
+        str(tmp_path / "cwltool_cache"),
+        get_data("tests/wf/scatter-wf4.cwl"),
+    ]
+    args += ["--inp1", "a", "--inp1", "b", "--inp1", "a"]
+    args += ["--inp2", "x", "--inp2", "y", "--inp2", "x"]
+    for ran in (2, 0):
+        error_code, stdout, stderr = get_main_output(args)
+        assert error_code == 0, stderr
+        assert json.loads(stdout) == {"out": ["foo a x", "foo b y", "foo a x"]}
+        # a job is found in the cache once computed by an earlier job of the scatter,
+        # even if still running
+        assert stderr.count("Output of job will be cached") == ran
+        assert stderr.count("Using cached output") == 3 - ran
+        assert len(threads) == 3
+        assert all(name.startswith("cwltool-lookup") for name in threads)
+        threads.clear()
+
+
+def test_cache_hit_released_when_abandoned(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """A cache hit is released even if the generator of its job is not resumed."""
+    cachedir = tmp_path / "cwltool_cache"
+    tool = load_tool(get_data("tests/wf/cat-tool.cwl"), LoadingContext())
+    job_order: CWLObjectType = {
+        "file1": {"class": "File", "location": file_uri(get_data("tests/wf/whale.txt"))}
+    }
+    runtime_context = RuntimeContext(
+        {"cachedir": str(cachedir), "use_container": False, "tmp_outdir_prefix": str(tmp_path)}
+    )
+    runtime_context.workflow_eval_lock = threading.Condition(threading.RLock())
+    for job in tool.job(job_order, lambda outputs, process_status: None, runtime_context):
+        assert isinstance(job, JobBase)
+        job.run(runtime_context)
+    cache_backend = runtime_context.get_cache_backend()
+    released: list[str] = []
+    release = cache_backend.release
+
+    def _release(entry: CacheEntry) -> None:
+        released.append(entry.key)
+        release(entry)
+
+    monkeypatch.setattr(cache_backend, "release", _release)
+    jobs = tool.job(job_order, lambda outputs, process_status: None, runtime_context)
+    assert isinstance(next(jobs), CallbackJob)
+    assert released == []
+    # as when the executor stops on an error in another job
+    jobs.close()
+    assert len(released) == 1
+
+
+def test_scatter_cache_lookups_closed(tmp_path: Path) -> None:
+    """The cached jobs looked up ahead are released when the scatter stops early."""
+    runtime_context = RuntimeContext({"cachedir": str(tmp_path / "cwltool_cache")})
+    cache_backend = runtime_context.get_cache_backend()
+    keys = ["a", "b", "c"]
+    for key in keys:
+        cache_backend.publish(cache_backend.lease(key), "tool", "success", {})
+
+    class _Step:
+        def cache_lookup(
+            self, job_order: CWLObjectType, runtimeContext: RuntimeContext
+        ) -> CacheLookup:
+            key = cast(str, job_order["key"])
+            return CacheLookup(cast(Any, None), key, cache_backend.lookup(key, wait=False), [])
+
+    lookups = ScatterLookups(cast(Any, _Step()), runtime_context)
+    contexts = [lookups.add({"key": key}) for key in keys]
+    assert contexts[0].cache_lookup is not None
+    lookup = contexts[0].cache_lookup()
+    assert lookup is not None and lookup.entry is not None
+    cache_backend.release(lookup.entry)
+    # the scatter stops before the other jobs are generated
+    lookups.close()
+    for key in keys:
+        with open(tmp_path / "cwltool_cache" / f"{key}.status") as status:
+            fcntl.flock(status, fcntl.LOCK_EX | fcntl.LOCK_NB)
@@ -0,0 +1,132 @@
+"""Tests for the concurrent computation of file checksums."""
+
+import hashlib
+import io
+import json
+import os
+from pathlib import Path
+from typing import IO
+
+import pytest
+from cwl_utils.types import CWLFileType
+from schema_salad.ref_resolver import file_uri
+
+from cwltool import checksum
+from cwltool.checksum import ChecksumDatabase, checksum_files, checksum_stream
+from cwltool.stdfsaccess import StdFsAccess
+
+from .util import get_data, get_main_output
+
+
+def _sha1(data: bytes) -> str:
+    return "sha1$" + hashlib.sha1(data).hexdigest()  # nosec
+
+
+def test_checksum_files(tmp_path: Path) -> None:
+    """Files are hashed once per location, and existing checksums are kept."""
+    files: list[CWLFileType] = []
+    for i in range(10):
+        (tmp_path / f"{i}.txt").write_bytes(b"x" * i)
+        files.append({"class": "File", "location": file_uri(str(tmp_path / f"{i}.txt"))})
+    files.append({"class": "File", "location": files[3]["location"]})
+    files.append({"class": "File", "location": "_:literal", "contents": "literal"})
+    files.append({"class": "File", "location": files[4]["location"], "checksum": "sha1$kept"})
+
+    checksum_files(StdFsAccess(""), files)
+
+    for i in range(10):
+        assert files[i]["checksum"] == _sha1(b"x" * i)
+        assert files[i]["size"] == i
+    assert files[10]["checksum"] == files[3]["checksum"]
+    assert files[11]["checksum"] == _sha1(b"literal")
+    assert files[12]["checksum"] == "sha1$kept"
+
+
+def test_checksum_stream(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Large files are memory mapped, other streams are read in blocks."""
+    data = bytes(range(256)) * 4096
+    (tmp_path / "large").write_bytes(data)
+    monkeypatch.setattr(checksum, "MMAP_THRESHOLD", 1024)
+    monkeypatch.setattr(checksum, "BUFFER_SIZE", 1000)
+    with open(tmp_path / "large", "rb") as f:
+        assert checksum_stream(f) == _sha1(data)
+    assert checksum_stream(io.BytesIO(data)) == _sha1(data)
+
+
+def test_checksum_database(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Recorded checksums are used until their file changes."""
+    data = tmp_path / "data"
+    data.write_bytes(b"a" * 100)
+    location: str = file_uri(str(data))
+    database = ChecksumDatabase(str(tmp_path / "db" / "checksums.sqlite"), min_size=10)
+    # the change time of the files below is always recent
+    database.RACY_INTERVAL_NS = 0
+    monkeypatch.setattr(checksum, "_database", database)
+    hashed: list[str] = []
+
+    def _checksum_stream(stream: IO[bytes]) -> str:
+        hashed.append(stream.name)
+        return checksum_stream(stream)
+
+    monkeypatch.setattr(checksum, "checksum_stream", _checksum_stream)
+
+    def _checksum() -> str:
+        fileobj: CWLFileType = {"class": "File", "location": location}
+        checksum.checksum_file(StdFsAccess(""), fileobj)
+        return fileobj["checksum"]
+
+    assert _checksum() == _sha1(b"a" * 100)
+    assert _checksum() == _sha1(b"a" * 100)
+    assert (len(hashed), database.hits) == (1, 1)
+
+    # another process sees the same database
+    other = ChecksumDatabase(database.path, min_size=10)
+    assert other.lookup(os.stat(data)) == _sha1(b"a" * 100)
+    # no write-ahead log, which network filesystems do not support
+    assert other._connect().execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+    assert not os.path.exists(database.path + "-wal")
+
+    # same size and modification time, but a new change time
+    st = os.stat(data)
+    data.write_bytes(b"b" * 100)
+    os.utime(data, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert _checksum() == _sha1(b"b" * 100)
+    assert (len(hashed), database.hits) == (2, 1)
+
+    # changed too recently to be recorded
+    database.RACY_INTERVAL_NS = 60_000_000_000
+    data.write_bytes(b"c" * 100)
+    assert _checksum() == _sha1(b"c" * 100)
+    assert _checksum() == _sha1(b"c" * 100)
+    assert (len(hashed), database.hits) == (4, 1)
+
+
+def test_lazy_checksum(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Intermediate outputs are only hashed when an expression reads their checksum."""
+    hashed: list[str] = []
+
+    def _checksum_stream(stream: IO[bytes]) -> str:
+        hashed.append(stream.name)
+        return checksum_stream(stream)
+
+    monkeypatch.setattr(checksum, "checksum_stream", _checksum_stream)
+    whale = get_data("tests/wf/whale.txt")
+    error_code, stdout, stderr = get_main_output(
+        [
+            "--no-container",
+            "--lazy-checksum",
+            get_data("tests/wf/count-lines1-wf.cwl"),
+            "--file1",
+            whale,
+        ]
+    )
+    assert error_code == 0, stderr
+    assert json.loads(stdout) == {"count_output": 16}
+    assert hashed == []
+
+    error_code, stdout, stderr = get_main_output(
+        ["--lazy-checksum", get_data("tests/wf/checksum-wf.cwl"), "--message", "hello"]
+    )
+    assert error_code == 0, stderr
+    assert json.loads(stdout) == {"checksum": _sha1(b"hello\n")}
+    assert len(hashed) == 1
@@ -1,17 +1,27 @@
 """Tests of satisfying SoftwareRequirement via dependencies."""
 
+import argparse
+import json
 import os
+import sys
 import tempfile
+import threading
 from getpass import getuser
 from pathlib import Path
 from shutil import which
 from types import ModuleType
+from typing import Any, cast
 
 import pytest
 
+from cwltool import run_job
+from cwltool.builder import Builder
 from cwltool.context import LoadingContext
 from cwltool.load_tool import load_tool
-from cwltool.software_requirements import get_container_from_software_requirements
+from cwltool.software_requirements import (
+    DependenciesConfiguration,
+    get_container_from_software_requirements,
+)
 
 from .util import get_data, get_main_output, get_tool_env, needs_docker
 
@@ -159,3 +169,155 @@ def test_modules_environment(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) ->
     assert tool_env["TEST_VAR_MODULE"] == "environment variable ends in space ", tool_env
     tool_path = tool_env["PATH"].split(":")
     assert get_data("tests/test_deps_env/random-lines/1.0/scripts") in tool_path
+
+
+@pytest.mark.skipif(not deps, reason="galaxy-tool-util is not installed")
+def test_build_job_script_resolves_once(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Jobs with the same SoftwareRequirement share a single resolution."""
+    calls: list[str] = []
+
+    class FakeManager:
+        def dependency_shell_commands(self, requirements: Any, job_directory: str) -> list[str]:
+            calls.append(job_directory)
+            return ["export RESOLVED=1"]
+
+    class FakeBuilder:
+        debug = False
+
+        def __init__(self, version: str) -> None:
+            self.req = {
+                "class": "SoftwareRequirement",
+                "packages": [{"package": "random-lines", "version": [version]}],
+            }
+
+        def get_requirement(self, name: str) -> tuple[dict[str, Any], bool]:
+            return self.req, False
+
+    conf = DependenciesConfiguration(
+        argparse.Namespace(beta_conda_dependencies=True, beta_dependencies_directory=str(tmp_path))
+    )
+    monkeypatch.setattr(conf, "_dependency_manager", lambda debug: FakeManager())
+
+    scripts = {
+        conf.build_job_script(cast(Builder, FakeBuilder(version)), ["true"])
+        for version in ("1.0", "1.0", "1.0", "2.0")
+    }
+    assert len(calls) == 2
+    assert len(set(calls)) == 2
+    (script,) = scripts
+    assert "export RESOLVED=1" in script
+
+
+@pytest.mark.skipif(not deps, reason="galaxy-tool-util is not installed")
+def test_build_job_script_resolves_concurrently(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Different SoftwareRequirements are resolved at the same time."""
+    barrier = threading.Barrier(2, timeout=10)
+
+    class FakeManager:
+        def dependency_shell_commands(self, requirements: Any, job_directory: str) -> list[str]:
+            barrier.wait()
+            return ["export RESOLVED=1"]
+
+    class FakeBuilder:
+        debug = False
+
+        def __init__(self, version: str) -> None:
+            self.req = {
+                "class": "SoftwareRequirement",
+                "packages": [{"package": "random-lines", "version": [version]}],
+            }
+
+        def get_requirement(self, name: str) -> tuple[dict[str, Any], bool]:
+            return self.req, False
+
+    conf = DependenciesConfiguration(
+        argparse.Namespace(beta_conda_dependencies=True, beta_dependencies_directory=str(tmp_path))
+    )
+    monkeypatch.setattr(conf, "_dependency_manager", lambda debug: FakeManager())
+    threads = [
+        threading.Thread(
+            target=conf.build_job_script, args=(cast(Builder, FakeBuilder(version)), ["true"])
+        )
+        for version in ("1.0", "2.0")
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not barrier.broken
+
+
+def test_run_job_cached_environment(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """The environment script is only run once, later jobs reuse its variables."""
+    monkeypatch.chdir(tmp_path)
+    script = tmp_path / "modify_environment.bash"
+    script.write_text(
+        "echo run >> runs.txt\n"
+        "export RESOLVED_VAR=resolved\n"
+        'env -0 > "output_environment.dat"\n'
+    )
+    cache_dir = tmp_path / "environments"
+
+    for i in range(3):
+        job_json = tmp_path / "job.json"
+        job_json.write_text(
+            json.dumps(
+                {
+                    "commands": [
+                        sys.executable,
+                        "-c",
+                        "import os; print(os.environ['RESOLVED_VAR'], os.environ['HOME'])",
+                    ],
+                    "cwd": str(tmp_path),
+                    "env": {"HOME": f"home{i}", "TMPDIR": f"tmp{i}"},
+                    "stdin_path": None,
+                    "stdout_path": str(tmp_path / f"out{i}.txt"),
+                    "stderr_path": None,
+                }
+            )
+        )
+        assert run_job.main(["run_job.py", str(job_json), str(script), str(cache_dir)]) == 0
+        assert (tmp_path / f"out{i}.txt").read_text() == f"resolved home{i}\n"
+
+    assert (tmp_path / "runs.txt").read_text() == "run\n"
+    (cached,) = cache_dir.iterdir()
+    delta = json.loads(cached.read_text())
+    assert delta["RESOLVED_VAR"] == "resolved"
+    assert "HOME" not in delta and "TMPDIR" not in delta
+
+
+def test_run_job_environment_from_job_dirs(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Variables built from the home directory of a job are not reused by others."""
+    monkeypatch.chdir(tmp_path)
+    script = tmp_path / "modify_environment.bash"
+    script.write_text(
+        "echo run >> runs.txt\n"
+        'export DERIVED_VAR="$HOME/derived"\n'
+        'env -0 > "output_environment.dat"\n'
+    )
+    cache_dir = tmp_path / "environments"
+
+    for i in range(2):
+        job_json = tmp_path / "job.json"
+        job_json.write_text(
+            json.dumps(
+                {
+                    "commands": [
+                        sys.executable,
+                        "-c",
+                        "import os; print(os.environ['DERIVED_VAR'])",
+                    ],
+                    "cwd": str(tmp_path),
+                    "env": {"HOME": f"/home{i}", "TMPDIR": f"/tmp{i}"},
+                    "stdin_path": None,
+                    "stdout_path": str(tmp_path / f"out{i}.txt"),
+                    "stderr_path": None,
+                }
+            )
+        )
+        assert run_job.main(["run_job.py", str(job_json), str(script), str(cache_dir)]) == 0
+        assert (tmp_path / f"out{i}.txt").read_text() == f"/home{i}/derived\n"
+
+    assert (tmp_path / "runs.txt").read_text() == "run\nrun\n"
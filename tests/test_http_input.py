@@ -3,10 +3,13 @@ from collections.abc import MutableSequence
 from datetime import datetime
 from pathlib import Path
 
+import pytest
 from cwl_utils.types import CWLDirectoryType, CWLFileType
 from pytest_httpserver import HTTPServer
 
+from cwltool import download
 from cwltool.pathmapper import PathMapper
+from cwltool.utils import downloadHttpFile
 
 
 def test_http_path_mapping(tmp_path: Path) -> None:
@@ -77,3 +80,64 @@ def test_modification_date(tmp_path: Path) -> None:
         last_modified = os.path.getmtime(pathmap[location].resolved)
 
         assert date_now.timestamp() > last_modified
+
+
+@pytest.fixture
+def cache_home(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Keep the downloads of a test in its own cache directory."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setattr(download, "_downloads", {})
+    return tmp_path / "cache"
+
+
+def test_prefetch_downloads(cache_home: Path) -> None:
+    """Files are downloaded once, concurrently, and each use gets its own writable copy."""
+    with HTTPServer() as httpserver:
+        for name in ("a", "b", "c"):
+            httpserver.expect_oneshot_request(f"/{name}").respond_with_data("same")
+        locations = [httpserver.url_for(f"/{name}") for name in ("a", "b", "c")]
+
+        pool = download.prefetch_downloads(locations + ["file:///local", locations[0]])
+        assert pool is not None
+        pool.shutdown(wait=True)
+        paths = [downloadHttpFile(location)[0] for location in locations + locations[:1]]
+
+        assert len(httpserver.log) == 3
+    assert len(set(paths)) == 4
+    for path in paths:
+        assert not path.startswith(str(cache_home))
+        with open(path) as f:
+            assert f.read() == "same"
+    # updated in place by a job
+    with open(paths[0], "w") as f:
+        f.write("changed")
+    with open(downloadHttpFile(locations[0])[0]) as f:
+        assert f.read() == "same"
+    assert download.prefetch_downloads(["file:///local"]) is None
+
+
+def test_resume_download(cache_home: Path) -> None:
+    """An interrupted download is continued with a range request."""
+    data = b"0123456789" * 1000
+    with HTTPServer() as httpserver:
+        location = httpserver.url_for("/data")
+        httpserver.expect_oneshot_request(
+            "/data", headers={"Range": "bytes=5000-", "If-Range": '"v1"'}
+        ).respond_with_data(
+            data[5000:],
+            status=206,
+            headers={"Content-Range": f"bytes 5000-9999/{len(data)}", "ETag": '"v1"'},
+        )
+        partial, partial_path = download._open_partial(location)
+        with partial:
+            partial.write(data[:5000])
+        assert partial_path is not None
+        with open(partial_path + ".validator", "w") as validator:
+            validator.write('"v1"')
+
+        path, _date = downloadHttpFile(location)
+
+        assert len(httpserver.log) == 1
+    with open(path, "rb") as f:
+        assert f.read() == data
+    assert not os.path.exists(partial_path)
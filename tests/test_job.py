@@ -0,0 +1,46 @@
+"""Tests for launching jobs through the job runner script."""
+
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+from cwltool import job
+
+
+@pytest.mark.parametrize("job_script", [None, job.SHELL_COMMAND_TEMPLATE])
+def test_shelled_job_popen(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, job_script: str | None
+) -> None:
+    """Shelled jobs share one runner directory and leave no per-job files behind."""
+    monkeypatch.setattr(job, "FORCE_SHELLED_POPEN", True)
+    monkeypatch.setattr(job, "_RUNNER_DIR", None)
+    made: list[str] = []
+
+    def make_job_dir() -> str:
+        made.append(str(tmp_path / f"dir{len(made)}"))
+        os.mkdir(made[-1])
+        return made[-1]
+
+    for i in range(3):
+        stdout = tmp_path / f"out{i}.txt"
+        rcode = job._job_popen(
+            [sys.executable, "-c", f"print({i})"],
+            stdin_path=None,
+            stdout_path=str(stdout),
+            stderr_path=None,
+            env={"PATH": os.environ["PATH"]},
+            cwd=str(tmp_path),
+            make_job_dir=make_job_dir,
+            job_script_contents=job_script,
+        )
+        assert rcode == 0
+        assert stdout.read_text() == f"{i}\n"
+
+    runner_dir = made[0]
+    assert job._RUNNER_DIR == runner_dir
+    assert sorted(os.listdir(runner_dir)) == ["env_to_stdout.py", "run_job.py"]
+    # Only the runner directory remains; job directories were removed
+    assert [d for d in made if os.path.exists(d)] == [runner_dir]
+    assert len(made) == (1 if job_script is None else 4)
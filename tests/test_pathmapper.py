@@ -1,9 +1,14 @@
+import os
+import time
+import tracemalloc
 from collections.abc import MutableSequence
+from pathlib import Path
 
 import pytest
 from cwl_utils.types import CWLDirectoryType, CWLFileType, CWLObjectType
+from schema_salad.ref_resolver import file_uri
 
-from cwltool.pathmapper import PathMapper
+from cwltool.pathmapper import CompactPathMapper, PathMapper, SymlinkCache
 from cwltool.utils import normalizeFilesDirs
 
 
@@ -96,3 +101,199 @@ def test_basename_field_generation(filename: str, expected: tuple[str, str]) ->
 
     normalizeFilesDirs(my_file)
     assert my_file == expected2
+
+
+@pytest.mark.parametrize("mapper_class", [PathMapper, CompactPathMapper])
+def test_reversemap(mapper_class: type[PathMapper]) -> None:
+    """Reverse lookups follow updates and removals, and prefer the first entry."""
+    pathmapper = mapper_class([], "", "/stage")
+    pathmapper.update("file:///a", "/a", "/stage/a", "File", True)
+    pathmapper.update("file:///b", "/b", "/stage/a", "File", True)
+    assert pathmapper.reversemap("/stage/a") == ("file:///a", "/a")
+
+    pathmapper.update("file:///a", "/a", "/stage/moved", "File", True)
+    assert pathmapper.reversemap("/stage/a") == ("file:///b", "/b")
+    assert pathmapper.reversemap("/stage/moved") == ("file:///a", "/a")
+
+    del pathmapper._pathmap["file:///b"]
+    assert pathmapper.reversemap("/stage/a") is None
+    pathmapper._pathmap.clear()
+    assert pathmapper.reversemap("/stage/moved") is None
+
+
+@pytest.mark.parametrize("mapper_class", [PathMapper, CompactPathMapper])
+def test_items_exclude_children(mapper_class: type[PathMapper]) -> None:
+    """Entries below other entries are excluded, whatever the order they were added in."""
+    pathmapper = mapper_class([], "", "/stage")
+    for key in (
+        "file:///data/dir/sub/file.txt",
+        "file:///data/dir",
+        "file:///data/dir2/file.txt",
+        "file:///data/dir/other.txt",
+        "_:literal",
+        "/plain/path",
+        "/plain/path/child",
+    ):
+        pathmapper.update(key, key, "/stage/" + key, "File", True)
+    assert [key for key, _entry in pathmapper.items_exclude_children()] == [
+        "file:///data/dir",
+        "file:///data/dir2/file.txt",
+        "_:literal",
+        "/plain/path",
+    ]
+
+
+def test_pathmapper_scaling() -> None:
+    """Reverse lookups do not scan the whole map."""
+    pathmapper = PathMapper([], "", "/stage")
+    count = 100_000
+    for i in range(count):
+        pathmapper.update(
+            f"file:///data/{i % 100}/{i}", f"/data/{i % 100}/{i}", f"/stage/{i}", "File", True
+        )
+    start = time.perf_counter()
+    for i in range(count):
+        assert pathmapper.reversemap(f"/stage/{i}") == (
+            f"file:///data/{i % 100}/{i}",
+            f"/data/{i % 100}/{i}",
+        )
+    assert len(pathmapper.items_exclude_children()) == count
+    # A linear scan per lookup would take minutes
+    assert time.perf_counter() - start < 30
+
+
+def _listing(tmp_path: Path) -> CWLDirectoryType:
+    """Make a directory with a few files and a subdirectory, listed recursively."""
+    (tmp_path / "data" / "sub").mkdir(parents=True)
+    listing: list[CWLFileType | CWLDirectoryType] = []
+    for name in ("a.txt", "b c.txt", "sub/d.txt"):
+        (tmp_path / "data" / name).write_text(name)
+    for name in ("a.txt", "b c.txt"):
+        listing.append(
+            {"class": "File", "location": file_uri(str(tmp_path / "data" / name)), "basename": name}
+        )
+    sub: CWLDirectoryType = {
+        "class": "Directory",
+        "location": file_uri(str(tmp_path / "data" / "sub")),
+        "basename": "sub",
+        "listing": [
+            {
+                "class": "File",
+                "location": file_uri(str(tmp_path / "data" / "sub" / "d.txt")),
+                "basename": "d.txt",
+            }
+        ],
+    }
+    listing.append(sub)
+    return {
+        "class": "Directory",
+        "location": file_uri(str(tmp_path / "data")),
+        "basename": "data",
+        "listing": listing,
+    }
+
+
+def test_compact_path_mapper(tmp_path: Path) -> None:
+    """The compact path mapper maps the same entries as the default one."""
+    directory = _listing(tmp_path)
+    created: CWLFileType = {"class": "File", "location": "_:x", "basename": "x", "contents": "/x/"}
+    default = PathMapper([directory, created], str(tmp_path), "/stage", separateDirs=False)
+    compact = CompactPathMapper([directory, created], str(tmp_path), "/stage", separateDirs=False)
+    assert list(compact.items()) == list(default.items())
+    assert compact.items_exclude_children() == default.items_exclude_children()
+    for key in default.files():
+        assert compact.mapper(key) == default.mapper(key)
+        assert compact.reversemap(default.mapper(key).target) == default.reversemap(
+            default.mapper(key).target
+        )
+
+    compact.update(directory["location"], "/elsewhere", "/stage/data", "WritableDirectory", True)
+    assert compact.mapper(directory["location"]).type == "WritableDirectory"
+    assert list(compact.files())[0] == directory["location"]
+    del compact._pathmap[directory["location"]]
+    assert directory["location"] not in compact
+    assert len(list(compact.files())) == len(list(default.files())) - 1
+
+
+def test_lazy_children(tmp_path: Path) -> None:
+    """Locations inside a Directory mapped without its listing are mapped on demand."""
+    directory = _listing(tmp_path)
+    del directory["listing"]
+    pathmapper = PathMapper([directory], str(tmp_path), "/stage", separateDirs=False)
+    assert list(pathmapper.files()) == [directory["location"]]
+
+    child = pathmapper.mapper(directory["location"] + "/b%20c.txt")
+    assert child.resolved == str(tmp_path / "data" / "b c.txt")
+    assert child.target == "/stage/data/b c.txt"
+    assert child.type == "File"
+    assert pathmapper.mapper(directory["location"] + "/sub").type == "Directory"
+    assert pathmapper.reversemap("/stage/data/sub/d.txt") == (
+        directory["location"] + "/sub/d.txt",
+        str(tmp_path / "data" / "sub" / "d.txt"),
+    )
+    with pytest.raises(KeyError):
+        pathmapper.mapper(file_uri(str(tmp_path / "elsewhere.txt")))
+
+
+def test_compact_path_mapper_memory() -> None:
+    """The compact path mapper stores a large listing in a fraction of the memory."""
+    source = "/home/user/projects/sequencing/run-0042/"
+    stagedir = "/tmp/tmpq8zd1c_2/stg0c6f3e0c-5c8e-4a62-9b1e-6c2d2d0e3e1f/run-0042/"
+    sizes = []
+    for mapper_class in (PathMapper, CompactPathMapper):
+        tracemalloc.start()
+        pathmapper = mapper_class([], "", "/stage")
+        for i in range(20_000):
+            name = f"sample-{i % 20:03}/reads_{i:07}.fastq.gz"
+            pathmapper.update(
+                "file://" + source + name, source + name, stagedir + name, "File", False
+            )
+        sizes.append(tracemalloc.get_traced_memory()[0])
+        tracemalloc.stop()
+    assert sizes[1] * 2 < sizes[0]
+
+
+def test_symlink_cache(tmp_path: Path) -> None:
+    """Resolved links are reused until the link changes or is invalidated."""
+    (tmp_path / "data.txt").write_text("data")
+    (tmp_path / "other.txt").write_text("other")
+    os.symlink(tmp_path / "data.txt", tmp_path / "middle")
+    os.symlink("middle", tmp_path / "link")
+    cache = SymlinkCache(maxsize=2)
+
+    assert cache.resolve(str(tmp_path / "data.txt")) == str(tmp_path / "data.txt")
+    for _ in range(3):
+        assert cache.resolve(str(tmp_path / "link")) == str(tmp_path / "data.txt")
+    assert (cache.misses, cache.hits, cache.calls_saved) == (1, 2, 6)
+
+    # a later link of the chain retargeted
+    os.unlink(tmp_path / "middle")
+    os.symlink(tmp_path / "other.txt", tmp_path / "middle")
+    assert cache.resolve(str(tmp_path / "link")) == str(tmp_path / "other.txt")
+    os.unlink(tmp_path / "middle")
+    os.symlink(tmp_path / "data.txt", tmp_path / "middle")
+    assert cache.resolve(str(tmp_path / "link")) == str(tmp_path / "data.txt")
+    assert (cache.misses, cache.hits) == (3, 2)
+
+    os.unlink(tmp_path / "link")
+    os.symlink(tmp_path / "other.txt", tmp_path / "link")
+    assert cache.resolve(str(tmp_path / "link")) == str(tmp_path / "other.txt")
+    assert cache.misses == 4
+
+    cache.resolve(str(tmp_path / "middle"))
+    cache.invalidate(str(tmp_path / "other.txt"))
+    assert cache.resolve(str(tmp_path / "middle")) == str(tmp_path / "data.txt")
+    assert (cache.misses, cache.hits) == (5, 3)
+    assert cache.resolve(str(tmp_path / "link")) == str(tmp_path / "other.txt")
+    assert cache.misses == 6
+    assert len(cache._links) == 2
+
+    # several paths at once, the links below a directory included
+    (tmp_path / "dir").mkdir()
+    os.symlink(tmp_path / "data.txt", tmp_path / "dir" / "link")
+    cache.resolve(str(tmp_path / "dir" / "link"))
+    cache.resolve(str(tmp_path / "middle"))
+    cache.invalidate(str(tmp_path / "unrelated"), str(tmp_path / "dir") + "/")
+    assert list(cache._links) == [str(tmp_path / "middle")]
+    cache.invalidate(str(tmp_path / "elsewhere"), str(tmp_path / "data.txt"))
+    assert not cache._links
@@ -0,0 +1,97 @@
+"""Tests for the pre-fetching of software container images."""
+
+import subprocess
+import threading
+import time
+from typing import Any
+
+import pytest
+
+from cwltool import docker, prefetch
+from cwltool.context import LoadingContext, RuntimeContext
+from cwltool.job import image_lock
+from cwltool.load_tool import load_tool
+
+from .util import get_data
+
+
+def test_collect_docker_requirements() -> None:
+    """Each distinct DockerRequirement of a workflow is reported once."""
+    tool = load_tool(get_data("tests/wf/revsort.cwl"), LoadingContext())
+    reqs = prefetch.collect_docker_requirements(tool)
+    assert [r["dockerPull"] for r in reqs] == ["docker.io/debian:stable-slim"]
+
+
+def test_docker_get_image_single_pull(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Concurrent requests for the same image only pull it once."""
+    pulls: list[list[str]] = []
+
+    def fake_check_output(cmd: list[str], *args: Any, **kwargs: Any) -> bytes:
+        raise subprocess.CalledProcessError(1, cmd)
+
+    def fake_check_call(cmd: list[str], *args: Any, **kwargs: Any) -> int:
+        pulls.append(cmd)
+        time.sleep(0.1)
+        return 0
+
+    monkeypatch.setattr(subprocess, "check_output", fake_check_output)
+    monkeypatch.setattr(subprocess, "check_call", fake_check_call)
+
+    image = "example.org/prefetch/single-pull:1"
+    results: list[bool] = []
+
+    def fetch() -> None:
+        results.append(docker.get_image("docker", {"dockerPull": image}, True, False, "/tmp"))
+
+    threads = [threading.Thread(target=fetch) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [True] * 8
+    assert pulls == [["docker", "pull", image]]
+
+
+def test_image_lock_ignores_retrieval_fields() -> None:
+    """An image keeps its lock once its retrieval has rewritten its DockerRequirement."""
+    requirement = {"class": "DockerRequirement", "dockerPull": "example.org/lock:1"}
+    lock = image_lock(requirement)
+    requirement["dockerPull"] = "docker://example.org/lock:1"
+    requirement["dockerImageId"] = "/images/example.org_lock_1.sif"
+    assert image_lock(requirement) is lock
+    assert image_lock({"dockerPull": "example.org/lock:2"}) is not lock
+
+
+def test_prefetch_images(monkeypatch: pytest.MonkeyPatch) -> None:
+    """The prefetch stage retrieves each image with a private requirement copy."""
+    fetched: list[dict[str, str]] = []
+
+    def fake_get_image(
+        docker_exec: str,
+        docker_requirement: dict[str, str],
+        pull_image: bool,
+        force_pull: bool,
+        tmp_outdir_prefix: str,
+    ) -> bool:
+        assert docker_exec == "docker"
+        docker_requirement["dockerImageId"] = docker_requirement["dockerPull"]
+        fetched.append(docker_requirement)
+        return True
+
+    monkeypatch.setattr("cwltool.prefetch.shutil.which", lambda exe: "/usr/bin/" + exe)
+    monkeypatch.setattr(docker, "get_image", fake_get_image)
+
+    tool = load_tool(get_data("tests/wf/revsort.cwl"), LoadingContext())
+    pool = prefetch.prefetch_images(tool, RuntimeContext())
+    assert pool is not None
+    pool.shutdown(wait=True)
+
+    assert [r["dockerPull"] for r in fetched] == ["docker.io/debian:stable-slim"]
+    assert "dockerImageId" not in prefetch.collect_docker_requirements(tool)[0]
+
+
+def test_prefetch_images_no_container() -> None:
+    """Nothing is fetched when software containers are disabled."""
+    tool = load_tool(get_data("tests/wf/revsort.cwl"), LoadingContext())
+    assert prefetch.prefetch_images(tool, RuntimeContext({"use_container": False})) is None
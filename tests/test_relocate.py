@@ -3,10 +3,18 @@ import os
 import shutil
 from io import StringIO
 from pathlib import Path
+from typing import IO, Any, cast
+
+import pytest
+from cwl_utils.types import CWLDirectoryType, CWLFileType, CWLObjectType
+from schema_salad.ref_resolver import file_uri
 
 from cwltool.main import main
+from cwltool.process import relocateOutputs
+from cwltool.relocate import EarlyRelocator
+from cwltool.stdfsaccess import StdFsAccess
 
-from .util import get_data, needs_docker
+from .util import get_data, get_main_output, needs_docker
 
 
 @needs_docker
@@ -70,3 +78,157 @@ def test_relocate_symlinks(tmp_path: Path) -> None:
         )
         == 0
     )
+
+
+def test_early_relocation(tmp_path: Path) -> None:
+    """Outputs copied as their step finishes are the final outputs."""
+    outdir = tmp_path / "out"
+    error_code, stdout, stderr = get_main_output(
+        [
+            "--debug",
+            "--copy-outputs",
+            "--relocate-early",
+            "--outdir",
+            str(outdir),
+            get_data("tests/wf/hello-workflow.cwl"),
+            "--usermessage",
+            "hello",
+        ]
+    )
+    assert error_code == 0, stderr
+    response = json.loads(stdout)["response"]
+    assert response["location"] == file_uri(str(outdir / "response.txt"))
+    assert response["checksum"] == "sha1$aaf4c61ddcc5e8a2dabede0f3b482cd9aea9434d"
+    assert "Relocated 1 output(s) from early copies" in stderr
+    assert os.listdir(outdir) == ["response.txt"]
+
+
+def test_early_copy_of_changed_output(tmp_path: Path) -> None:
+    """An output changed after its early copy is relocated again."""
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "out.txt").write_text("first")
+    relocator = EarlyRelocator(str(tmp_path / "final"), {str(source)}, "copy")
+    relocator.submit({"class": "File", "location": file_uri(str(source / "out.txt"))})
+    relocator._copies[str(source / "out.txt")].future.result()
+    (source / "out.txt").write_text("second")
+
+    assert not relocator.take(str(source / "out.txt"), str(tmp_path / "final" / "out.txt"), False)
+    relocator.close()
+    assert os.listdir(tmp_path / "final") == []
+
+
+def test_stale_early_copies_removed(tmp_path: Path) -> None:
+    """The early copies of a killed cwltool are removed, not those of a running one."""
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "out.txt").write_text("out")
+    final = tmp_path / "final"
+    running = EarlyRelocator(str(final), {str(source)}, "copy")
+    running.submit({"class": "File", "location": file_uri(str(source / "out.txt"))})
+    (final / ".cwltool-relocate-killed").mkdir()
+    (final / ".cwltool-relocate-killed" / "0").write_text("out")
+    (final / ".cwltool-relocate-recent").mkdir()
+    for name in os.listdir(final):
+        if name != ".cwltool-relocate-recent":
+            os.utime(final / name, (0, 0))
+
+    relocator = EarlyRelocator(str(final), {str(source)}, "copy")
+    relocator.submit({"class": "File", "location": file_uri(str(source / "out.txt"))})
+    assert len(os.listdir(final)) == 3
+    assert not (final / ".cwltool-relocate-killed").exists()
+    relocator.close()
+    running.close()
+    assert os.listdir(final) == [".cwltool-relocate-recent"]
+
+
+def test_early_move_of_directory(tmp_path: Path) -> None:
+    """Directories moved from early copies leave their files in place."""
+    source = tmp_path / "source"
+    (source / "dir").mkdir(parents=True)
+    (source / "dir" / "a.txt").write_text("a")
+    relocator = EarlyRelocator(str(tmp_path / "final"), {str(tmp_path / "elsewhere")}, "move")
+    relocator.submit(
+        [
+            {"class": "Directory", "location": file_uri(str(source / "dir"))},
+            {"class": "File", "location": file_uri(str(source / "dir" / "a.txt"))},
+        ]
+    )
+    final = tmp_path / "final" / "dir"
+
+    assert relocator.take(str(source / "dir"), str(final), True)
+    assert relocator.take(str(source / "dir" / "a.txt"), str(final / "a.txt"), True)
+    assert not relocator.take(str(source / "dir" / "a.txt"), str(tmp_path / "other.txt"), True)
+    relocator.close()
+    assert (final / "a.txt").read_text() == "a"
+    assert not (source / "dir").exists()
+    assert os.listdir(tmp_path / "final") == ["dir"]
+
+
+def test_checksums_computed_while_copying(tmp_path: Path) -> None:
+    """Copied outputs are hashed as they are copied, not read again afterwards."""
+    source = tmp_path / "source"
+    (source / "dir").mkdir(parents=True)
+    (source / "dir" / "a.txt").write_text("a")
+    (source / "b.txt").write_text("b")
+    opened: list[str] = []
+
+    class CountingFsAccess(StdFsAccess):
+        def open(self, fn: str, mode: str) -> IO[Any]:
+            opened.append(fn)
+            return super().open(fn, mode)
+
+    outputs: CWLObjectType = {
+        "dir": {"class": "Directory", "location": file_uri(str(source / "dir")), "basename": "dir"},
+        "file": {"class": "File", "location": file_uri(str(source / "b.txt")), "basename": "b.txt"},
+    }
+    relocated = relocateOutputs(
+        outputs, str(tmp_path / "final"), {str(source)}, "copy", CountingFsAccess("")
+    )
+
+    assert opened == []
+    listing = cast(CWLDirectoryType, relocated["dir"])["listing"]
+    assert cast(CWLFileType, listing[0])["checksum"] == (
+        "sha1$86f7e437faa5a7fce15d1ddcb9eaeaea377667b8"
+    )
+    assert cast(CWLFileType, relocated["file"])["checksum"] == (
+        "sha1$e9d71f5ee7c92d6dc9e92ffdad17b8bd49418f98"
+    )
+    assert (tmp_path / "final" / "dir" / "a.txt").read_text() == "a"
+
+
+def test_hashed_outputs_copied_without_reading(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Outputs with a checksum already are copied by the kernel, not hashed again."""
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "a.txt").write_text("a")
+    (source / "b.txt").write_text("b")
+    copied: list[str] = []
+    copy2 = shutil.copy2
+
+    def _copy2(src: str, dst: str) -> str:
+        copied.append(os.path.basename(src))
+        return copy2(src, dst)
+
+    monkeypatch.setattr(shutil, "copy2", _copy2)
+    outputs: CWLObjectType = {
+        "a": {
+            "class": "File",
+            "location": file_uri(str(source / "a.txt")),
+            "basename": "a.txt",
+            "checksum": "sha1$86f7e437faa5a7fce15d1ddcb9eaeaea377667b8",
+        },
+        "b": {"class": "File", "location": file_uri(str(source / "b.txt")), "basename": "b.txt"},
+    }
+    relocated = relocateOutputs(
+        outputs, str(tmp_path / "final"), {str(source)}, "copy", StdFsAccess("")
+    )
+
+    assert copied == ["a.txt"]
+    assert cast(CWLFileType, relocated["b"])["checksum"] == (
+        "sha1$e9d71f5ee7c92d6dc9e92ffdad17b8bd49418f98"
+    )
+    assert (tmp_path / "final" / "a.txt").read_text() == "a"
+    assert (tmp_path / "final" / "b.txt").read_text() == "b"
@@ -0,0 +1,161 @@
+"""Tests for the content-addressed Singularity image cache."""
+
+import fcntl
+import os
+import threading
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+import pytest
+
+from cwltool.singularity_cache import (
+    SifCache,
+    dockerfile_key,
+    hold_image,
+    pull_key,
+    release_image,
+)
+from cwltool.utils import parse_size
+
+
+def _builder(calls: list[str], size: int = 10, delay: float = 0) -> Callable[[str], None]:
+    def build(image: str) -> None:
+        calls.append(image)
+        time.sleep(delay)
+        Path(image).write_bytes(b"x" * size)
+
+    return build
+
+
+def test_parse_size() -> None:
+    """Sizes accept an optional binary unit suffix."""
+    assert parse_size("512") == 512
+    assert parse_size("2K") == 2048
+    assert parse_size("3g") == 3 * 1024**3
+    assert parse_size("1GiB") == 1024**3
+    with pytest.raises(ValueError):
+        parse_size("lots")
+
+
+def test_keys() -> None:
+    """Digest pinned references share a key, whatever the repository name."""
+    digest = "a" * 64
+    assert pull_key(f"docker://debian@sha256:{digest}") == pull_key(
+        f"quay.io/mirror/debian@sha256:{digest}"
+    )
+    assert pull_key("docker://debian:12") == pull_key("debian:12")
+    assert pull_key("debian:12") != pull_key("debian:11")
+    assert dockerfile_key("FROM debian:12\n") != dockerfile_key("FROM debian:11\n")
+
+
+def test_publish_and_lookup(tmp_path: Path) -> None:
+    """A published image is exposed under its legacy name and built only once."""
+    cache = SifCache(str(tmp_path))
+    calls: list[str] = []
+    link = tmp_path / "debian_12.sif"
+    key = pull_key("debian:12")
+
+    assert cache.lookup(key, str(link)) is None
+    assert cache.publish(key, str(link), _builder(calls)) == str(link)
+    assert link.is_symlink()
+    assert os.path.realpath(link) == cache.blob_path(key)
+    assert cache.publish(key, str(link), _builder(calls)) == str(link)
+    assert len(calls) == 1
+
+    link.unlink()
+    assert cache.lookup(key, str(link)) == str(link)
+    assert link.read_bytes() == b"x" * 10
+    assert cache.usage() == 10
+    assert not os.listdir(cache.tmp_dir)
+
+
+def test_concurrent_publish(tmp_path: Path) -> None:
+    """Concurrent publications of the same image wait for a single build."""
+    calls: list[str] = []
+    key = dockerfile_key("FROM debian:12\n")
+
+    def publish() -> None:
+        SifCache(str(tmp_path)).publish(
+            key, str(tmp_path / "custom.sif"), _builder(calls, delay=0.1)
+        )
+
+    threads = [threading.Thread(target=publish) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+
+
+def test_evict_lru(tmp_path: Path) -> None:
+    """The least recently used images are evicted first, with their links."""
+    cache = SifCache(str(tmp_path))
+    keys = [pull_key(f"image:{i}") for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.publish(key, str(tmp_path / f"image_{i}.sif"), _builder([]))
+        cache.release(key)
+        os.utime(cache.blob_path(key), (1000 + i, 1000 + i))
+    cache.lookup(keys[0])  # now the most recently used
+    cache.release(keys[0])
+
+    assert cache.evict(20) == [keys[1]]
+    assert cache.usage() == 20
+    assert not os.path.lexists(tmp_path / "image_1.sif")
+    assert os.path.exists(tmp_path / "image_0.sif")
+    assert os.path.exists(tmp_path / "image_2.sif")
+
+
+def test_evict_skips_locked(tmp_path: Path) -> None:
+    """Images locked by another user of the cache are not evicted."""
+    cache = SifCache(str(tmp_path))
+    keys = [pull_key(f"image:{i}") for i in range(2)]
+    for i, key in enumerate(keys):
+        cache.publish(key, str(tmp_path / f"image_{i}.sif"), _builder([]))
+        cache.release(key)
+        os.utime(cache.blob_path(key), (1000 + i, 1000 + i))
+
+    with open(os.path.join(cache.locks_dir, keys[0] + ".lock"), "a") as lock:
+        fcntl.flock(lock.fileno(), fcntl.LOCK_SH)
+        assert cache.evict(10) == [keys[1]]
+    assert os.path.exists(cache.blob_path(keys[0]))
+
+
+def test_publish_enforces_max_size(tmp_path: Path) -> None:
+    """Publishing beyond the size limit evicts older images but not the new one."""
+    cache = SifCache(str(tmp_path), max_size=15)
+    first, second = pull_key("image:1"), pull_key("image:2")
+    cache.publish(first, str(tmp_path / "image_1.sif"), _builder([]))
+    cache.release(first)
+    cache.publish(second, str(tmp_path / "image_2.sif"), _builder([]))
+    assert not os.path.exists(cache.blob_path(first))
+    assert os.path.exists(cache.blob_path(second))
+
+
+def test_evict_skips_held(tmp_path: Path) -> None:
+    """Images held by a user of the cache are only evicted once released by all."""
+    key = pull_key("image:1")
+    SifCache(str(tmp_path)).publish(key, str(tmp_path / "image_1.sif"), _builder([]))
+    cache = SifCache(str(tmp_path))
+    assert cache.lookup(key) == cache.blob_path(key)
+
+    cache.release(key)
+    assert cache.evict(0) == []
+    cache.release(key)
+    assert cache.evict(0) == [key]
+
+
+def test_hold_and_release_image(tmp_path: Path) -> None:
+    """The jobs hold their image through its link, until they release it."""
+    key = pull_key("image:1")
+    link = str(tmp_path / "image_1.sif")
+    cache = SifCache(str(tmp_path))
+    cache.publish(key, link, _builder([]))
+    cache.release(key)
+
+    assert hold_image(link)
+    assert cache.evict(0) == []
+    release_image(link)
+    assert cache.evict(0) == [key]
+    assert not hold_image(link)
+    release_image(link)
@@ -0,0 +1,116 @@
+"""Tests for concurrent file staging."""
+
+import errno
+import os
+import stat
+import sys
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from cwltool import staging
+from cwltool.pathmapper import PathMapper
+from cwltool.process import stage_files
+from cwltool.staging import StagingStats, copy_file
+
+
+def _source_tree(tmp_path: Path) -> Path:
+    source = tmp_path / "source"
+    (source / "dir" / "sub").mkdir(parents=True)
+    for i in range(20):
+        (source / "dir" / "sub" / f"{i}.txt").write_text(str(i))
+    (source / "dir" / "sub").chmod(0o555)
+    (source / "input.txt").write_text("input")
+    (source / "input.txt").chmod(0o444)
+    return source
+
+
+def test_stage_files(tmp_path: Path) -> None:
+    """All entry types are staged, nested targets after their parents, with statistics."""
+    source = _source_tree(tmp_path)
+    stage = tmp_path / "stage"
+    pathmapper = PathMapper([], "", str(stage))
+    pathmapper.update("a", str(source / "input.txt"), str(stage / "link.txt"), "File", True)
+    pathmapper.update("b", str(source / "input.txt"), str(stage / "copy.txt"), "WritableFile", True)
+    pathmapper.update("c", str(source / "dir"), str(stage / "dir"), "WritableDirectory", True)
+    pathmapper.update("d", "content", str(stage / "dir" / "new.txt"), "CreateFile", True)
+    pathmapper.update("e", "_:empty", str(stage / "empty"), "WritableDirectory", True)
+
+    stats = stage_files(pathmapper, symlink=True)
+
+    assert os.readlink(stage / "link.txt") == str(source / "input.txt")
+    assert (stage / "copy.txt").read_text() == "input"
+    assert os.stat(stage / "copy.txt").st_mode & stat.S_IWUSR
+    assert sorted(os.listdir(stage / "dir" / "sub")) == sorted(f"{i}.txt" for i in range(20))
+    assert os.stat(stage / "dir" / "sub").st_mode & stat.S_IWUSR
+    assert (stage / "dir" / "new.txt").read_text() == "content"
+    assert pathmapper.mapper("d").resolved == str(stage / "dir" / "new.txt")
+    assert (stage / "empty").is_dir()
+    assert stats.total == 23
+    assert stats.counts["symlink"] == 1
+    assert stats.counts["create"] == 1
+    assert stats.counts["copy"] + stats.counts["reflink"] == 21
+    assert "23 entries" in str(stats)
+
+
+def test_stage_files_read_only_without_symlinks(tmp_path: Path) -> None:
+    """Read-only entries are left to ``stage_func`` when symbolic links are off."""
+    source = _source_tree(tmp_path)
+    stage = tmp_path / "stage"
+    pathmapper = PathMapper([], "", str(stage))
+    pathmapper.update("a", str(source / "input.txt"), str(stage / "input.txt"), "File", True)
+    pathmapper.update("b", str(source / "dir"), str(stage / "dir"), "Directory", True)
+
+    stats = stage_files(pathmapper, symlink=False)
+
+    assert not (stage / "input.txt").exists()
+    assert not (stage / "dir").exists()
+    assert stats.total == 0
+
+    staged: list[tuple[str, str]] = []
+    stage_files(pathmapper, lambda src, dst: staged.append((src, dst)), symlink=False)
+    assert sorted(staged) == [
+        (str(source / "dir"), str(stage / "dir")),
+        (str(source / "input.txt"), str(stage / "input.txt")),
+    ]
+
+
+def test_reflink_errors(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Only the errors of filesystems unable to clone stop trying to clone on them."""
+    if not sys.platform.startswith("linux"):
+        pytest.skip("Cloning is only tried on Linux")
+    source = tmp_path / "source.txt"
+    source.write_text("data")
+    devices = (os.stat(source).st_dev, os.stat(tmp_path).st_dev)
+    monkeypatch.setattr(staging, "_NO_REFLINK", set())
+
+    def failing_ioctl(code: int) -> Callable[..., None]:
+        def ioctl(*args: Any) -> None:
+            raise OSError(code, os.strerror(code))
+
+        return ioctl
+
+    monkeypatch.setattr("fcntl.ioctl", failing_ioctl(errno.ENOSPC))
+    assert not staging._reflink(str(source), str(tmp_path / "copy.txt"))
+    assert devices not in staging._NO_REFLINK
+    monkeypatch.setattr("fcntl.ioctl", failing_ioctl(errno.EOPNOTSUPP))
+    assert not staging._reflink(str(source), str(tmp_path / "copy.txt"))
+    assert devices in staging._NO_REFLINK
+    assert not (tmp_path / "copy.txt").exists()
+
+
+def test_copy_file_fallback(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Files are copied when they can not be cloned."""
+    source = tmp_path / "source.txt"
+    source.write_text("data")
+    source.chmod(0o640)
+    monkeypatch.setattr(staging, "_reflink", lambda src, dst: False)
+    stats = StagingStats()
+    copy_file(str(source), str(tmp_path / "copy.txt"), stats)
+
+    assert (tmp_path / "copy.txt").read_text() == "data"
+    assert stat.S_IMODE(os.stat(tmp_path / "copy.txt").st_mode) == 0o640
+    assert stats.counts["copy"] == 1
+    assert stats.bytes_copied == 4
@@ -1,5 +1,6 @@
 """Test that files marked as 'streamable' when 'streaming_allowed' can be named pipes."""
 
+import json
 import os
 from pathlib import Path
 from typing import cast
@@ -15,7 +16,7 @@ from cwltool.errors import WorkflowException
 from cwltool.job import JobBase
 from cwltool.update import INTERNAL_VERSION, ORIGINAL_CWLVERSION
 
-from .util import get_data
+from .util import get_data, get_main_output
 
 toolpath_object = cast(
     CommentedMap,
@@ -107,3 +108,30 @@ def test_input_can_be_named_pipe(
             job._setup(runtime_context)
     else:
         job._setup(runtime_context)
+
+
+@pytest.mark.parametrize(
+    "extra_args,expected",
+    [
+        ([], "16\n"),
+        (["--enable-streaming"], "pipe\n16\n"),
+        (["--enable-streaming", "--parallel", "--parallel-max", "2"], "pipe\n16\n"),
+        # both jobs cannot run at once on a single core
+        (["--enable-streaming", "--parallel", "--parallel-max", "1"], "16\n"),
+    ],
+)
+def test_streaming_between_steps(tmp_path: Path, extra_args: list[str], expected: str) -> None:
+    """A streamable standard output is piped to its consumer when streaming is enabled."""
+    err_code, stdout, stderr = get_main_output(
+        extra_args
+        + [
+            "--outdir",
+            str(tmp_path),
+            get_data("tests/wf/streaming-pipe.cwl"),
+            "--file",
+            get_data("tests/wf/whale.txt"),
+        ]
+    )
+    assert err_code == 0, stderr
+    assert json.loads(stdout)["lines"]["basename"] == "result.txt"
+    assert (tmp_path / "result.txt").read_text() == expected